@@ -0,0 +1,6 @@
+"""Воспроизводимые бенчмарки scraper и dashboard.
+
+payloads     — генератор синтетических ответов AviationStack
+stub_server  — локальный HTTP-сервер вместо API_URL
+run          — сценарии, результаты в JSON и сравнение с базовыми
+"""
@@ -0,0 +1,152 @@
+"""Синтетические рейсы в формате ответа AviationStack /v1/flights.
+
+Парк задаётся размером и долями рейсов по зонам GEOFENCE_ZONES (плюс
+'outside' — вне всех зон). Генерация детерминирована при одинаковом seed,
+advance() сдвигает рейсы по курсу, имитируя следующий цикл опроса.
+"""
+import copy
+import math
+import random
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import GEOFENCE_CELL_SIZE, GEOFENCE_ZONES
+from scraper.geofence import GeofenceEngine, zone_from_config
+
+OUTSIDE = 'outside'
+MAX_SAMPLE_ATTEMPTS = 1000
+
+AIRCRAFT_TYPES = [
+    ('A319', 'Airbus A319'), ('A320', 'Airbus A320'), ('A321', 'Airbus A321'),
+    ('A20N', 'Airbus A320neo'), ('A21N', 'Airbus A321neo'), ('A332', 'Airbus A330-200'),
+    ('A333', 'Airbus A330-300'), ('A359', 'Airbus A350-900'), ('B737', 'Boeing 737-700'),
+    ('B738', 'Boeing 737-800'), ('B38M', 'Boeing 737 MAX 8'), ('B752', 'Boeing 757-200'),
+    ('B763', 'Boeing 767-300'), ('B77W', 'Boeing 777-300ER'), ('B789', 'Boeing 787-9'),
+    ('E190', 'Embraer 190'), ('E195', 'Embraer 195'), ('CRJ9', 'Bombardier CRJ900'),
+    ('AT76', 'ATR 72-600'), ('DH8D', 'Dash 8-400'), ('SU95', 'Sukhoi Superjet 100'),
+]
+AIRPORTS = ['IST', 'SAW', 'AYT', 'ESB', 'OTP', 'VAR', 'BOJ', 'ODS', 'TBS', 'BUS', 'TZX', 'SOF']
+
+
+def parse_zone_mix(value: str) -> Dict[str, float]:
+    """'black_sea=0.7,outside=0.3' -> {'black_sea': 0.7, 'outside': 0.3}"""
+    mix = {}
+    for part in value.split(','):
+        name, _, share = part.partition('=')
+        mix[name.strip()] = float(share)
+    return mix
+
+
+def default_zone_mix() -> Dict[str, float]:
+    """80% рейсов равномерно по зонам конфигурации, 20% вне зон"""
+    share = 0.8 / len(GEOFENCE_ZONES)
+    mix = {zone['name']: share for zone in GEOFENCE_ZONES}
+    mix[OUTSIDE] = 0.2
+    return mix
+
+
+class PayloadGenerator:
+    def __init__(self, seed: int = 0):
+        self.rng = random.Random(seed)
+        self.zones = {spec['name']: zone_from_config(spec) for spec in GEOFENCE_ZONES}
+        self.geofence = GeofenceEngine(list(self.zones.values()), cell_size=GEOFENCE_CELL_SIZE)
+
+    def _uniform(self, bbox: Tuple[float, float, float, float]) -> Tuple[float, float]:
+        min_lat, min_lon, max_lat, max_lon = bbox
+        if min_lon > max_lon:  # через антимеридиан
+            max_lon += 360
+        lat = self.rng.uniform(min_lat, max_lat)
+        lon = self.rng.uniform(min_lon, max_lon)
+        return lat, (lon + 180) % 360 - 180
+
+    def _zones_of(self, lat: float, lon: float) -> List[str]:
+        row = self.geofence.classify([lat], [lon])[0]
+        return [zone.name for zone, hit in zip(self.zones.values(), row) if hit]
+
+    def _point(self, zone_name: str) -> Tuple[float, float]:
+        """Случайная точка в зоне или, для OUTSIDE, вне всех зон.
+
+        Если подходящая точка не найдена (например, зона покрывает весь
+        мир), возвращается последняя сгенерированная.
+        """
+        if zone_name == OUTSIDE:
+            bbox = (-80.0, -180.0, 80.0, 180.0)
+        else:
+            zone = self.zones[zone_name]
+            if zone.bbox is not None:
+                return self._uniform(zone.bbox)
+            lats = [v[0] for v in zone.polygon]
+            lons = [v[1] for v in zone.polygon]
+            bbox = (min(lats), min(lons), max(lats), max(lons))
+        for _ in range(MAX_SAMPLE_ATTEMPTS):
+            lat, lon = self._uniform(bbox)
+            zones = self._zones_of(lat, lon)
+            if (zone_name == OUTSIDE and not zones) or zone_name in zones:
+                break
+        return lat, lon
+
+    def fleet(
+        self,
+        size: int,
+        zone_mix: Optional[Dict[str, float]] = None,
+        updated: Optional[datetime] = None
+    ) -> List[Dict[str, Any]]:
+        """Список рейсов размера size с распределением по зонам zone_mix"""
+        zone_mix = zone_mix or default_zone_mix()
+        unknown = set(zone_mix) - set(self.zones) - {OUTSIDE}
+        if unknown:
+            raise ValueError(f"Неизвестные зоны: {', '.join(sorted(unknown))}")
+        updated = updated or datetime.now(timezone.utc).replace(microsecond=0)
+        names = list(zone_mix)
+        weights = [zone_mix[name] for name in names]
+        n_airlines = max(1, size // 50)
+        airlines = [(f"Z{i:03d}", f"Synthetic Airline {i}") for i in range(n_airlines)]
+
+        flights = []
+        for i in range(size):
+            airline_icao, airline_name = airlines[i % n_airlines]
+            aircraft_icao, model = self.rng.choice(AIRCRAFT_TYPES)
+            lat, lon = self._point(self.rng.choices(names, weights)[0])
+            departure, arrival = self.rng.sample(AIRPORTS, 2)
+            flights.append({
+                'flight_date': updated.date().isoformat(),
+                'flight_status': 'active',
+                'departure': {'airport': departure},
+                'arrival': {'airport': arrival},
+                'airline': {'name': airline_name, 'icao': airline_icao},
+                'flight': {'number': str(i), 'icao': f"{airline_icao}{i}"},
+                'aircraft': {
+                    'icao': aircraft_icao,
+                    # AviationStack отдаёт модель не всегда
+                    'model': model if self.rng.random() < 0.7 else None
+                },
+                'live': {
+                    'updated': updated.isoformat(),
+                    'latitude': round(lat, 5),
+                    'longitude': round(lon, 5),
+                    'altitude': round(self.rng.uniform(3000, 12000), 1),
+                    'direction': round(self.rng.uniform(0, 360), 1),
+                    'speed_horizontal': round(self.rng.uniform(600, 900), 1),
+                    'is_ground': False
+                }
+            })
+        return flights
+
+    def advance(self, flights: List[Dict[str, Any]], seconds: float) -> List[Dict[str, Any]]:
+        """Копия парка через seconds секунд полёта по курсу с небольшим поворотом"""
+        moved = copy.deepcopy(flights)
+        for flight in moved:
+            live = flight['live']
+            heading = (live['direction'] + self.rng.gauss(0, 3)) % 360
+            distance_km = live['speed_horizontal'] * seconds / 3600
+            lat = live['latitude'] + distance_km / 111.2 * math.cos(math.radians(heading))
+            cos_lat = max(math.cos(math.radians(lat)), 0.01)
+            lon = live['longitude'] + distance_km / (111.2 * cos_lat) * math.sin(math.radians(heading))
+            live['latitude'] = round(max(-89.9, min(89.9, lat)), 5)
+            live['longitude'] = round((lon + 180) % 360 - 180, 5)
+            live['direction'] = round(heading, 1)
+            live['altitude'] = round(max(0.0, live['altitude'] + self.rng.gauss(0, 50)), 1)
+            live['updated'] = (
+                datetime.fromisoformat(live['updated']) + timedelta(seconds=seconds)
+            ).isoformat()
+        return moved
@@ -0,0 +1,334 @@
+"""Запуск сценариев бенчмарка и сравнение с базовыми результатами.
+
+    python -m bench.run --flights 2000 --output bench-results.json
+    python -m bench.run --baseline bench/baseline.json --threshold 0.15
+    python -m bench.run --save-baseline bench/baseline.json
+
+Сценарии fetch_flights и filter_flights работают без внешних сервисов
+(API заменяет bench.stub_server). save_flights, fetch_data и update_map
+пишут синтетические рейсы в Postgres из DB_CONFIG и читают их; хост
+задаётся переменной окружения DB_HOST. Используйте отдельную базу: данные
+бенчмарка в ней остаются. Без доступной БД эти сценарии пропускаются.
+
+Сравнение идёт по медиане времени сценария; замедление больше threshold
+считается регрессией, и команда завершается с кодом 1.
+Сценарий map_ticks проверяет без БД, что тики карты с упрощением треков
+отправляются Patch; полная пересборка на тике тоже даёт код 1.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+from bench.payloads import PayloadGenerator, default_zone_mix, parse_zone_mix
+from bench.stub_server import StubAviationStack
+
+logger = logging.getLogger(__name__)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CYCLE_SECONDS = 60  # сдвиг парка между повторами, как интервал опроса
+
+
+class Skip(Exception):
+    """Сценарий невозможен в текущем окружении"""
+
+
+def measure(fn: Callable[[int], Optional[Dict[str, Any]]], repeat: int, warmup: int = 1) -> Dict[str, Any]:
+    """Времена повторов fn(i) и сводка; fn может вернуть доп. показатели"""
+    for i in range(warmup):
+        fn(-1 - i)
+    samples = []
+    extra: Dict[str, Any] = {}
+    for i in range(repeat):
+        start = time.perf_counter()
+        result = fn(i)
+        samples.append(time.perf_counter() - start)
+        if result:
+            extra.update(result)
+    ordered = sorted(samples)
+    return {
+        'repeat': repeat,
+        'min': ordered[0],
+        'median': statistics.median(ordered),
+        'mean': statistics.fmean(ordered),
+        'p95': ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))],
+        'max': ordered[-1],
+        'samples': samples,
+        **extra
+    }
+
+
+class Bench:
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.generator = PayloadGenerator(args.seed)
+        self.zone_mix = args.zone_mix or default_zone_mix()
+        self.flights = self.generator.fleet(args.flights, self.zone_mix)
+        # Парк для каждого повтора сдвинут на цикл опроса: сжатие треков и
+        # инкрементальная отрисовка видят реалистичное движение
+        self.cycles = [self.flights]
+        for _ in range(args.repeat + 1):
+            self.cycles.append(self.generator.advance(self.cycles[-1], CYCLE_SECONDS))
+        self._db_error: Optional[str] = None
+
+    def cycle(self, i: int) -> List[Dict[str, Any]]:
+        return self.cycles[i % len(self.cycles)]
+
+    def tracker(self, api_url: str = 'http://127.0.0.1:9/v1/flights'):
+        from scraper.main import FlightTracker
+        return FlightTracker(api_url=api_url)
+
+    def fetch_flights(self) -> Dict[str, Any]:
+        with StubAviationStack(self.flights, latency=self.args.latency) as server:
+            tracker = self.tracker(server.url)
+
+            def run(i):
+                server.set_flights(self.cycle(i))
+                before = server.requests
+                flights = tracker.fetch_flights()
+                return {'flights': len(flights), 'requests': server.requests - before}
+            return measure(run, self.args.repeat)
+
+    def filter_flights(self) -> Dict[str, Any]:
+        tracker = self.tracker()
+        return measure(
+            lambda i: {'flights': len(self.cycle(i)), 'kept': len(tracker.filter_flights(self.cycle(i)))},
+            self.args.repeat
+        )
+
+    def _require_db(self) -> None:
+        if self._db_error is None:
+            from scraper.database import get_db_connection
+            try:
+                with get_db_connection() as conn:
+                    with conn.cursor() as cursor:
+                        cursor.execute("SELECT 1")
+                self._db_error = ''
+            except Exception as e:
+                self._db_error = f"БД недоступна: {str(e).strip()}"
+        if self._db_error:
+            raise Skip(self._db_error)
+
+    def save_flights(self) -> Dict[str, Any]:
+        self._require_db()
+        tracker = self.tracker()
+        filtered = [tracker.filter_flights(cycle) for cycle in self.cycles]
+
+        def run(i):
+            tracker.save_flights(filtered[i % len(filtered)])
+            return {'flights': len(filtered[i % len(filtered)])}
+        return measure(run, self.args.repeat)
+
+    def _dashboard(self, require_db: bool = True):
+        if require_db:
+            self._require_db()
+        dashboard = os.path.join(ROOT, 'dashboard')
+        if dashboard not in sys.path:
+            sys.path.insert(0, dashboard)
+        import app
+        import cache
+        return app, cache
+
+    def fetch_data(self) -> Dict[str, Any]:
+        app, cache = self._dashboard()
+        saved = app.positions_cache
+        try:
+            def cold(i):
+                app.positions_cache = cache.PositionsCache()
+                return {'rows': len(app.fetch_data())}
+            result = measure(cold, self.args.repeat)
+
+            # Каждое обращение дочитывает новые строки, как тик Interval
+            app.positions_cache = cache.PositionsCache(refresh_interval=0)
+            incremental = measure(lambda i: {'rows': len(app.fetch_data())}, self.args.repeat)
+            result['incremental'] = {k: incremental[k] for k in ('min', 'median', 'mean', 'p95', 'max')}
+            return result
+        finally:
+            app.positions_cache = saved
+
+    def update_map(self) -> Dict[str, Any]:
+        app, cache = self._dashboard()
+        saved = app.positions_cache
+        try:
+            app.positions_cache = cache.PositionsCache(refresh_interval=0)
+            # Полная фигура для новой сессии
+            def full(i):
+                app.update_map(i, None, None)
+            result = measure(full, self.args.repeat)
+
+            state = {'value': None}
+
+            def tick(i):
+                figure, render_state = app.update_map(i, None, state['value'])
+                if render_state is not app.no_update:
+                    state['value'] = render_state
+            incremental = measure(tick, self.args.repeat)
+            result['incremental'] = {k: incremental[k] for k in ('min', 'median', 'mean', 'p95', 'max')}
+            return result
+        finally:
+            app.positions_cache = saved
+
+    def _positions(self, ticks: int, window: int):
+        """Окна позиций парка по тикам (как PositionsCache, новые сверху) и
+        текущие позиции рейсов (как LiveClient, по строке на рейс)"""
+        import pandas as pd
+        rows = []
+        frames = []
+        lives = []
+        for tick in range(ticks):
+            for flight in self.cycle(tick):
+                live = flight['live']
+                rows.append((
+                    len(rows) + 1,
+                    flight['flight']['icao'],
+                    flight['aircraft']['icao'],
+                    live['latitude'],
+                    live['longitude'],
+                    pd.Timestamp(live['updated']).tz_localize(None)
+                ))
+            recent = rows[-window * len(self.flights):]
+            frame = pd.DataFrame(recent, columns=['id', 'icao', 'model', 'latitude', 'longitude', 'timestamp'])
+            frames.append(frame.iloc[::-1].reset_index(drop=True))
+            lives.append(frame.tail(len(self.flights)).iloc[::-1].reset_index(drop=True))
+        return frames, lives
+
+    def map_ticks(self) -> Dict[str, Any]:
+        """Тики карты без БД: треки с упрощением и текущие позиции должны отправляться Patch"""
+        app, _ = self._dashboard(require_db=False)
+        from dash import Patch
+        from render import MapRenderer
+        from tracks import TrackSimplifier
+
+        frames, lives = self._positions(len(self.cycles), window=3)
+        renderer = MapRenderer(full_rebuild_every=len(frames) + 1)
+        simplifier = TrackSimplifier()
+        state = {'value': None, 'patches': 0, 'full': 0}
+
+        def tick(i):
+            df = simplifier.simplify(frames[i], 5)
+            figure, render_state = renderer.render(df, state['value'], 0, lives[i])
+            if render_state is not app.no_update:
+                state['value'] = render_state
+            if isinstance(figure, Patch):
+                state['patches'] += 1
+            elif figure is not app.no_update:
+                state['full'] += 1
+            return {'points': len(df)}
+
+        tick(0)
+        result = measure(lambda i: tick(i + 1), len(frames) - 1, warmup=0)
+        result['patches'] = state['patches']
+        # Первый тик — полная фигура новой сессии, остальные должны быть Patch
+        result['full_rebuilds'] = state['full'] - 1
+        return result
+
+
+SCENARIOS = ['fetch_flights', 'filter_flights', 'save_flights', 'fetch_data', 'update_map', 'map_ticks']
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> Dict[str, Any]:
+    """Отношение медиан к базовым по сценариям, общим для обоих прогонов"""
+    comparison = {}
+    for name, current in results['scenarios'].items():
+        base = baseline.get('scenarios', {}).get(name)
+        if not base or 'median' not in current or 'median' not in base:
+            continue
+        ratio = current['median'] / base['median'] if base['median'] > 0 else float('inf')
+        comparison[name] = {
+            'baseline_median': base['median'],
+            'median': current['median'],
+            'ratio': ratio,
+            'regression': ratio > 1 + threshold
+        }
+    return comparison
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Бенчмарки scraper и dashboard")
+    parser.add_argument('--flights', type=int, default=1000, help="размер синтетического парка")
+    parser.add_argument('--zone-mix', type=parse_zone_mix, help="доли зон, например black_sea=0.7,outside=0.3")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=5, help="повторов каждого сценария")
+    parser.add_argument('--latency', type=float, default=0.0, help="задержка ответа заглушки API, сек")
+    parser.add_argument('--scenario', action='append', choices=SCENARIOS, help="только указанные сценарии")
+    parser.add_argument('--output', help="файл для результатов JSON (по умолчанию stdout)")
+    parser.add_argument('--baseline', help="JSON прошлого прогона для сравнения")
+    parser.add_argument('--threshold', type=float, default=0.1, help="допустимое замедление медианы, доля")
+    parser.add_argument('--save-baseline', help="сохранить результаты как базовые")
+    args = parser.parse_args(argv)
+
+    bench = Bench(args)
+    results = {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'flights': args.flights,
+            'zone_mix': bench.zone_mix,
+            'seed': args.seed,
+            'repeat': args.repeat,
+            'latency': args.latency
+        },
+        'scenarios': {}
+    }
+
+    for name in args.scenario or SCENARIOS:
+        logger.info(f"Сценарий {name}")
+        try:
+            results['scenarios'][name] = getattr(bench, name)()
+        except Skip as e:
+            logger.warning(f"Сценарий {name} пропущен: {e}")
+            results['scenarios'][name] = {'skipped': str(e)}
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            comparison = compare(results, json.load(f), args.threshold)
+        results['comparison'] = comparison
+        for name, row in comparison.items():
+            logger.info(
+                f"{name}: {row['median'] * 1000:.1f} мс против {row['baseline_median'] * 1000:.1f} мс "
+                f"(x{row['ratio']:.2f}){' — РЕГРЕССИЯ' if row['regression'] else ''}"
+            )
+        if any(row['regression'] for row in comparison.values()):
+            exit_code = 1
+    if results['scenarios'].get('map_ticks', {}).get('full_rebuilds'):
+        logger.error("Тики карты пересобирают фигуру целиком вместо Patch")
+        exit_code = 1
+
+    text = json.dumps(results, indent=2, ensure_ascii=False, default=str)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    else:
+        print(text)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            f.write(text)
+    return exit_code
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s [%(levelname)s] %(module)s:%(lineno)d - %(message)s'
+    )
+    sys.exit(main())
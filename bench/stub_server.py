@@ -0,0 +1,125 @@
+"""Локальная замена AviationStack для бенчмарков.
+
+Отдаёт текущий синтетический парк постранично по offset/limit в формате
+/v1/flights. Запускается внутри бенчмарка или отдельно, чтобы направить на
+него scraper через переменную окружения API_URL:
+
+    python -m bench.stub_server --flights 5000 --port 8081
+    API_URL=http://localhost:8081/v1/flights python -m scraper.main
+"""
+import argparse
+import json
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+from bench.payloads import PayloadGenerator, default_zone_mix, parse_zone_mix
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 100  # как у AviationStack
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: 'StubAviationStack'
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        try:
+            limit = min(int(query.get('limit', [DEFAULT_LIMIT])[0]), MAX_LIMIT)
+            offset = int(query.get('offset', [0])[0])
+        except ValueError:
+            self._send(400, {'error': {'code': 'invalid_parameters'}})
+            return
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        flights = self.server.flights
+        page = flights[offset:offset + limit]
+        with self.server.lock:
+            self.server.requests += 1
+        self._send(200, {
+            'pagination': {'limit': limit, 'offset': offset, 'count': len(page), 'total': len(flights)},
+            'data': page
+        })
+
+    def _send(self, status: int, body: Dict[str, Any]) -> None:
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+class StubAviationStack(ThreadingHTTPServer):
+    """HTTP-сервер с подменяемым парком; порт 0 — любой свободный"""
+
+    daemon_threads = True
+
+    def __init__(self, flights: List[Dict[str, Any]], host: str = '127.0.0.1',
+                 port: int = 0, latency: float = 0.0):
+        super().__init__((host, port), _Handler)
+        self.flights = flights
+        self.latency = latency
+        self.requests = 0
+        self.lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1/flights"
+
+    def set_flights(self, flights: List[Dict[str, Any]]) -> None:
+        self.flights = flights
+
+    def __enter__(self) -> 'StubAviationStack':
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Заглушка AviationStack /v1/flights")
+    parser.add_argument('--flights', type=int, default=1000, help="размер парка")
+    parser.add_argument('--zone-mix', type=parse_zone_mix, help="доли зон, например black_sea=0.7,outside=0.3")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency', type=float, default=0.0, help="задержка ответа, сек")
+    parser.add_argument('--advance', type=float, default=60.0,
+                        help="раз во сколько секунд парк сдвигается по курсу (0 — неподвижен)")
+    args = parser.parse_args()
+
+    generator = PayloadGenerator(args.seed)
+    flights = generator.fleet(args.flights, args.zone_mix or default_zone_mix())
+    with StubAviationStack(flights, args.host, args.port, args.latency) as server:
+        logger.info(f"Заглушка API на {server.url}: {len(flights)} рейсов")
+        try:
+            while True:
+                if args.advance > 0:
+                    time.sleep(args.advance)
+                    server.set_flights(generator.advance(server.flights, args.advance))
+                else:
+                    time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s [%(levelname)s] %(module)s:%(lineno)d - %(message)s'
+    )
+    main()
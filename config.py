@@ -2,11 +2,19 @@ import os
 
 # Конфигурация API
 API_KEY = os.getenv("API_KEY")  # Берем из переменных окружения
-API_URL = "http://api.aviationstack.com/v1/flights"
+API_URL = os.getenv("API_URL", "http://api.aviationstack.com/v1/flights")  # переопределяется для локального стаба
 
 # BLACK_SEA_BBOX = (41.0, 27.5, 44.5, 41.5) 
 BLACK_SEA_BBOX = (-90, -180, 90, 180)  # Весь мир
 
+# Зоны интереса: bbox (min_lat, min_lon, max_lat, max_lon) или polygon [(lat, lon), ...].
+# bbox с min_lon > max_lon пересекает антимеридиан
+# priority > 1 ускоряет опросы, пока в зоне есть трафик
+GEOFENCE_ZONES = [
+    {'name': 'black_sea', 'bbox': BLACK_SEA_BBOX, 'priority': 1.0},
+]
+GEOFENCE_CELL_SIZE = 1.0  # размер ячейки грубой сетки для многоугольников, градусов
+
 RETRY_CONFIG = {
     'api': {
         'max_retries': 5,
@@ -22,8 +30,7 @@ DB_CONFIG = {
     "dbname": "aviation",
     "user": "postgres",
     "password": "postgres",
-    # "host": os.getenv("DB_HOST", "db"),
-     "host": "db",
+    "host": os.getenv("DB_HOST", "db"),  # localhost для бенчмарков вне docker
     "port": "5432"
 }
 
@@ -56,4 +63,172 @@ RETRY_CONFIG = {
         'max_retries': 3,
         'initial_delay': 1
     }
-}
\ No newline at end of file
+}
+
+# Пул соединений с БД (общий для scraper и dashboard)
+DB_POOL_CONFIG = {
+    'min_size': 1,
+    'max_size': 10,
+    'acquire_timeout': 10,        # сек ожидания свободного соединения
+    'health_check_interval': 30,  # сек простоя, после которых соединение проверяется SELECT 1
+    'max_lifetime': 1800          # сек, после которых соединение пересоздаётся
+}
+
+# Потоковое чтение и пакетная запись больших объёмов (scraper/database.py)
+DB_STREAM_CONFIG = {
+    'fetch_size': 10000,  # строк за один FETCH серверного курсора
+    'page_size': 1000     # строк в одном INSERT ... VALUES
+}
+
+
+# Получение рейсов из API
+FETCH_CONFIG = {
+    'paginated': True,              # забирать все страницы, а не только первую
+    'page_size': 100,               # limit одной страницы AviationStack
+    'max_workers': 4,               # параллельных запросов страниц
+    'requests_per_second': 5,       # ограничение частоты запросов
+    'burst': 4,
+    'max_requests_per_cycle': 20,   # бюджет запросов на один цикл опроса
+    'timeout': 15
+}
+
+# Адаптивный планировщик опросов
+SCHEDULER_CONFIG = {
+    'min_interval': 60,           # сек, при максимальной активности
+    'max_interval': 1800,         # сек, когда в зонах пусто
+    'density_reference': 200,     # рейсов в зонах, при которых плотность считается полной
+    'density_weight': 0.5,
+    'change_weight': 0.5,
+    'change_threshold_km': 2.0,   # смещение, после которого позиция считается изменившейся
+    'failure_base_delay': 30,     # сек, первая задержка после ошибки
+    'failure_max_delay': 900,
+    'monthly_quota': int(os.getenv("API_MONTHLY_QUOTA", "10000")) or None,  # 0 — без учёта квоты
+    # Файл с числом запросов за текущий месяц, чтобы перезапуск не обнулял
+    # расход квоты (каталог журнала пакетов лежит на томе); пусто — только в памяти
+    'state_path': os.getenv("SCHEDULER_STATE_PATH", "spool/scheduler.json") or None
+}
+
+# Кэш позиций в dashboard
+DASHBOARD_CACHE_CONFIG = {
+    'refresh_interval': 5,    # сек, не чаще одного дочитывания на окно
+    'overlap_seconds': 60,    # перекрытие дочитывания для поздно зафиксированных транзакций
+    'idle_ttl': 600,          # сек без обращений, после которых окно вытесняется
+    'max_entries': 32,        # окон запроса (период и видимая область) в кэше
+    'max_rows': 1000          # строк на окно (как прежний LIMIT 1000)
+}
+
+# Отрисовка карты в dashboard
+DASHBOARD_RENDER_CONFIG = {
+    'incremental': True,        # на тиках отправлять Patch с изменениями вместо всей фигуры
+    'full_rebuild_every': 60,   # тиков между полными пересборками фигуры
+    'max_sessions': 256         # сессий браузера, для которых хранится отрисованное состояние
+}
+
+# Секционирование и срок хранения flight_positions
+RETENTION_CONFIG = {
+    'partition_days_ahead': 3,      # суточных секций создаётся наперёд
+    'retention_days': 30,           # секции старше удаляются целиком
+    'maintenance_interval': 3600    # сек между запусками обслуживания
+}
+
+# Кэш справочников airlines/aircrafts в scraper
+DIMENSION_CACHE_CONFIG = {
+    'max_size': 50000   # записей на справочник; 0 отключает кэш
+}
+
+# Сжатие треков при приёме
+TRACK_COMPRESSION_CONFIG = {
+    'enabled': True,
+    'distance_tolerance_m': 500,    # допустимое отклонение восстановленного трека
+    'altitude_tolerance': 100,      # в единицах altitude из API
+    'heading_tolerance_deg': 15,
+    'max_gap_seconds': 600,         # позиция рейса сохраняется не реже
+    'max_buffer': 50                # отложенных точек на рейс
+}
+
+# Упрощение треков на карте по масштабу
+DASHBOARD_TRACKS_CONFIG = {
+    'enabled': True,
+    'zoom_bands': [0, 4, 6, 8, 10, 12],   # нижние границы полос масштаба
+    'pixel_tolerance': 2                  # допуск Дугласа-Пекера в пикселях карты
+}
+
+# Запросы dashboard по видимой области карты
+DASHBOARD_VIEWPORT_CONFIG = {
+    'margin': 0.25,     # запас вокруг видимой области, доля размера
+    'min_step': 0.25    # минимальный шаг выравнивания границ, градусов
+}
+
+# Почасовая статистика парка на дашборде (таблица flight_counts_hourly)
+DASHBOARD_STATS_CONFIG = {
+    'hours': 24,             # глубина графика, часов
+    'refresh_interval': 60,  # период обновления графика, секунд
+    'top_models': 10         # остальные модели объединяются в «Другие»
+}
+
+# Метрики в формате Prometheus и профилирование
+METRICS_CONFIG = {
+    'enabled': os.getenv("METRICS_ENABLED", "1") != "0",
+    'host': '0.0.0.0',
+    'port': int(os.getenv("METRICS_PORT", "9100")),   # scraper; dashboard отдаёт /metrics на своём порту
+    'slow_cycle_seconds': 30,     # цикл дольше логируется с разбивкой по этапам
+    'profiler_interval': float(os.getenv("PROFILER_INTERVAL", "0"))  # сек между сэмплами; 0 — выключен
+}
+
+# Фоновая запись в БД через журнал на диске
+INGEST_CONFIG = {
+    'async': True,                  # False — запись в потоке опроса, как раньше
+    'spool_path': os.getenv("SPOOL_PATH", "spool"),
+    'segment_bytes': 16 * 1024 * 1024,
+    'fsync': True,                  # сбрасывать каждый пакет на диск
+    'queue_max_batches': 8,         # пакетов в очереди в памяти; остальные читаются с диска
+    'max_batch_records': 5000,      # записей на одну транзакцию писателя
+    'retry_base_delay': 1,          # сек, первая задержка при недоступной БД
+    'retry_max_delay': 60,
+    'shutdown_timeout': 30          # сек ожидания писателя при остановке
+}
+
+# Колоночный архив всех наблюдений (Parquet) для исторических выборок;
+# Postgres хранит горячее окно (RETENTION_CONFIG)
+ARCHIVE_CONFIG = {
+    'enabled': os.getenv("ARCHIVE_ENABLED", "1") != "0",
+    'path': os.getenv("ARCHIVE_PATH", "archive"),
+    'compression': 'zstd',
+    'row_group_size': 65536,        # строк в группе; по статистике групп отсекается лишнее при чтении
+    'flush_rows': 200000,           # сбросить буфер в файл при таком числе наблюдений
+    'flush_seconds': 900            # ... или не реже, чем раз в столько секунд (и при смене часа)
+}
+
+# Текущее состояние рейсов в памяти scraper, отдаётся dashboard по HTTP
+LIVE_STATE_CONFIG = {
+    'enabled': os.getenv("LIVE_STATE_ENABLED", "1") != "0",
+    'host': '0.0.0.0',
+    'port': int(os.getenv("LIVE_STATE_PORT", "9101")),
+    'ttl': 1800,                  # сек без новых позиций, после которых рейс снимается
+    'history_versions': 120       # версий, с которых возможна дельта; со старших — полный снимок
+}
+
+# Чтение текущего состояния в dashboard; при недоступности scraper — позиции из БД
+DASHBOARD_LIVE_CONFIG = {
+    'enabled': os.getenv("DASHBOARD_LIVE", "1") != "0",
+    'url': os.getenv("LIVE_STATE_URL", "http://scraper:9101/live"),
+    'refresh_interval': 2,        # сек между запросами изменений
+    'timeout': 2                  # сек ожидания ответа scraper
+}
+
+# Воспроизведение истории на dashboard: кадры через равные интервалы с
+# интерполированными позициями рейсов, считаются один раз на период
+DASHBOARD_PLAYBACK_CONFIG = {
+    'step_seconds': 60,         # интервал между кадрами по умолчанию
+    'max_range_hours': 24,      # самый длинный период воспроизведения
+    'max_gap_seconds': 900,     # между позициями дальше друг от друга не интерполируем (больше сжатия треков)
+    'hold_seconds': 120,        # сек после позиции, пока рейс без следующей точки остаётся на месте
+    'chunk_frames': 120,        # кадров в одной порции для клиента
+    'prefetch_frames': 30,      # следующая порция запрашивается за столько кадров до конца текущей
+    'frame_interval_ms': 500,   # период смены кадров при проигрывании
+    'max_entries': 4,           # периодов в кэше кадров
+    'max_bytes': 192 * 1024 * 1024,  # суммарный объём кадров в кэше
+    'max_points': 4000000,      # точек кадров в одном периоде (12 байт каждая); больше — отказ
+    'max_rows': 2000000,        # позиций из БД на период (LIMIT запроса); больше — отказ до интерполяции
+    'idle_ttl': 1800            # сек без обращений, после которых период вытесняется
+}
@@ -1,43 +1,48 @@
 import dash
-from dash import dcc, html
-from dash.dependencies import Input, Output
-import plotly.graph_objects as go
+from dash import dcc, html, no_update
+from dash.dependencies import Input, Output, State
+from flask import Response, request
+from datetime import datetime, timedelta
 import pandas as pd
-from sqlalchemy import create_engine
-import plotly.express as px
+
+from cache import positions_cache
+from config import (
+    DASHBOARD_LIVE_CONFIG, DASHBOARD_PLAYBACK_CONFIG, DASHBOARD_STATS_CONFIG, DASHBOARD_TRACKS_CONFIG,
+    METRICS_CONFIG
+)
+from db import warm_pool
+from live import live_client
+from metrics import CONTENT_TYPE, REGISTRY, profile_text, stage, start_profiler
+from playback import PlaybackTooLarge, playback_cache
+from render import renderer
+from stats import build_stats_figure, fetch_hourly_stats
+from tracks import track_simplifier, zoom_band, zoom_from_relayout
+from viewport import viewport_from_relayout
 
 app = dash.Dash(__name__)
 
-def fetch_data():
+def fetch_data(bounds=None):
     try:
-        engine = create_engine('postgresql://postgres:postgres@db:5432/aviation')
-        
-        query = """
-        SELECT 
-            f.flight_icao as icao,
-            COALESCE(NULLIF(a.model_name, ''), 'Unknown Model') as model,
-            fp.latitude,
-            fp.longitude,
-            fp.timestamp
-        FROM flight_positions fp
-        JOIN flights f ON fp.flight_id = f.id
-        LEFT JOIN aircrafts a 
-            ON UPPER(TRIM(f.aircraft_icao)) = UPPER(TRIM(a.icao_code))
-        WHERE 
-            fp.timestamp >= NOW() - INTERVAL '1 hour'
-            AND fp.latitude BETWEEN -90 AND 90
-            AND fp.longitude BETWEEN -180 AND 180
-        ORDER BY fp.timestamp DESC
-        LIMIT 1000
-        """
-        
-        df = pd.read_sql(query, engine)
-        return df
+        with stage('fetch_data'):
+            # Позиции за последний час в видимой области из общего кэша: в БД
+            # уходит только дочитывание новых строк, и одно на все сессии
+            return positions_cache.get('1 hour', bounds)
     
     except Exception as e:
         print(f"Database error: {str(e)}")
         return pd.DataFrame()
 
+def fetch_live(bounds=None):
+    """Текущие позиции рейсов из памяти scraper поверх треков; None — недоступны"""
+    if not DASHBOARD_LIVE_CONFIG['enabled']:
+        return None
+    try:
+        with stage('fetch_live'):
+            return live_client.get(bounds)
+    except Exception as e:
+        print(f"Live state unavailable: {str(e)}")
+        return None
+
 app.layout = html.Div([
     dcc.Graph(
         id='live-map',
@@ -48,70 +53,250 @@ app.layout = html.Div([
         id='interval',
         interval=10*1000,
         n_intervals=0
-    )
+    ),
+    # Идентификатор сессии и версия отрисованной фигуры для инкрементальных обновлений
+    dcc.Store(id='render-state'),
+    dcc.Graph(
+        id='fleet-stats',
+        config={'displayModeBar': False},
+        style={'height': '40vh', 'width': '100%'}
+    ),
+    dcc.Interval(
+        id='stats-interval',
+        interval=DASHBOARD_STATS_CONFIG['refresh_interval']*1000,
+        n_intervals=0
+    ),
+    # Воспроизведение истории в видимой области основной карты
+    html.Div([
+        dcc.Input(id='playback-start', type='datetime-local', placeholder='Начало (UTC)'),
+        dcc.Input(id='playback-end', type='datetime-local', placeholder='Конец (UTC)'),
+        dcc.Dropdown(
+            id='playback-step',
+            options=[{'label': f'{s} с', 'value': s} for s in (15, 30, 60, 120, 300)],
+            value=DASHBOARD_PLAYBACK_CONFIG['step_seconds'],
+            clearable=False,
+            style={'width': '100px'}
+        ),
+        html.Button('Загрузить', id='playback-load'),
+        html.Button('▶', id='playback-play'),
+        html.Span(id='playback-status')
+    ], style={'display': 'flex', 'gap': '8px', 'alignItems': 'center'}),
+    dcc.Slider(id='playback-slider', min=0, max=0, step=1, value=0, marks=None, updatemode='drag'),
+    dcc.Graph(
+        id='playback-map',
+        config={'displayModeBar': False},
+        style={'height': '70vh', 'width': '100%'}
+    ),
+    dcc.Interval(
+        id='playback-interval',
+        interval=DASHBOARD_PLAYBACK_CONFIG['frame_interval_ms'],
+        disabled=True
+    ),
+    # Справочники периода и текущая порция кадров; кадры рисуются в браузере
+    dcc.Store(id='playback-meta'),
+    dcc.Store(id='playback-chunk')
 ])
 
 @app.callback(
     Output('live-map', 'figure'),
-    Input('interval', 'n_intervals')
+    Output('render-state', 'data'),
+    Input('interval', 'n_intervals'),
+    Input('live-map', 'relayoutData'),
+    State('render-state', 'data')
 )
-def update_map(n):
-    df = fetch_data()
-    fig = go.Figure()
-    
-    if not df.empty:
-        df['model'] = df['model'].fillna('Unknown Model')
-        models = df['model'].unique()
-        colors = px.colors.qualitative.Dark24
-        
-        for i, model in enumerate(models):
-            model_df = df[df['model'] == model]
-            
-            fig.add_trace(
-                go.Scattermap(
-                    lat=model_df['latitude'],
-                    lon=model_df['longitude'],
-                    mode='markers+lines',
-                    marker=dict(
-                        size=12,
-                        color=colors[i],
-                        symbol='airport'
-                    ),
-                    line=dict(width=2, color=colors[i]),
-                    name=model,
-                    hoverinfo='text+name',
-                    text=model_df['icao'],
-                    legendgroup=model
-                )
-            )
+def update_map(n, relayout_data, render_state):
+    bounds = viewport_from_relayout(relayout_data)
+    if bounds is None and not (relayout_data or {}).get('map._derived'):
+        # Последнее событие не про видимую область: берём запомненную
+        bounds = tuple(render_state['bounds']) if (render_state or {}).get('bounds') else None
+    df = fetch_data(bounds)
+    live = fetch_live(bounds)
+    lod = None
+    if DASHBOARD_TRACKS_CONFIG['enabled']:
+        # Уровень детализации треков по текущему масштабу карты
+        zoom = zoom_from_relayout(relayout_data, (render_state or {}).get('zoom', 5))
+        lod = zoom_band(zoom)
+        with stage('simplify'):
+            df = track_simplifier.simplify(df, zoom, bounds)
+    with stage('render'):
+        figure, render_state = renderer.render(df, render_state, lod, live)
+    if render_state is not no_update:
+        render_state['bounds'] = bounds
+        if lod is not None:
+            render_state['zoom'] = zoom
+    return figure, render_state
 
-        lat_center = df['latitude'].median()
-        lon_center = df['longitude'].median()
-        zoom = 5
-    else:
-        lat_center = 44.5
-        lon_center = 34.5
-        zoom = 3
-
-    fig.update_layout(
-        mapbox=dict(
-            style="open-street-map",
-            center=dict(lat=lat_center, lon=lon_center),
-            zoom=zoom
-        ),
-        margin={"r":0,"t":40,"l":0,"b":0},
-        legend=dict(
-            title='<b>Модели самолетов</b>',
-            orientation='v',
-            yanchor='top',
-            xanchor='left',
-            x=0.01,
-            y=0.99,
-            bgcolor='rgba(255,255,255,0.9)'
+@app.callback(
+    Output('fleet-stats', 'figure'),
+    Input('stats-interval', 'n_intervals')
+)
+def update_stats(n):
+    try:
+        with stage('fleet_stats'):
+            return build_stats_figure(fetch_hourly_stats())
+    except Exception as e:
+        print(f"Database error: {str(e)}")
+        return no_update
+
+def _playback_marks(start, step, count):
+    """Подписи шкалы: начала часов, не больше 13 штук"""
+    hours = max(1, int(count * step / 3600 / 12) + 1)
+    marks = {}
+    for k in range(count):
+        moment = start + timedelta(seconds=k * step)
+        if moment.minute == 0 and moment.second == 0 and moment.hour % hours == 0:
+            marks[k] = moment.strftime('%H:%M')
+    return marks
+
+@app.callback(
+    Output('playback-meta', 'data'),
+    Output('playback-slider', 'max'),
+    Output('playback-slider', 'marks'),
+    Output('playback-slider', 'value'),
+    Output('playback-status', 'children'),
+    Input('playback-load', 'n_clicks'),
+    State('playback-start', 'value'),
+    State('playback-end', 'value'),
+    State('playback-step', 'value'),
+    State('render-state', 'data'),
+    prevent_initial_call=True
+)
+def load_playback(n, start, end, step, render_state):
+    try:
+        since = datetime.fromisoformat(start)
+        until = datetime.fromisoformat(end)
+    except (TypeError, ValueError):
+        return no_update, no_update, no_update, no_update, 'Укажите начало и конец периода'
+    if until <= since:
+        return no_update, no_update, no_update, no_update, 'Конец периода раньше начала'
+    if until - since > timedelta(hours=DASHBOARD_PLAYBACK_CONFIG['max_range_hours']):
+        return no_update, no_update, no_update, no_update, (
+            f"Период не длиннее {DASHBOARD_PLAYBACK_CONFIG['max_range_hours']} ч"
         )
-    )
-    
-    return fig
+    bounds = tuple(render_state['bounds']) if (render_state or {}).get('bounds') else None
+    try:
+        with stage('playback'):
+            playback = playback_cache.get(since, until, step, bounds)
+    except PlaybackTooLarge:
+        return no_update, no_update, no_update, no_update, (
+            'Слишком много позиций: сократите период, увеличьте шаг или приблизьте карту'
+        )
+    except Exception as e:
+        print(f"Database error: {str(e)}")
+        return no_update, no_update, no_update, no_update, 'Ошибка загрузки истории'
+    meta = playback.meta()
+    # По параметрам периода порции берутся из кэша или период собирается заново
+    meta['period'] = {'since': start, 'until': end, 'step': step, 'bounds': bounds}
+    meta['key'] = f"{start}|{end}|{step}|{bounds}"
+    status = f"Кадров: {playback.count}, рейсов: {len(playback.icaos)}"
+    return meta, playback.count - 1, _playback_marks(since, step, playback.count), 0, status
+
+@app.callback(
+    Output('playback-chunk', 'data'),
+    Input('playback-slider', 'value'),
+    Input('playback-meta', 'data'),
+    State('playback-chunk', 'data')
+)
+def update_playback_chunk(value, meta, chunk):
+    if not meta or value is None:
+        return no_update
+    cfg = DASHBOARD_PLAYBACK_CONFIG
+    if chunk and chunk.get('key') == meta['key']:
+        end = chunk['first'] + len(chunk['offsets']) - 1
+        # Следующая порция запрашивается заранее, пока проигрывается текущая
+        if chunk['first'] <= value < end and (end >= meta['count'] or value < end - cfg['prefetch_frames']):
+            return no_update
+    period = meta['period']
+    try:
+        with stage('playback_chunk'):
+            playback = playback_cache.get(
+                datetime.fromisoformat(period['since']),
+                datetime.fromisoformat(period['until']),
+                period['step'],
+                tuple(period['bounds']) if period['bounds'] else None
+            )
+            chunk = playback.chunk(value, cfg['chunk_frames'])
+    except Exception as e:
+        print(f"Database error: {str(e)}")
+        return no_update
+    chunk['key'] = meta['key']
+    return chunk
+
+@app.callback(
+    Output('playback-interval', 'disabled'),
+    Output('playback-play', 'children'),
+    Input('playback-play', 'n_clicks'),
+    State('playback-interval', 'disabled'),
+    prevent_initial_call=True
+)
+def toggle_playback(n, disabled):
+    return (False, '⏸') if disabled else (True, '▶')
+
+# Смена кадра и отрисовка идут в браузере: на сервер уходят только запросы порций
+app.clientside_callback(
+    """
+    function(n, value, meta) {
+        if (!meta) { return window.dash_clientside.no_update; }
+        return ((value || 0) + 1) % meta.count;
+    }
+    """,
+    Output('playback-slider', 'value', allow_duplicate=True),
+    Input('playback-interval', 'n_intervals'),
+    State('playback-slider', 'value'),
+    State('playback-meta', 'data'),
+    prevent_initial_call=True
+)
+
+app.clientside_callback(
+    """
+    function(value, chunk, meta) {
+        if (!meta || !chunk || chunk.key !== meta.key || value < chunk.first
+                || value >= chunk.first + chunk.offsets.length - 1) {
+            return window.dash_clientside.no_update;
+        }
+        const k = value - chunk.first;
+        const a = chunk.offsets[k], b = chunk.offsets[k + 1];
+        const flights = chunk.flight.slice(a, b);
+        const moment = new Date(Date.parse(meta.start + 'Z') + value * meta.step * 1000);
+        return {
+            data: [{
+                type: 'scattermap',
+                mode: 'markers',
+                lat: chunk.lat.slice(a, b),
+                lon: chunk.lon.slice(a, b),
+                text: flights.map(f => meta.icao[f] + ' ' + meta.models[meta.model[f]]),
+                hoverinfo: 'text',
+                marker: {size: 10, color: flights.map(f => meta.colors[meta.model[f]])}
+            }],
+            layout: {
+                map: {style: 'open-street-map', center: meta.center, zoom: 5},
+                uirevision: meta.key,
+                title: {text: moment.toISOString().slice(0, 16).replace('T', ' ') + ' UTC'},
+                margin: {r: 0, t: 40, l: 0, b: 0}
+            }
+        };
+    }
+    """,
+    Output('playback-map', 'figure'),
+    Input('playback-slider', 'value'),
+    Input('playback-chunk', 'data'),
+    State('playback-meta', 'data')
+)
+
+@app.server.route('/metrics')
+def metrics():
+    if not METRICS_CONFIG['enabled']:
+        return Response(status=404)
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+@app.server.route('/profile')
+def profile():
+    if not METRICS_CONFIG['enabled']:
+        return Response(status=404)
+    return Response(profile_text(reset='reset' in request.args), content_type=CONTENT_TYPE)
 
 if __name__ == '__main__':
+    if METRICS_CONFIG['enabled']:
+        start_profiler(METRICS_CONFIG['profiler_interval'])
+    warm_pool()
     app.run(host="0.0.0.0", debug=False)
\ No newline at end of file
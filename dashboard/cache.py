@@ -0,0 +1,152 @@
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+from config import DASHBOARD_CACHE_CONFIG
+from db import read_sql
+from viewport import viewport_boxes
+
+COLUMNS = ['id', 'icao', 'model', 'latitude', 'longitude', 'timestamp']
+
+# Точка позиции попадает в один из прямоугольников видимой области;
+# выражение совпадает с GiST-индексом flight_positions_point_gist
+BOX_CONDITION = "point(fp.longitude, fp.latitude) <@ box(point(%({0}w)s, %({0}s)s), point(%({0}e)s, %({0}n)s))"
+
+# Одна строка bounds возвращается всегда, даже без новых позиций: из неё
+# берётся граница окна по часам БД для вытеснения старых строк
+POSITIONS_QUERY = """
+WITH bounds AS (
+    SELECT LOCALTIMESTAMP - %(window)s::interval AS cutoff
+)
+SELECT
+    b.cutoff,
+    p.id,
+    p.icao,
+    p.model,
+    p.latitude,
+    p.longitude,
+    p.timestamp
+FROM bounds b
+LEFT JOIN LATERAL (
+    SELECT
+        fp.id,
+        f.flight_icao as icao,
+        COALESCE(NULLIF(a.model_name, ''), 'Unknown Model') as model,
+        fp.latitude,
+        fp.longitude,
+        fp.timestamp
+    FROM flight_positions fp
+    JOIN flights f ON fp.flight_id = f.id
+    LEFT JOIN aircrafts a ON f.aircraft_icao = a.icao_code
+    WHERE
+        -- Стабильные выражения без ссылок на bounds: по ним планировщик
+        -- отсекает суточные секции flight_positions при старте запроса
+        fp.timestamp >= LOCALTIMESTAMP - %(window)s::interval
+        AND fp.timestamp >= COALESCE(%(since)s, '-infinity'::timestamp)
+        AND ({boxes})
+    ORDER BY fp.timestamp DESC
+    LIMIT %(limit)s
+) p ON TRUE
+"""
+
+
+def positions_query(bounds):
+    """Запрос и параметры прямоугольников для видимой области"""
+    conditions = []
+    params = {}
+    for i, (west, south, east, north) in enumerate(viewport_boxes(bounds)):
+        prefix = f'b{i}_'
+        conditions.append(BOX_CONDITION.format(prefix))
+        params.update({prefix + 'w': west, prefix + 's': south, prefix + 'e': east, prefix + 'n': north})
+    return POSITIONS_QUERY.replace('{boxes}', ' OR '.join(conditions)), params
+
+
+class _WindowEntry:
+    def __init__(self, window, bounds):
+        self.window = window
+        self.query, self.box_params = positions_query(bounds)
+        self.lock = threading.Lock()
+        self.frame = pd.DataFrame(columns=COLUMNS)
+        self.last_timestamp = None
+        self.refreshed_at = 0.0
+        self.accessed_at = time.monotonic()
+
+
+class PositionsCache:
+    """Общий для процесса кэш позиций по окнам запроса.
+
+    Окно определяется периодом и видимой областью карты. Первое
+    обращение к окну загружает его целиком, последующие обновления
+    дочитывают только строки новее последнего увиденного timestamp (с
+    перекрытием на случай поздно зафиксированных транзакций), дедуплицируют
+    их по id и вытесняют строки старше окна. Одновременные сессии ждут одно
+    обновление вместо параллельных одинаковых запросов.
+    """
+
+    def __init__(self, refresh_interval=None, overlap_seconds=None, idle_ttl=None,
+                 max_entries=None, max_rows=None):
+        cfg = DASHBOARD_CACHE_CONFIG
+        self.refresh_interval = cfg['refresh_interval'] if refresh_interval is None else refresh_interval
+        self.overlap = pd.Timedelta(seconds=cfg['overlap_seconds'] if overlap_seconds is None else overlap_seconds)
+        self.idle_ttl = cfg['idle_ttl'] if idle_ttl is None else idle_ttl
+        self.max_entries = cfg['max_entries'] if max_entries is None else max_entries
+        self.max_rows = cfg['max_rows'] if max_rows is None else max_rows
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _entry(self, window, bounds):
+        key = (window, bounds)
+        now = time.monotonic()
+        with self._lock:
+            for idle in [k for k, e in self._entries.items() if now - e.accessed_at > self.idle_ttl]:
+                del self._entries[idle]
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _WindowEntry(window, bounds)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            self._entries.move_to_end(key)
+            entry.accessed_at = now
+            return entry
+
+    def _refresh(self, entry):
+        since = entry.last_timestamp - self.overlap if entry.last_timestamp is not None else None
+        rows = read_sql(entry.query, params={
+            'window': entry.window,
+            'since': since.to_pydatetime() if since is not None else None,
+            'limit': self.max_rows,
+            **entry.box_params
+        })
+        cutoff = rows['cutoff'].iloc[0]
+        rows = rows.drop(columns='cutoff').dropna(subset=['id'])
+
+        frame = entry.frame
+        if not rows.empty:
+            rows = rows.astype({'id': 'int64'})
+            frame = rows if frame.empty else pd.concat([frame, rows], ignore_index=True)
+            frame = frame.drop_duplicates(subset='id', keep='last')
+        if not frame.empty:
+            frame = frame[frame['timestamp'] >= cutoff]
+            frame = frame.sort_values('timestamp', ascending=False).head(self.max_rows)
+            frame = frame.reset_index(drop=True)
+            entry.last_timestamp = frame['timestamp'].iloc[0] if not frame.empty else entry.last_timestamp
+
+        entry.frame = frame
+        entry.refreshed_at = time.monotonic()
+
+    def get(self, window='1 hour', bounds=None):
+        """Актуальные позиции окна, новые сверху (не больше max_rows).
+
+        bounds — видимая область (south, west, north, east) из
+        viewport_from_relayout; лимит строк действует внутри неё.
+        """
+        entry = self._entry(window, bounds)
+        with entry.lock:
+            if time.monotonic() - entry.refreshed_at >= self.refresh_interval:
+                self._refresh(entry)
+            return entry.frame.copy()
+
+
+positions_cache = PositionsCache()
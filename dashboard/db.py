@@ -0,0 +1,90 @@
+import time
+
+import pandas as pd
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import URL
+from sqlalchemy.exc import DisconnectionError, OperationalError
+
+from config import DB_CONFIG, DB_POOL_CONFIG, RETRY_CONFIG
+from metrics import REGISTRY, stage
+
+POOL_WAIT_SECONDS = REGISTRY.histogram(
+    'aviation_db_pool_wait_seconds', 'Ожидание соединения из пула'
+)
+
+# Один движок на процесс: соединения переиспользуются между тиками Interval
+# и сессиями браузера вместо нового подключения на каждый запрос. Параметры
+# DB_POOL_CONFIG применяются так же, как в пуле scraper: max_size — размер
+# пула, max_lifetime — пересоздание старых соединений, health_check_interval —
+# проверка простоявших соединений (события ниже), min_size — соединения,
+# открываемые заранее в warm_pool()
+engine = create_engine(
+    URL.create(
+        'postgresql+psycopg2',
+        username=DB_CONFIG['user'],
+        password=DB_CONFIG['password'],
+        host=DB_CONFIG['host'],
+        port=int(DB_CONFIG['port']),
+        database=DB_CONFIG['dbname']
+    ),
+    pool_size=DB_POOL_CONFIG['max_size'],
+    max_overflow=0,
+    pool_timeout=DB_POOL_CONFIG['acquire_timeout'],
+    pool_recycle=DB_POOL_CONFIG['max_lifetime'] or -1
+)
+
+
+@event.listens_for(engine, 'checkin')
+def _returned(dbapi_connection, connection_record):
+    connection_record.info['returned_at'] = time.monotonic()
+
+
+@event.listens_for(engine, 'checkout')
+def _check_idle(dbapi_connection, connection_record, connection_proxy):
+    """SELECT 1 для соединения, простоявшего дольше health_check_interval.
+
+    DisconnectionError заставляет пул заменить соединение новым.
+    """
+    returned_at = connection_record.info.get('returned_at')
+    if returned_at is None or time.monotonic() - returned_at < DB_POOL_CONFIG['health_check_interval']:
+        return
+    try:
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute("SELECT 1")
+        finally:
+            cursor.close()
+        dbapi_connection.rollback()
+    except Exception as e:
+        print(f"Pooled connection failed health check: {str(e)}")
+        raise DisconnectionError() from e
+
+
+def warm_pool():
+    """Открывает min_size соединений заранее; ошибки только печатаются"""
+    connections = []
+    try:
+        for _ in range(min(DB_POOL_CONFIG['min_size'], DB_POOL_CONFIG['max_size'])):
+            connections.append(engine.connect())
+    except OperationalError as e:
+        print(f"Database pool warm-up failed: {str(e)}")
+    finally:
+        for conn in connections:
+            conn.close()
+
+
+def read_sql(query, params=None):
+    """pd.read_sql через общий пул с повтором при обрыве соединения"""
+    max_retries = RETRY_CONFIG['db']['max_retries']
+    for attempt in range(max_retries):
+        try:
+            started = time.perf_counter()
+            with engine.connect() as conn:
+                POOL_WAIT_SECONDS.observe(time.perf_counter() - started)
+                with stage('db.read_sql'):
+                    return pd.read_sql(query, conn, params=params)
+        except OperationalError as e:
+            print(f"Database connection error (attempt {attempt+1}): {str(e)}")
+            if attempt == max_retries - 1:
+                raise
+            time.sleep(RETRY_CONFIG['db']['initial_delay'] * (2 ** attempt))
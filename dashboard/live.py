@@ -0,0 +1,114 @@
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import requests
+
+import livefeed
+from cache import COLUMNS
+from config import DASHBOARD_LIVE_CONFIG
+from metrics import REGISTRY
+from viewport import viewport_boxes
+
+LIVE_FETCH_ERRORS = REGISTRY.counter(
+    'aviation_dashboard_live_errors_total', 'Неудачных запросов текущего состояния к scraper'
+)
+
+
+class LiveClient:
+    """Локальная копия текущего состояния рейсов из scraper.
+
+    Раз в refresh_interval запрашиваются изменения с последней известной
+    версии: снятые и обновлённые рейсы заменяются в массиве записей
+    целиком. DataFrame для карты собирается один раз на версию и общий
+    для всех сессий; в БД этот путь не ходит.
+    """
+
+    def __init__(self, url=None, refresh_interval=None, timeout=None):
+        cfg = DASHBOARD_LIVE_CONFIG
+        self.url = cfg['url'] if url is None else url
+        self.refresh_interval = cfg['refresh_interval'] if refresh_interval is None else refresh_interval
+        self.timeout = cfg['timeout'] if timeout is None else timeout
+        self.session = requests.Session()
+        self.epoch = None
+        self.version = 0
+        self.records = np.empty(0, dtype=livefeed.RECORD)
+        self.models = []
+        self.airlines = []
+        self.frame = pd.DataFrame(columns=COLUMNS)
+        self.refreshed_at = 0.0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _extend(dictionary, entries):
+        start, values = entries
+        del dictionary[start:]
+        dictionary.extend(values)
+
+    def apply(self, delta):
+        """Применяет полный снимок или изменения после self.version"""
+        if delta.base == 0:
+            self.records = delta.records.copy()
+            self.models, self.airlines = [], []
+        else:
+            replaced = np.concatenate([
+                delta.records['icao'], np.array(delta.removed, dtype=livefeed.RECORD['icao'])
+            ])
+            keep = ~np.isin(self.records['icao'], replaced)
+            self.records = np.concatenate([self.records[keep], delta.records])
+        self._extend(self.models, delta.models)
+        self._extend(self.airlines, delta.airlines)
+        self.epoch = delta.epoch
+        self.version = delta.version
+        self.frame = self._frame()
+
+    def _frame(self):
+        records = np.sort(self.records, order='timestamp')[::-1]
+        return pd.DataFrame({
+            'id': records['seq'].astype('int64'),
+            'icao': np.char.decode(records['icao'], 'ascii').astype(object),
+            'model': np.array(self.models, dtype=object)[records['model_id']],
+            'latitude': records['latitude'],
+            'longitude': records['longitude'],
+            # Как timestamp в БД: UTC без часового пояса
+            'timestamp': pd.to_datetime(np.round(records['timestamp'] * 1e6).astype('int64'), unit='us'),
+        }, columns=COLUMNS)
+
+    def _refresh(self):
+        params = {'since': self.version}
+        if self.epoch is not None:
+            params['epoch'] = self.epoch
+        response = self.session.get(self.url, params=params, timeout=self.timeout)
+        response.raise_for_status()
+        self.apply(livefeed.decode(response.content))
+
+    def get(self, bounds=None):
+        """Текущие позиции в видимой области, новые сверху; DataFrame общий, не изменять.
+
+        Бросает исключение, если scraper недоступен и снимка ещё нет; при
+        сбое обновления возвращается последний полученный снимок.
+        """
+        with self._lock:
+            if time.monotonic() - self.refreshed_at >= self.refresh_interval:
+                # Недоступный scraper опрашивается не чаще refresh_interval
+                self.refreshed_at = time.monotonic()
+                try:
+                    self._refresh()
+                except Exception:
+                    LIVE_FETCH_ERRORS.inc()
+                    if self.epoch is None:
+                        raise
+            frame = self.frame
+
+        if bounds is not None and not frame.empty:
+            mask = np.zeros(len(frame), dtype=bool)
+            lat = frame['latitude'].to_numpy()
+            lon = frame['longitude'].to_numpy()
+            for west, south, east, north in viewport_boxes(bounds):
+                mask |= (lon >= west) & (lon <= east) & (lat >= south) & (lat <= north)
+            frame = frame[mask].reset_index(drop=True)
+        return frame
+
+
+live_client = LiveClient()
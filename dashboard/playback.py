@@ -0,0 +1,319 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from cache import BOX_CONDITION
+from config import DASHBOARD_PLAYBACK_CONFIG
+from db import read_sql
+from metrics import REGISTRY, stage
+from render import palette
+from viewport import viewport_boxes
+
+EPOCH = datetime(1970, 1, 1)
+
+PLAYBACK_REQUESTS = REGISTRY.counter(
+    'aviation_dashboard_playback_requests_total', 'Запросов кадров воспроизведения', ('kind',)
+)
+
+# Точка кадра: индекс рейса в справочнике периода и интерполированная позиция
+FRAME_POINT = np.dtype([
+    ('flight', '<u4'),
+    ('latitude', '<f4'),
+    ('longitude', '<f4'),
+])
+
+# Позиции периода одним запросом, упорядоченные по рейсу и времени; время —
+# секунды эпохи, как у кадров (timestamp в БД — UTC без часового пояса)
+PLAYBACK_POSITIONS_QUERY = """
+    SELECT
+        fp.flight_id,
+        fp.latitude,
+        fp.longitude,
+        EXTRACT(EPOCH FROM fp.timestamp)::float8 AS ts
+    FROM flight_positions fp
+    WHERE
+        fp.timestamp >= %(since)s
+        AND fp.timestamp < %(until)s
+        AND ({boxes})
+    ORDER BY fp.flight_id, fp.timestamp
+    LIMIT %(limit)s
+"""
+
+PLAYBACK_FLIGHTS_QUERY = """
+    SELECT
+        f.id AS flight_id,
+        f.flight_icao AS icao,
+        COALESCE(NULLIF(a.model_name, ''), 'Unknown Model') AS model
+    FROM flights f
+    LEFT JOIN aircrafts a ON f.aircraft_icao = a.icao_code
+    WHERE f.id = ANY(%(ids)s)
+"""
+
+
+class PlaybackTooLarge(RuntimeError):
+    """Позиций или кадров периода больше ограничения: нужен короче период,
+    крупнее шаг или меньше область"""
+
+    def __init__(self, count, limit, what='точек кадров'):
+        super().__init__(f'{what} больше {limit}')
+        self.count = count
+        self.limit = limit
+
+
+def playback_query(bounds):
+    """Запрос позиций периода и параметры прямоугольников видимой области"""
+    conditions = []
+    params = {}
+    for i, (west, south, east, north) in enumerate(viewport_boxes(bounds)):
+        prefix = f'b{i}_'
+        conditions.append(BOX_CONDITION.format(prefix))
+        params.update({prefix + 'w': west, prefix + 's': south, prefix + 'e': east, prefix + 'n': north})
+    return PLAYBACK_POSITIONS_QUERY.replace('{boxes}', ' OR '.join(conditions)), params
+
+
+def interpolate_track(ts, lat, lon, buckets, max_gap, hold):
+    """Позиции рейса на моменты buckets: (индексы кадров, широты, долготы).
+
+    Между соседними позициями не дальше max_gap секунд позиция
+    интерполируется линейно, иначе рейс стоит в последней точке не дольше
+    hold секунд. До первой позиции рейса нет. Долготы разворачиваются,
+    чтобы интерполяция не шла через весь мир на антимеридиане.
+    """
+    first = np.searchsorted(buckets, ts[0], side='left')
+    last = np.searchsorted(buckets, ts[-1] + hold, side='right')
+    frames = np.arange(first, last)
+    if not len(frames):
+        return frames, np.empty(0), np.empty(0)
+    times = buckets[frames]
+    lon = np.degrees(np.unwrap(np.radians(lon)))
+
+    left = np.searchsorted(ts, times, side='right') - 1
+    right = np.minimum(left + 1, len(ts) - 1)
+    gap = ts[right] - ts[left]
+    interpolated = (right > left) & (gap <= max_gap)
+    frac = np.where(interpolated, (times - ts[left]) / np.where(gap > 0, gap, 1), 0.0)
+    visible = interpolated | (times - ts[left] <= hold)
+
+    lat_at = lat[left] + (lat[right] - lat[left]) * frac
+    lon_at = lon[left] + (lon[right] - lon[left]) * frac
+    lon_at = (lon_at + 180) % 360 - 180
+    return frames[visible], lat_at[visible], lon_at[visible]
+
+
+class Playback:
+    """Кадры периода в компактном виде.
+
+    Точки всех кадров лежат подряд в одном массиве FRAME_POINT, точки кадра
+    k — points[offsets[k]:offsets[k + 1]]. Справочники рейсов и моделей
+    общие для периода и отдаются клиенту один раз в meta().
+    """
+
+    def __init__(self, start, step, count, offsets, points, icaos, flight_models, models):
+        self.start = start
+        self.step = step
+        self.count = count
+        self.offsets = offsets
+        self.points = points
+        self.icaos = icaos
+        self.flight_models = flight_models
+        self.models = models
+
+    @property
+    def nbytes(self):
+        return self.offsets.nbytes + self.points.nbytes + self.flight_models.nbytes
+
+    def frame(self, k):
+        return self.points[self.offsets[k]:self.offsets[k + 1]]
+
+    def meta(self):
+        """Справочники и параметры периода для клиента"""
+        if len(self.points):
+            center = {
+                'lat': float(np.median(self.points['latitude'])),
+                'lon': float(np.median(self.points['longitude']))
+            }
+        else:
+            center = {'lat': 44.5, 'lon': 34.5}
+        return {
+            'start': self.start.isoformat(),
+            'step': self.step,
+            'count': self.count,
+            'icao': self.icaos,
+            'model': self.flight_models.tolist(),
+            'models': self.models,
+            'colors': [palette.color(model) for model in self.models],
+            'center': center
+        }
+
+    def chunk(self, first, count):
+        """Кадры [first, first + count) одной порцией: плоские столбцы и смещения кадров"""
+        first = max(0, min(first, self.count - 1))
+        end = min(self.count, first + count)
+        begin = self.offsets[first]
+        points = self.points[begin:self.offsets[end]]
+        return {
+            'first': first,
+            'offsets': (self.offsets[first:end + 1] - begin).tolist(),
+            'flight': points['flight'].tolist(),
+            'lat': np.round(points['latitude'].astype(np.float64), 4).tolist(),
+            'lon': np.round(points['longitude'].astype(np.float64), 4).tolist(),
+        }
+
+
+def _epoch(moment):
+    """Секунды эпохи для времени БД (UTC без часового пояса)"""
+    return (moment.replace(tzinfo=None) - EPOCH).total_seconds()
+
+
+def build_playback(since, until, step, bounds=None, max_gap=None, hold=None, max_points=None, max_rows=None):
+    """Загружает позиции периода одним запросом и считает все кадры.
+
+    Запрос ограничен max_rows + 1 строками, поэтому слишком большой период
+    отклоняется, не загружая позиции целиком. До интерполяции число точек
+    кадров оценивается сверху по интервалу кадров каждого рейса; если
+    позиций больше max_rows или оценка больше max_points, кадры не
+    считаются и выбрасывается PlaybackTooLarge.
+    """
+    cfg = DASHBOARD_PLAYBACK_CONFIG
+    max_gap = cfg['max_gap_seconds'] if max_gap is None else max_gap
+    hold = cfg['hold_seconds'] if hold is None else hold
+    max_points = cfg['max_points'] if max_points is None else max_points
+    max_rows = cfg['max_rows'] if max_rows is None else max_rows
+    count = max(1, int((until - since).total_seconds() // step) + 1)
+    buckets = _epoch(since) + step * np.arange(count, dtype=np.float64)
+
+    query, box_params = playback_query(bounds)
+    with stage('playback.query'):
+        # Запас по краям, чтобы первые и последние кадры было из чего интерполировать
+        rows = read_sql(query, params={
+            'since': since - timedelta(seconds=max(max_gap, hold)),
+            'until': until + timedelta(seconds=max_gap),
+            'limit': max_rows + 1,
+            **box_params
+        })
+    if len(rows) > max_rows:
+        raise PlaybackTooLarge(len(rows), max_rows, 'позиций')
+
+    with stage('playback.interpolate'):
+        flight_ids = rows['flight_id'].to_numpy(dtype=np.int64)
+        ts = rows['ts'].to_numpy(dtype=np.float64)
+        lat = rows['latitude'].to_numpy(dtype=np.float64)
+        lon = rows['longitude'].to_numpy(dtype=np.float64)
+        unique_ids, starts = np.unique(flight_ids, return_index=True)
+        ends = np.append(starts[1:], len(flight_ids))
+        spans = (
+            np.searchsorted(buckets, ts[ends - 1] + hold, side='right')
+            - np.searchsorted(buckets, ts[starts], side='left')
+        )
+        estimate = int(np.clip(spans, 0, None).sum())
+        if estimate > max_points:
+            raise PlaybackTooLarge(estimate, max_points)
+
+        frames, flights, lats, lons = [], [], [], []
+        for idx, (start, end) in enumerate(zip(starts.tolist(), ends.tolist())):
+            f, la, lo = interpolate_track(ts[start:end], lat[start:end], lon[start:end], buckets, max_gap, hold)
+            if len(f):
+                frames.append(f)
+                flights.append(np.full(len(f), idx, dtype=np.uint32))
+                lats.append(la)
+                lons.append(lo)
+
+        if frames:
+            frames = np.concatenate(frames)
+            order = np.argsort(frames, kind='stable')
+            frames = frames[order]
+            points = np.empty(len(frames), dtype=FRAME_POINT)
+            points['flight'] = np.concatenate(flights)[order]
+            points['latitude'] = np.concatenate(lats)[order]
+            points['longitude'] = np.concatenate(lons)[order]
+        else:
+            frames = np.empty(0, dtype=np.int64)
+            points = np.empty(0, dtype=FRAME_POINT)
+        offsets = np.searchsorted(frames, np.arange(count + 1), side='left').astype(np.int64)
+
+    icaos, flight_models, models = [], np.zeros(len(unique_ids), dtype=np.int32), []
+    if len(unique_ids):
+        with stage('playback.flights'):
+            flights_df = read_sql(PLAYBACK_FLIGHTS_QUERY, params={'ids': unique_ids.tolist()})
+        info = flights_df.set_index('flight_id').reindex(unique_ids)
+        icaos = info['icao'].fillna('').tolist()
+        model_index = {}
+        for i, model in enumerate(info['model'].fillna('Unknown Model').tolist()):
+            if model not in model_index:
+                model_index[model] = len(models)
+                models.append(model)
+            flight_models[i] = model_index[model]
+
+    return Playback(since, step, count, offsets, points, icaos, flight_models, models)
+
+
+class _PlaybackEntry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.playback = None
+        self.nbytes = 0
+        self.accessed_at = time.monotonic()
+
+
+class PlaybackCache:
+    """Общий для процесса кэш кадров по периодам.
+
+    Период определяется началом, концом, шагом и видимой областью. Кадры
+    считаются один раз по одному запросу позиций; сессии, открывшие тот же
+    период, ждут одну сборку и дальше получают порции из памяти без
+    обращений к БД. Кроме числа периодов ограничен их суммарный объём
+    max_bytes: после сборки давно не запрошенные периоды вытесняются, пока
+    кэш не уложится в бюджет.
+    """
+
+    def __init__(self, max_entries=None, idle_ttl=None, max_bytes=None):
+        cfg = DASHBOARD_PLAYBACK_CONFIG
+        self.max_entries = cfg['max_entries'] if max_entries is None else max_entries
+        self.idle_ttl = cfg['idle_ttl'] if idle_ttl is None else idle_ttl
+        self.max_bytes = cfg['max_bytes'] if max_bytes is None else max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _entry(self, key):
+        now = time.monotonic()
+        with self._lock:
+            for idle in [k for k, e in self._entries.items() if now - e.accessed_at > self.idle_ttl]:
+                del self._entries[idle]
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _PlaybackEntry()
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            self._entries.move_to_end(key)
+            entry.accessed_at = now
+            return entry
+
+    def _trim(self, key):
+        """Вытесняет самые давние периоды, кроме key, пока объём больше max_bytes"""
+        with self._lock:
+            total = sum(e.nbytes for e in self._entries.values())
+            for old in list(self._entries):
+                if total <= self.max_bytes:
+                    break
+                if old != key:
+                    total -= self._entries.pop(old).nbytes
+
+    def get(self, since, until, step, bounds=None):
+        """Кадры периода; при первом обращении собираются из БД"""
+        key = (since, until, step, bounds)
+        entry = self._entry(key)
+        with entry.lock:
+            if entry.playback is not None:
+                PLAYBACK_REQUESTS.inc(kind='cached')
+                return entry.playback
+            PLAYBACK_REQUESTS.inc(kind='build')
+            entry.playback = build_playback(since, until, step, bounds)
+            entry.nbytes = entry.playback.nbytes
+        self._trim(key)
+        return entry.playback
+
+
+playback_cache = PlaybackCache()
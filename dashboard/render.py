@@ -0,0 +1,294 @@
+import threading
+import uuid
+from collections import OrderedDict, deque
+
+import plotly.express as px
+import plotly.graph_objects as go
+from dash import Patch, no_update
+
+from config import DASHBOARD_RENDER_CONFIG
+from metrics import stage
+
+PALETTE = px.colors.qualitative.Dark24 + px.colors.qualitative.Light24
+
+LIVE_TRACES = 1  # трасса текущих позиций идёт первой, трассы моделей — за ней
+
+
+class ModelPalette:
+    """Постоянное соответствие модель -> цвет на весь процесс.
+
+    Цвета выдаются по кругу, поэтому моделей может быть больше, чем цветов
+    в палитре, а цвет модели не меняется между тиками и сессиями.
+    """
+
+    def __init__(self, colors=PALETTE):
+        self._colors = list(colors)
+        self._assigned = {}
+        self._lock = threading.Lock()
+
+    def color(self, model):
+        with self._lock:
+            if model not in self._assigned:
+                self._assigned[model] = self._colors[len(self._assigned) % len(self._colors)]
+            return self._assigned[model]
+
+
+palette = ModelPalette()
+
+
+def model_trace(model, model_df):
+    color = palette.color(model)
+    return go.Scattermap(
+        lat=model_df['latitude'].tolist(),
+        lon=model_df['longitude'].tolist(),
+        mode='markers+lines',
+        marker=dict(
+            size=12,
+            color=color,
+            symbol='airport'
+        ),
+        line=dict(width=2, color=color),
+        name=model,
+        hoverinfo='text+name',
+        text=model_df['icao'].tolist(),
+        legendgroup=model
+    )
+
+
+def live_trace(live):
+    """Текущие позиции рейсов поверх треков; пустая трасса, если их нет"""
+    if live is None or live.empty:
+        lat, lon, text, colors = [], [], [], []
+    else:
+        models = live['model'].fillna('Unknown Model')
+        lat = live['latitude'].tolist()
+        lon = live['longitude'].tolist()
+        text = (live['icao'] + ' ' + models).tolist()
+        colors = [palette.color(model) for model in models]
+    return go.Scattermap(
+        lat=lat,
+        lon=lon,
+        mode='markers',
+        marker=dict(size=14, color=colors),
+        name='Сейчас',
+        hoverinfo='text',
+        text=text,
+        showlegend=False
+    )
+
+
+def _live_signature(live):
+    # seq меняется при каждой новой позиции рейса, снятый рейс уходит из id
+    if live is None or live.empty:
+        return None
+    return hash(live['id'].to_numpy().tobytes())
+
+
+def _prepare(df):
+    if df.empty:
+        return df
+    df = df.copy()
+    df['model'] = df['model'].fillna('Unknown Model')
+    # В трассах точки идут от старых к новым: новые дописываются в конец,
+    # вытесненные из окна снимаются с начала
+    return df.sort_values(['timestamp', 'id']).reset_index(drop=True)
+
+
+def _after(df, last):
+    """Строки df (после _prepare) с ключом (timestamp, id) больше last"""
+    if df.empty or last is None:
+        return df
+    last_ts, last_id = last
+    return df[(df['timestamp'] > last_ts) | ((df['timestamp'] == last_ts) & (df['id'] > last_id))]
+
+
+def build_figure(df, live=None):
+    """Полная фигура: текущие позиции первой трассой и по одной трассе на модель"""
+    df = _prepare(df)
+    fig = go.Figure()
+    fig.add_trace(live_trace(live))
+
+    if not df.empty:
+        for model, model_df in df.groupby('model', sort=False):
+            fig.add_trace(model_trace(model, model_df))
+
+        lat_center = df['latitude'].median()
+        lon_center = df['longitude'].median()
+        zoom = 5
+    else:
+        lat_center = 44.5
+        lon_center = 34.5
+        zoom = 3
+
+    fig.update_layout(
+        map=dict(
+            style="open-street-map",
+            center=dict(lat=lat_center, lon=lon_center),
+            zoom=zoom
+        ),
+        # Постоянный uirevision сохраняет масштаб и положение карты,
+        # выбранные пользователем, при обновлении фигуры
+        uirevision='live-map',
+        margin={"r":0,"t":40,"l":0,"b":0},
+        legend=dict(
+            title='<b>Модели самолетов</b>',
+            orientation='v',
+            yanchor='top',
+            xanchor='left',
+            x=0.01,
+            y=0.99,
+            bgcolor='rgba(255,255,255,0.9)'
+        )
+    )
+    return fig
+
+
+class _SessionState:
+    def __init__(self, df):
+        self.models = []
+        self.points = {}
+        for model, model_df in df.groupby('model', sort=False) if not df.empty else ():
+            self.models.append(model)
+            self.points[model] = deque(model_df['id'].tolist())
+        self.index = {model: i + LIVE_TRACES for i, model in enumerate(self.models)}
+        # Ключ (timestamp, id) последней отрисованной точки: трассы упорядочены
+        # по нему, и новыми считаются только точки позже неё
+        self.last = (df['timestamp'].iloc[-1], int(df['id'].iloc[-1])) if not df.empty else None
+        self.lod = None
+        self.live = None
+        self.version = 0
+        self.ticks = 0
+
+
+class MapRenderer:
+    """Инкрементальная отрисовка карты.
+
+    Для каждой сессии браузера на сервере хранится, какие позиции уже
+    отрисованы в каких трассах. На тике клиенту уходит Patch: новые точки
+    дописываются в трассы своих моделей, вытесненные из окна и отброшенные
+    упрощением трека снимаются из трасс, новые модели добавляются
+    отдельными трассами. Текущие позиции рейсов из scraper — отдельная
+    первая трасса поверх треков; она заменяется целиком, только когда
+    изменилась. Полная фигура отправляется при первом показе,
+    рассинхронизации версий и раз в full_rebuild_every тиков.
+    """
+
+    def __init__(self, max_sessions=None, full_rebuild_every=None):
+        cfg = DASHBOARD_RENDER_CONFIG
+        self.max_sessions = cfg['max_sessions'] if max_sessions is None else max_sessions
+        self.full_rebuild_every = cfg['full_rebuild_every'] if full_rebuild_every is None else full_rebuild_every
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _full(self, session, df, lod, live):
+        state = _SessionState(df)
+        state.lod = lod
+        state.live = _live_signature(live)
+        with self._lock:
+            self._sessions[session] = state
+            self._sessions.move_to_end(session)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        with stage('figure_build'):
+            figure = build_figure(df, live)
+        return figure, {'session': session, 'version': state.version, 'lod': lod}
+
+    def _evictions(self, state, current_ids):
+        """Позиции снимаемых точек по трассам и число оставшихся точек.
+
+        Точки уходят с начала трасс при выходе из окна и из середины, когда
+        упрощение трека заменяет последнюю точку рейса.
+        """
+        evicted = {}
+        kept = 0
+        for model in state.models:
+            points = state.points[model]
+            removed = [i for i, point in enumerate(points) if point not in current_ids]
+            evicted[model] = removed
+            kept += len(points) - len(removed)
+        return evicted, kept
+
+    def render(self, df, client_state, lod=None, live=None):
+        """Возвращает (figure | Patch | no_update, новое состояние клиента).
+
+        lod — уровень детализации треков; при его смене фигура собирается заново.
+        live — текущие позиции рейсов (по одной строке на рейс) или None.
+        """
+        df = _prepare(df)
+        session = (client_state or {}).get('session') or uuid.uuid4().hex
+        with self._lock:
+            state = self._sessions.get(session)
+            if state is not None:
+                self._sessions.move_to_end(session)
+
+        if (
+            state is None
+            or not DASHBOARD_RENDER_CONFIG['incremental']
+            or client_state.get('version') != state.version
+            or state.lod != lod
+            or state.ticks >= self.full_rebuild_every
+        ):
+            return self._full(session, df, lod, live)
+
+        current_ids = set(df['id'].tolist()) if not df.empty else set()
+        evicted, kept = self._evictions(state, current_ids)
+        new_rows = _after(df, state.last)
+        if kept + len(new_rows) != len(current_ids):
+            # В окне появились точки старше уже отрисованных (в том числе
+            # запоздавшие записи с большим id и старым временем)
+            return self._full(session, df, lod, live)
+
+        state.ticks += 1
+        live_signature = _live_signature(live)
+        live_changed = live_signature != state.live
+        if not new_rows.shape[0] and not any(evicted.values()) and not live_changed:
+            return no_update, no_update
+
+        with stage('figure_patch'):
+            patch, render_state = self._patch(state, session, lod, evicted, new_rows)
+            if live_changed:
+                current = live_trace(live)
+                trace = patch['data'][0]
+                trace['lat'] = list(current.lat)
+                trace['lon'] = list(current.lon)
+                trace['text'] = list(current.text)
+                trace['marker']['color'] = list(current.marker.color)
+                state.live = live_signature
+            return patch, render_state
+
+    def _patch(self, state, session, lod, evicted, new_rows):
+        """Patch: снятие ушедших точек и дописывание новых"""
+        patch = Patch()
+        for model, removed in evicted.items():
+            if not removed:
+                continue
+            trace = patch['data'][state.index[model]]
+            # С конца, чтобы позиции ещё не удалённых точек не сдвигались
+            for i in reversed(removed):
+                for prop in ('lat', 'lon', 'text'):
+                    del trace[prop][i]
+            gone = set(removed)
+            state.points[model] = deque(
+                point for i, point in enumerate(state.points[model]) if i not in gone
+            )
+
+        for model, model_df in new_rows.groupby('model', sort=False):
+            if model in state.index:
+                trace = patch['data'][state.index[model]]
+                trace['lat'].extend(model_df['latitude'].tolist())
+                trace['lon'].extend(model_df['longitude'].tolist())
+                trace['text'].extend(model_df['icao'].tolist())
+                state.points[model].extend(model_df['id'].tolist())
+            else:
+                patch['data'].append(model_trace(model, model_df).to_plotly_json())
+                state.index[model] = len(state.models) + LIVE_TRACES
+                state.models.append(model)
+                state.points[model] = deque(model_df['id'].tolist())
+
+        if not new_rows.empty:
+            state.last = (new_rows['timestamp'].iloc[-1], int(new_rows['id'].iloc[-1]))
+        state.version += 1
+        return patch, {'session': session, 'version': state.version, 'lod': lod}
+
+
+renderer = MapRenderer()
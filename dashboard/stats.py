@@ -0,0 +1,53 @@
+import plotly.graph_objects as go
+
+from config import DASHBOARD_STATS_CONFIG
+from db import read_sql
+from render import palette
+
+OTHER_MODELS = 'Другие'
+
+# Читает готовые почасовые счётчики: агрегация по flight_positions не нужна
+HOURLY_STATS_QUERY = """
+    SELECT
+        c.hour,
+        COALESCE(a.model_name, c.aircraft_icao) AS model,
+        SUM(c.flight_count) AS flight_count
+    FROM flight_counts_hourly c
+    LEFT JOIN aircrafts a ON c.aircraft_icao = a.icao_code
+    WHERE c.hour >= date_trunc('hour', LOCALTIMESTAMP) - %(hours)s * INTERVAL '1 hour'
+    GROUP BY 1, 2
+    ORDER BY 1
+"""
+
+
+def fetch_hourly_stats(hours=None):
+    hours = DASHBOARD_STATS_CONFIG['hours'] if hours is None else hours
+    return read_sql(HOURLY_STATS_QUERY, params={'hours': hours})
+
+
+def build_stats_figure(df, top_models=None):
+    """Столбчатая диаграмма рейсов по часам с разбивкой по моделям"""
+    top_models = DASHBOARD_STATS_CONFIG['top_models'] if top_models is None else top_models
+    fig = go.Figure()
+    if not df.empty:
+        totals = df.groupby('model')['flight_count'].sum().sort_values(ascending=False)
+        top = set(totals.index[:top_models])
+        df = df.assign(model=df['model'].where(df['model'].isin(top), OTHER_MODELS))
+        df = df.groupby(['hour', 'model'], as_index=False)['flight_count'].sum()
+        for model in [m for m in totals.index if m in top] + [OTHER_MODELS]:
+            model_df = df[df['model'] == model]
+            if model_df.empty:
+                continue
+            fig.add_trace(go.Bar(
+                x=model_df['hour'],
+                y=model_df['flight_count'],
+                name=model,
+                marker_color='lightgray' if model == OTHER_MODELS else palette.color(model)
+            ))
+    fig.update_layout(
+        barmode='stack',
+        title='Рейсы по часам',
+        margin={"r":0,"t":40,"l":40,"b":30},
+        legend=dict(orientation='h')
+    )
+    return fig
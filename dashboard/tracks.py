@@ -0,0 +1,175 @@
+import math
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from config import DASHBOARD_CACHE_CONFIG, DASHBOARD_TRACKS_CONFIG
+
+
+def zoom_from_relayout(relayout_data, default):
+    """Текущий масштаб карты из relayoutData (ключи map.zoom или map: {zoom})"""
+    if not relayout_data:
+        return default
+    zoom = relayout_data.get('map.zoom')
+    if zoom is None:
+        zoom = (relayout_data.get('map') or {}).get('zoom')
+    return default if zoom is None else float(zoom)
+
+
+def zoom_band(zoom):
+    """Индекс полосы масштаба: наибольший порог из zoom_bands, не превышающий zoom"""
+    bands = DASHBOARD_TRACKS_CONFIG['zoom_bands']
+    band = 0
+    for i, threshold in enumerate(bands):
+        if zoom >= threshold:
+            band = i
+    return band
+
+
+def band_tolerance(band):
+    """Допуск упрощения в градусах: pixel_tolerance пикселей на нижней границе полосы"""
+    zoom = DASHBOARD_TRACKS_CONFIG['zoom_bands'][band]
+    return DASHBOARD_TRACKS_CONFIG['pixel_tolerance'] * 360 / (256 * 2 ** zoom)
+
+
+def douglas_peucker(lat, lon, tolerance):
+    """Маска точек, оставляемых алгоритмом Дугласа-Пекера (итеративно, NumPy)"""
+    n = len(lat)
+    keep = np.zeros(n, dtype=bool)
+    if n <= 2:
+        keep[:] = True
+        return keep
+    # Долготы масштабируются косинусом широты, чтобы допуск был изотропным
+    x = np.asarray(lon, dtype=np.float64) * math.cos(math.radians(float(np.mean(lat))))
+    y = np.asarray(lat, dtype=np.float64)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        xs, ys = x[start + 1:end], y[start + 1:end]
+        dx, dy = x[end] - x[start], y[end] - y[start]
+        norm = math.hypot(dx, dy)
+        if norm == 0:
+            dist = np.hypot(xs - x[start], ys - y[start])
+        else:
+            dist = np.abs(dy * (xs - x[start]) - dx * (ys - y[start])) / norm
+        idx = int(np.argmax(dist))
+        if dist[idx] > tolerance:
+            mid = start + 1 + idx
+            keep[mid] = True
+            stack.append((start, mid))
+            stack.append((mid, end))
+    return keep
+
+
+class TrackSimplifier:
+    """Инкрементальное упрощение треков по рейсам и полосам масштаба.
+
+    Уже упрощённая часть трека фиксируется: с новыми точками упрощается
+    только хвост — последняя зафиксированная точка, последняя точка
+    прошлого тика и новые позиции. Поэтому между тиками точки трека
+    только дописываются в конец, снимаются с начала при выходе из окна и
+    заменяется последняя точка рейса, а отрисовка остаётся Patch. Новые
+    точки определяются по ключу (timestamp, id), а не по id: повтор пакета
+    из журнала или запоздавшая запись вставляют позиции со старым временем
+    и большим id. Если такая точка появилась внутри уже упрощённой части
+    или набор точек рейса изменился иначе, трек упрощается заново.
+
+    Состояние хранится отдельно для каждой видимой области: сессии с
+    разными областями передают разные подмножества позиций одного рейса.
+    """
+
+    def __init__(self, max_viewports=None):
+        self.max_viewports = DASHBOARD_CACHE_CONFIG['max_entries'] if max_viewports is None else max_viewports
+        self._viewports = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _new_state():
+        return {'frozen': [], 'provisional': None, 'last': None, 'seen': np.empty(0, dtype=np.int64)}
+
+    @staticmethod
+    def _extend(state, timestamps, ids, lat, lon, tolerance):
+        """Оставляемые id рейса; state — {'frozen', 'provisional', 'last', 'seen'} полосы.
+
+        Точки рейса упорядочены по (timestamp, id); last — ключ последней
+        обработанной точки, seen — id точек окна, уже прошедших упрощение.
+        """
+        position = {point: i for i, point in enumerate(ids.tolist())}
+        previous = state['frozen'] + ([state['provisional']] if state['provisional'] is not None else [])
+        present = [point in position for point in previous]
+        if state['last'] is None:
+            after = np.ones(len(ids), dtype=bool)
+        else:
+            last_ts, last_id = state['last']
+            after = (timestamps > last_ts) | ((timestamps == last_ts) & (ids > last_id))
+        # Из окна точки уходят только с начала трека, а новые точки — только
+        # позже последней обработанной
+        if present != sorted(present) or np.any(~after & ~np.isin(ids, state['seen'])):
+            state.update(TrackSimplifier._new_state())
+            after = np.ones(len(ids), dtype=bool)
+        frozen = [point for point in state['frozen'] if point in position]
+        provisional = state['provisional'] if state['provisional'] in position else None
+
+        new = ids[after].tolist()
+        if new:
+            segment = frozen[-1:] + ([provisional] if provisional is not None else []) + new
+            idx = np.array([position[point] for point in segment], dtype=np.int64)
+            mask = douglas_peucker(lat[idx], lon[idx], tolerance)
+            kept = [point for point, keep in zip(segment, mask.tolist()) if keep]
+            if frozen:
+                kept = kept[1:]
+            frozen = frozen + kept[:-1]
+            provisional = kept[-1] if kept else None
+            state['last'] = (timestamps[-1], int(ids[-1]))
+        state['frozen'] = frozen
+        state['provisional'] = provisional
+        state['seen'] = ids
+        return frozen + ([provisional] if provisional is not None else [])
+
+    def simplify(self, df, zoom, bounds=None):
+        """Подмножество строк df с упрощёнными треками для масштаба zoom.
+
+        bounds — видимая область, для которой получен df (как в PositionsCache).
+        """
+        if df.empty:
+            return df
+        band = zoom_band(zoom)
+        tolerance = band_tolerance(band)
+        df = df.sort_values(['icao', 'timestamp', 'id'])
+        keep_ids = []
+
+        with self._lock:
+            tracks = self._viewports.get(bounds)
+            if tracks is None:
+                tracks = self._viewports[bounds] = {}
+                while len(self._viewports) > self.max_viewports:
+                    self._viewports.popitem(last=False)
+            self._viewports.move_to_end(bounds)
+
+            seen = set()
+            for icao, flight_df in df.groupby('icao', sort=False):
+                seen.add(icao)
+                levels = tracks.setdefault(icao, {})
+                state = levels.get(band)
+                if state is None:
+                    state = levels[band] = self._new_state()
+                keep_ids.append(self._extend(
+                    state,
+                    flight_df['timestamp'].to_numpy(),
+                    flight_df['id'].to_numpy(),
+                    flight_df['latitude'].to_numpy(),
+                    flight_df['longitude'].to_numpy(),
+                    tolerance
+                ))
+            for icao in [k for k in tracks if k not in seen]:
+                del tracks[icao]
+
+        keep = np.fromiter((point for ids in keep_ids for point in ids), dtype=np.int64)
+        return df[df['id'].isin(keep)]
+
+
+track_simplifier = TrackSimplifier()
@@ -0,0 +1,62 @@
+import math
+
+from config import DASHBOARD_VIEWPORT_CONFIG
+
+
+def _snap_step(span):
+    # Шаг сетки — степень двойки от восьмой части размера окна: соседние
+    # положения карты у разных операторов дают одинаковые границы и общий кэш
+    step = 2 ** math.ceil(math.log2(max(span / 8, 1e-9)))
+    return max(DASHBOARD_VIEWPORT_CONFIG['min_step'], step)
+
+
+def viewport_from_relayout(relayout_data):
+    """Границы видимой области (south, west, north, east) из relayoutData.
+
+    Границы расширяются на margin с каждой стороны и выравниваются по
+    сетке. west > east означает пересечение антимеридиана. None — вся
+    карта или нет данных о видимой области.
+    """
+    derived = (relayout_data or {}).get('map._derived') or {}
+    corners = derived.get('coordinates')
+    if not corners:
+        return None
+    lons = [float(c[0]) for c in corners]
+    lats = [float(c[1]) for c in corners]
+    west, east = min(lons), max(lons)
+    south, north = min(lats), max(lats)
+
+    margin = DASHBOARD_VIEWPORT_CONFIG['margin']
+    lon_pad = (east - west) * margin
+    lat_pad = (north - south) * margin
+    west, east = west - lon_pad, east + lon_pad
+    south, north = max(-90.0, south - lat_pad), min(90.0, north + lat_pad)
+    if east - west >= 360:
+        if south <= -90 and north >= 90:
+            return None
+        west, east = -180.0, 180.0
+
+    step = _snap_step(max(east - west, north - south))
+    west = math.floor(west / step) * step
+    east = math.ceil(east / step) * step
+    south = max(-90.0, math.floor(south / step) * step)
+    north = min(90.0, math.ceil(north / step) * step)
+    if east - west >= 360:
+        west, east = -180.0, 180.0
+    else:
+        # Долготы MapLibre не ограничены [-180, 180] при прокрутке мира
+        west = (west + 180) % 360 - 180
+        east = (east + 180) % 360 - 180
+        if east == -180:
+            east = 180.0
+    return (south, west, north, east)
+
+
+def viewport_boxes(bounds):
+    """Прямоугольники (west, south, east, north) для запроса; два — через антимеридиан"""
+    if bounds is None:
+        return [(-180.0, -90.0, 180.0, 90.0)]
+    south, west, north, east = bounds
+    if west <= east:
+        return [(west, south, east, north)]
+    return [(west, south, 180.0, north), (-180.0, south, east, north)]
@@ -28,35 +28,223 @@ CREATE TABLE IF NOT EXISTS flights (
 CREATE INDEX IF NOT EXISTS flights_search_idx 
 ON flights (flight_icao, airline_id);
 
--- Создание таблицы позиций рейсов
+-- Миграция базы, созданной до секционирования: прежняя обычная таблица
+-- flight_positions переименовывается вместе с ключом и последовательностью,
+-- чтобы на её месте создать секционированную; строки переносятся ниже,
+-- после создания функций секций. Скрипт можно выполнить повторно на
+-- существующей базе (см. README)
+DO $$
+DECLARE
+    seq TEXT;
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM pg_class
+        WHERE oid = to_regclass('flight_positions') AND relkind = 'r'
+    ) THEN
+        seq := pg_get_serial_sequence('flight_positions', 'id');
+        ALTER TABLE flight_positions RENAME TO flight_positions_legacy;
+        IF EXISTS (
+            SELECT 1 FROM pg_constraint
+            WHERE conrelid = 'flight_positions_legacy'::regclass AND conname = 'flight_positions_pkey'
+        ) THEN
+            ALTER TABLE flight_positions_legacy
+                RENAME CONSTRAINT flight_positions_pkey TO flight_positions_legacy_pkey;
+        END IF;
+        IF seq IS NOT NULL THEN
+            EXECUTE format('ALTER SEQUENCE %s RENAME TO flight_positions_legacy_id_seq', seq);
+        END IF;
+        RAISE NOTICE 'flight_positions переименована в flight_positions_legacy для переноса в секции';
+    END IF;
+END;
+$$;
+
+-- Создание таблицы позиций рейсов, секционированной по суткам.
+-- Ключ секционирования входит в первичный ключ; строки вне созданных
+-- секций попадают в flight_positions_default и переносятся в свою секцию
+-- при её создании
 CREATE TABLE IF NOT EXISTS flight_positions (
-    id SERIAL PRIMARY KEY,
+    id BIGSERIAL,
     flight_id INTEGER REFERENCES flights(id),
     latitude FLOAT NOT NULL,
     longitude FLOAT NOT NULL,
     altitude FLOAT,
-    timestamp TIMESTAMP DEFAULT NOW()
+    timestamp TIMESTAMP NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (id, timestamp)
+) PARTITION BY RANGE (timestamp);
+
+CREATE TABLE IF NOT EXISTS flight_positions_default
+PARTITION OF flight_positions DEFAULT;
+
+-- BRIN по времени: позиции пишутся почти в порядке timestamp, индекс
+-- занимает несколько страниц на секцию
+CREATE INDEX IF NOT EXISTS flight_positions_timestamp_brin
+ON flight_positions USING BRIN (timestamp);
+
+-- Трек рейса: позиции конкретного рейса по времени. Уникальность делает
+-- повторную запись той же позиции (повтор пакета из журнала, повторная
+-- загрузка архива) пустой операцией
+CREATE UNIQUE INDEX IF NOT EXISTS flight_positions_flight_time_key
+ON flight_positions (flight_id, timestamp);
+
+-- Пространственный индекс по точке позиции для запросов по видимой
+-- области карты (встроенный тип point, без PostGIS)
+CREATE INDEX IF NOT EXISTS flight_positions_point_gist
+ON flight_positions USING GIST (point(longitude, latitude));
+
+-- Создание суточных секций за период [start_date, end_date].
+-- Строки, уже попавшие в секцию по умолчанию, переносятся в новую секцию
+CREATE OR REPLACE FUNCTION ensure_flight_positions_partitions(start_date DATE, end_date DATE)
+RETURNS INTEGER AS $$
+DECLARE
+    day DATE;
+    part_name TEXT;
+    created INTEGER := 0;
+BEGIN
+    FOR day IN SELECT generate_series(start_date, end_date, INTERVAL '1 day')::DATE LOOP
+        part_name := format('flight_positions_p%s', to_char(day, 'YYYYMMDD'));
+        IF to_regclass(part_name) IS NOT NULL THEN
+            CONTINUE;
+        END IF;
+
+        EXECUTE format(
+            'CREATE TABLE %I (LIKE flight_positions INCLUDING DEFAULTS INCLUDING CONSTRAINTS)',
+            part_name
+        );
+        EXECUTE format(
+            'WITH moved AS (
+                DELETE FROM flight_positions_default
+                WHERE timestamp >= %L AND timestamp < %L
+                RETURNING *
+            )
+            INSERT INTO %I SELECT * FROM moved',
+            day, day + 1, part_name
+        );
+        EXECUTE format(
+            'ALTER TABLE flight_positions ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+            part_name, day, day + 1
+        );
+        created := created + 1;
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Удаление секций старше retain_days суток: DROP TABLE вместо DELETE
+-- не оставляет мёртвых строк и не требует VACUUM
+CREATE OR REPLACE FUNCTION drop_old_flight_positions_partitions(retain_days INTEGER)
+RETURNS INTEGER AS $$
+DECLARE
+    part RECORD;
+    dropped INTEGER := 0;
+BEGIN
+    FOR part IN
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'flight_positions'::regclass
+            AND c.relname ~ '^flight_positions_p[0-9]{8}$'
+    LOOP
+        IF to_date(right(part.relname, 8), 'YYYYMMDD') < CURRENT_DATE - retain_days THEN
+            EXECUTE format('DROP TABLE %I', part.relname);
+            dropped := dropped + 1;
+        END IF;
+    END LOOP;
+
+    DELETE FROM flight_positions_default
+    WHERE timestamp < CURRENT_DATE - retain_days;
+    RETURN dropped;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT ensure_flight_positions_partitions(CURRENT_DATE - 1, CURRENT_DATE + 3);
+
+-- Перенос строк прежней таблицы в секции. Строки без времени не
+-- переносятся (ключ секционирования обязателен), повторы позиции рейса
+-- в одно время схлопываются уникальным индексом. При сбое прежняя таблица
+-- остаётся, и повторный запуск скрипта продолжит перенос
+DO $$
+DECLARE
+    first_day DATE;
+    last_day DATE;
+    moved BIGINT;
+BEGIN
+    IF to_regclass('flight_positions_legacy') IS NULL THEN
+        RETURN;
+    END IF;
+
+    SELECT min(timestamp)::DATE, max(timestamp)::DATE
+    INTO first_day, last_day
+    FROM flight_positions_legacy;
+    IF first_day IS NOT NULL THEN
+        PERFORM ensure_flight_positions_partitions(first_day, last_day);
+    END IF;
+
+    INSERT INTO flight_positions (id, flight_id, latitude, longitude, altitude, timestamp)
+    SELECT id, flight_id, latitude, longitude, altitude, timestamp
+    FROM flight_positions_legacy
+    WHERE timestamp IS NOT NULL
+    ON CONFLICT DO NOTHING;
+    GET DIAGNOSTICS moved = ROW_COUNT;
+
+    PERFORM setval(
+        pg_get_serial_sequence('flight_positions', 'id'),
+        GREATEST((SELECT max(id) FROM flight_positions), 1)
+    );
+    DROP TABLE flight_positions_legacy;
+    RAISE NOTICE 'В секции flight_positions перенесено строк: %', moved;
+END;
+$$;
+
+-- Почасовая статистика парка, обновляемая при записи каждого пакета
+-- в той же транзакции (scraper/rollups.py). flight_hours отмечает, что рейс
+-- уже учтён в часе, поэтому повторные позиции рейса в том же часе
+-- увеличивают только position_count
+CREATE TABLE IF NOT EXISTS flight_hours (
+    hour TIMESTAMP NOT NULL,
+    flight_id INTEGER NOT NULL REFERENCES flights(id),
+    PRIMARY KEY (hour, flight_id)
 );
 
--- Создание материализованного представления
-CREATE MATERIALIZED VIEW IF NOT EXISTS flight_counts AS
+CREATE TABLE IF NOT EXISTS flight_counts_hourly (
+    hour TIMESTAMP NOT NULL,
+    aircraft_icao VARCHAR(10) NOT NULL REFERENCES aircrafts(icao_code),
+    airline_id INTEGER NOT NULL REFERENCES airlines(id),
+    flight_count INTEGER NOT NULL DEFAULT 0,
+    position_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (hour, aircraft_icao, airline_id)
+);
+
+-- Статистика в терминах прежнего материализованного представления. На
+-- базе, где оно ещё есть, его нужно удалить (вместе с индексом
+-- flight_counts_idx), иначе представление с тем же именем не создать.
+-- DROP MATERIALIZED VIEW IF EXISTS падает, если flight_counts уже обычное
+-- представление, поэтому вид объекта проверяется, и скрипт можно
+-- выполнять повторно
+DO $$
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM pg_class
+        WHERE oid = to_regclass('flight_counts') AND relkind = 'm'
+    ) THEN
+        DROP MATERIALIZED VIEW IF EXISTS flight_counts;
+    END IF;
+END;
+$$;
+
+CREATE OR REPLACE VIEW flight_counts AS
 SELECT
     a.model_name,
     al.name AS airline_name,
-    DATE_TRUNC('hour', f.updated_at) AS hour,
-    COUNT(*) AS flight_count
-FROM
-    flights f
-JOIN aircrafts a ON f.aircraft_icao = a.icao_code
-JOIN airlines al ON f.airline_id = al.id
+    c.hour,
+    SUM(c.flight_count) AS flight_count,
+    SUM(c.position_count) AS position_count
+FROM flight_counts_hourly c
+JOIN aircrafts a ON c.aircraft_icao = a.icao_code
+JOIN airlines al ON c.airline_id = al.id
 GROUP BY
     a.model_name,
     al.name,
-    DATE_TRUNC('hour', f.updated_at);
-
--- Создание уникального индекса для материализованного представления
-CREATE UNIQUE INDEX IF NOT EXISTS flight_counts_idx 
-ON flight_counts (model_name, airline_name, hour);
+    c.hour;
 
 -- Индекс для ускорения поиска по ICAO коду
 CREATE INDEX IF NOT EXISTS aircrafts_icao_idx 
@@ -64,4 +252,120 @@ ON aircrafts (icao_code);
 
 INSERT INTO aircrafts (icao_code, model_name)
 VALUES ('UNKNOWN', 'UNKNOWN')
-ON CONFLICT DO NOTHING;
\ No newline at end of file
+ON CONFLICT DO NOTHING;
+
+-- Приведение кодов ICAO, записанных до нормализации при приёме, к виду
+-- scraper.dimensions.normalize_code (без пробелов, в верхнем регистре).
+-- Иначе такие строки выпадают из соединений по равенству кодов. Строки,
+-- совпадающие после приведения, объединяются: ссылки переводятся на
+-- оставшуюся (для авиакомпаний и рейсов — с наименьшим id), повторы
+-- позиций рейса в одно время удаляются. Статистику за затронутые часы
+-- после этого стоит пересчитать (python -m scraper.rollups backfill)
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM airlines WHERE icao_code <> upper(trim(icao_code)))
+        AND NOT EXISTS (SELECT 1 FROM aircrafts WHERE icao_code <> upper(trim(icao_code)))
+        AND NOT EXISTS (SELECT 1 FROM flights WHERE flight_icao <> upper(trim(flight_icao)))
+    THEN
+        RETURN;
+    END IF;
+
+    -- Самолёты: каноническая строка создаётся из первой подходящей,
+    -- ссылки переводятся на неё, прежние строки удаляются
+    INSERT INTO aircrafts (icao_code, model_name, manufacturer)
+    SELECT DISTINCT ON (upper(trim(icao_code)))
+        upper(trim(icao_code)), model_name, manufacturer
+    FROM aircrafts
+    WHERE icao_code <> upper(trim(icao_code)) AND trim(icao_code) <> ''
+    ORDER BY upper(trim(icao_code)), icao_code
+    ON CONFLICT (icao_code) DO NOTHING;
+
+    UPDATE flights SET aircraft_icao = upper(trim(aircraft_icao))
+    WHERE aircraft_icao <> upper(trim(aircraft_icao)) AND trim(aircraft_icao) <> '';
+
+    -- Авиакомпании: остаётся строка с наименьшим id
+    CREATE TEMP TABLE airline_map ON COMMIT DROP AS
+    SELECT id AS old_id, keep_id AS new_id
+    FROM (
+        SELECT id, min(id) OVER (PARTITION BY upper(trim(icao_code))) AS keep_id
+        FROM airlines
+    ) a
+    WHERE id <> keep_id;
+
+    -- Рейсы: совпадают по приведённому коду и итоговой авиакомпании
+    CREATE TEMP TABLE flight_map ON COMMIT DROP AS
+    SELECT id AS old_id, keep_id AS new_id
+    FROM (
+        SELECT f.id, min(f.id) OVER (
+            PARTITION BY upper(trim(f.flight_icao)), COALESCE(am.new_id, f.airline_id)
+        ) AS keep_id
+        FROM flights f
+        LEFT JOIN airline_map am ON am.old_id = f.airline_id
+    ) f
+    WHERE id <> keep_id;
+
+    -- Позиции объединяемых рейсов: из повторов в одно время остаётся
+    -- позиция оставляемого рейса
+    WITH ranked AS (
+        SELECT fp.id, fp.timestamp, row_number() OVER (
+            PARTITION BY COALESCE(fm.new_id, fp.flight_id), fp.timestamp
+            ORDER BY fm.old_id IS NOT NULL, fp.id
+        ) AS rn
+        FROM flight_positions fp
+        LEFT JOIN flight_map fm ON fm.old_id = fp.flight_id
+        WHERE fp.flight_id IN (SELECT old_id FROM flight_map UNION SELECT new_id FROM flight_map)
+    )
+    DELETE FROM flight_positions fp
+    USING ranked r
+    WHERE fp.id = r.id AND fp.timestamp = r.timestamp AND r.rn > 1;
+
+    UPDATE flight_positions fp SET flight_id = fm.new_id
+    FROM flight_map fm
+    WHERE fp.flight_id = fm.old_id;
+
+    INSERT INTO flight_hours (hour, flight_id)
+    SELECT fh.hour, fm.new_id
+    FROM flight_hours fh
+    JOIN flight_map fm ON fm.old_id = fh.flight_id
+    ON CONFLICT DO NOTHING;
+    DELETE FROM flight_hours fh USING flight_map fm WHERE fh.flight_id = fm.old_id;
+
+    DELETE FROM flights f USING flight_map fm WHERE f.id = fm.old_id;
+    UPDATE flights f SET
+        flight_icao = upper(trim(f.flight_icao)),
+        airline_id = COALESCE(
+            (SELECT am.new_id FROM airline_map am WHERE am.old_id = f.airline_id),
+            f.airline_id
+        )
+    WHERE f.flight_icao <> upper(trim(f.flight_icao))
+        OR f.airline_id IN (SELECT old_id FROM airline_map);
+
+    -- Счётчики статистики переносятся на оставшиеся авиакомпании и самолёты
+    INSERT INTO flight_counts_hourly
+        (hour, aircraft_icao, airline_id, flight_count, position_count)
+    SELECT
+        c.hour,
+        CASE WHEN trim(c.aircraft_icao) <> '' THEN upper(trim(c.aircraft_icao)) ELSE c.aircraft_icao END,
+        COALESCE(am.new_id, c.airline_id),
+        SUM(c.flight_count),
+        SUM(c.position_count)
+    FROM flight_counts_hourly c
+    LEFT JOIN airline_map am ON am.old_id = c.airline_id
+    WHERE am.old_id IS NOT NULL
+        OR (c.aircraft_icao <> upper(trim(c.aircraft_icao)) AND trim(c.aircraft_icao) <> '')
+    GROUP BY 1, 2, 3
+    ON CONFLICT (hour, aircraft_icao, airline_id) DO UPDATE SET
+        flight_count = flight_counts_hourly.flight_count + EXCLUDED.flight_count,
+        position_count = flight_counts_hourly.position_count + EXCLUDED.position_count;
+    DELETE FROM flight_counts_hourly c
+    WHERE c.airline_id IN (SELECT old_id FROM airline_map)
+        OR (c.aircraft_icao <> upper(trim(c.aircraft_icao)) AND trim(c.aircraft_icao) <> '');
+
+    DELETE FROM airlines a USING airline_map am WHERE a.id = am.old_id;
+    UPDATE airlines SET icao_code = upper(trim(icao_code))
+    WHERE icao_code <> upper(trim(icao_code));
+
+    DELETE FROM aircrafts
+    WHERE icao_code <> upper(trim(icao_code)) AND trim(icao_code) <> '';
+END;
+$$;
@@ -0,0 +1,85 @@
+"""Формат обмена текущим состоянием рейсов между scraper и dashboard.
+
+Scraper держит по одной записи фиксированной ширины (RECORD) на активный
+рейс и публикует версионированные снимки; dashboard забирает изменения с
+известной ему версии. Модуль общий для обоих сервисов и, как config.py,
+лежит в корне проекта.
+
+Ответ на GET /live?epoch=E&since=V — двоичный:
+
+    HEADER (magic, epoch, version, base, число записей, длина meta)
+    записи RECORD подряд (little-endian)
+    meta — JSON: снятые рейсы и новые строки справочников моделей и
+    авиакомпаний {'removed': [...], 'models': [start, [...]], 'airlines': [start, [...]]}
+
+base = 0 означает полный снимок, иначе — изменения после версии base.
+epoch меняется при каждом запуске scraper: версии другого запуска
+несравнимы, и клиент получает полный снимок.
+"""
+import json
+import struct
+from typing import Any, Dict, List, NamedTuple, Sequence, Tuple
+
+import numpy as np
+
+MAGIC = b'LIV1'
+HEADER = struct.Struct('<4sQQQII')  # magic, epoch, version, base, записей, длина meta
+CONTENT_TYPE = 'application/octet-stream'
+
+RECORD = np.dtype([
+    ('icao', 'S10'),        # ICAO рейса
+    ('latitude', '<f8'),
+    ('longitude', '<f8'),
+    ('altitude', '<f4'),
+    ('timestamp', '<f8'),   # время наблюдения, секунды Unix (UTC)
+    ('model_id', '<i4'),    # индекс в справочнике моделей снимка
+    ('airline_id', '<i4'),  # индекс в справочнике авиакомпаний снимка
+    ('seq', '<u8'),         # номер обновления записи, растёт с каждой новой позицией
+    ('version', '<u8'),     # версия снимка, в которой запись изменилась
+])
+
+
+class Delta(NamedTuple):
+    epoch: int
+    version: int
+    base: int
+    records: np.ndarray
+    removed: List[bytes]
+    models: Tuple[int, List[str]]
+    airlines: Tuple[int, List[str]]
+
+
+def encode(
+    epoch: int,
+    version: int,
+    base: int,
+    records: np.ndarray,
+    removed: Sequence[bytes],
+    models: Tuple[int, Sequence[str]],
+    airlines: Tuple[int, Sequence[str]]
+) -> bytes:
+    meta = json.dumps({
+        'removed': [icao.decode() for icao in removed],
+        'models': [models[0], list(models[1])],
+        'airlines': [airlines[0], list(airlines[1])],
+    }, separators=(',', ':')).encode()
+    body = np.ascontiguousarray(records, dtype=RECORD).tobytes()
+    return HEADER.pack(MAGIC, epoch, version, base, len(records), len(meta)) + body + meta
+
+
+def decode(payload: bytes) -> Delta:
+    magic, epoch, version, base, count, meta_len = HEADER.unpack_from(payload)
+    if magic != MAGIC:
+        raise ValueError("Неизвестный формат снимка")
+    offset = HEADER.size
+    size = count * RECORD.itemsize
+    if len(payload) != offset + size + meta_len:
+        raise ValueError("Неполный снимок")
+    records = np.frombuffer(payload, dtype=RECORD, count=count, offset=offset)
+    meta: Dict[str, Any] = json.loads(payload[offset + size:])
+    return Delta(
+        epoch, version, base, records,
+        [icao.encode() for icao in meta['removed']],
+        (meta['models'][0], meta['models'][1]),
+        (meta['airlines'][0], meta['airlines'][1])
+    )
@@ -0,0 +1,362 @@
+"""Метрики и трассировка этапов для scraper и dashboard.
+
+Счётчики, датчики и гистограммы хранятся в памяти процесса (REGISTRY) и
+отдаются в текстовом формате Prometheus: scraper поднимает для этого
+отдельный HTTP-сервер (start_http_server), dashboard — маршрут /metrics
+своего Flask-приложения. Модуль общий для обоих сервисов и, как config.py,
+лежит в корне проекта.
+
+stage() замеряет этап конвейера: длительность попадает в гистограмму
+aviation_stage_duration_seconds{stage=...}, исключение — в счётчик ошибок.
+Внутри trace() этапы текущего потока или задачи asyncio собираются в
+разбивку цикла, которая логируется, если цикл оказался медленнее порога.
+
+SamplingProfiler периодически снимает стеки всех потоков и копит их в
+формате collapsed stacks (flamegraph.pl, speedscope); снимок отдаётся на
+/profile того же сервера.
+"""
+import logging
+import math
+import sys
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import Counter as StackCounter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+from urllib.parse import parse_qs, urlparse
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+DEFAULT_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0
+)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric(ABC):
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: ожидаются метки {self.labelnames}, получены {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key: LabelValues, extra: Sequence[Tuple[str, str]] = ()) -> str:
+        pairs = list(zip(self.labelnames, key)) + list(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+    @abstractmethod
+    def samples(self) -> List[str]:
+        """Строки значений в текстовом формате Prometheus"""
+
+    def render(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+            *self.samples()
+        ]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        if amount < 0:
+            raise ValueError(f"{self.name}: счётчик не может уменьшаться")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{self._labels(key)} {_format_value(v)}" for key, v in items]
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        # метки -> (счётчики по корзинам, сумма, количество)
+        self._values: Dict[LabelValues, List] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    def count(self, **labels: str) -> int:
+        entry = self._values.get(self._key(labels))
+        return entry[2] if entry else 0
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, (list(e[0]), e[1], e[2])) for key, e in self._values.items())
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                le = self._labels(key, [('le', _format_value(bound))])
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            lines.append(f"{self.name}_sum{self._labels(key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{self._labels(key)} {count}")
+        return lines
+
+
+class Registry:
+    """Метрики процесса. Повторная регистрация имени возвращает ту же метрику.
+
+    Коллекторы вызываются перед каждой выдачей и обновляют датчики, которые
+    дешевле считать по запросу (состояние пула, квота API).
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name: str, documentation: str, labelnames: Sequence[str] = (), **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            elif not isinstance(metric, cls) or metric.labelnames != tuple(labelnames):
+                raise ValueError(f"Метрика {name} уже зарегистрирована с другим типом или метками")
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def add_collector(self, collector: Callable[[], None]) -> None:
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self) -> str:
+        for collector in list(self._collectors):
+            try:
+                collector()
+            except Exception as e:
+                logger.warning(f"Ошибка коллектора метрик: {str(e)}")
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    'aviation_stage_duration_seconds', 'Длительность этапа конвейера', ('stage',)
+)
+STAGE_ERRORS = REGISTRY.counter(
+    'aviation_stage_errors_total', 'Этапы, завершившиеся исключением', ('stage',)
+)
+CYCLE_SECONDS = REGISTRY.histogram(
+    'aviation_cycle_duration_seconds', 'Длительность цикла', ('cycle',)
+)
+
+_spans: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar('spans', default=None)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Замеряет этап; внутри trace() этап попадает и в разбивку цикла"""
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        STAGE_ERRORS.inc(stage=name)
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage=name)
+        spans = _spans.get()
+        if spans is not None:
+            spans.append((name, elapsed))
+
+
+@contextmanager
+def trace(name: str, slow_seconds: Optional[float] = None) -> Iterator[List[Tuple[str, float]]]:
+    """Цикл с разбивкой по этапам; медленный цикл логируется целиком"""
+    outer = _spans.get()
+    spans: List[Tuple[str, float]] = []
+    token = _spans.set(spans)
+    started = time.perf_counter()
+    try:
+        yield spans
+    finally:
+        elapsed = time.perf_counter() - started
+        _spans.reset(token)
+        if outer is not None:
+            outer.extend(spans)
+        CYCLE_SECONDS.observe(elapsed, cycle=name)
+        if slow_seconds is not None and elapsed > slow_seconds:
+            breakdown = ', '.join(f"{stage_name}={duration:.3f}" for stage_name, duration in spans)
+            logger.warning(f"Медленный цикл {name}: {elapsed:.3f} с ({breakdown})")
+
+
+class SamplingProfiler:
+    """Сэмплирующий профилировщик: стеки всех потоков раз в interval секунд"""
+
+    def __init__(self, interval: float = 0.01, max_depth: int = 64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples = 0
+        self._stacks: StackCounter = StackCounter()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _sample(self) -> None:
+        own = threading.get_ident()
+        stacks = []
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own:
+                continue
+            stack = []
+            while frame is not None and len(stack) < self.max_depth:
+                code = frame.f_code
+                stack.append(f"{code.co_filename.rsplit('/', 1)[-1]}:{code.co_name}")
+                frame = frame.f_back
+            stacks.append(';'.join(reversed(stack)))
+        with self._lock:
+            self._stacks.update(stacks)
+            self.samples += 1
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self) -> 'SamplingProfiler':
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def collapsed(self, reset: bool = False) -> str:
+        """Накопленные стеки: строка «кадр;кадр;... число» на стек"""
+        with self._lock:
+            items = self._stacks.most_common()
+            if reset:
+                self._stacks.clear()
+                self.samples = 0
+        return ''.join(f"{stack} {count}\n" for stack, count in items)
+
+
+profiler: Optional[SamplingProfiler] = None
+
+
+def start_profiler(interval: float) -> Optional[SamplingProfiler]:
+    """Запускает общий профилировщик процесса; interval <= 0 — выключен"""
+    global profiler
+    if interval > 0 and profiler is None:
+        profiler = SamplingProfiler(interval).start()
+        logger.info(f"Сэмплирующий профилировщик запущен, интервал {interval} с")
+    return profiler
+
+
+def profile_text(reset: bool = False) -> str:
+    if profiler is None:
+        return ''
+    return profiler.collapsed(reset)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == '/metrics':
+            body = REGISTRY.render()
+        elif url.path == '/profile' and profiler is not None:
+            body = profile_text(reset='reset' in parse_qs(url.query))
+        else:
+            self.send_error(404)
+            return
+        payload = body.encode()
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+def start_http_server(host: str, port: int) -> ThreadingHTTPServer:
+    """Отдаёт /metrics (и /profile) в фоновом потоке"""
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    logger.info(f"Метрики доступны на http://{host}:{server.server_address[1]}/metrics")
+    return server
@@ -0,0 +1,407 @@
+"""Колоночный архив наблюдений (Parquet) для исторической аналитики.
+
+Postgres хранит горячее окно позиций для dashboard, а все нормализованные
+наблюдения каждого цикла (до сжатия треков) дописываются в файлы Parquet
+со сжатием zstd, разложенные по суткам:
+
+    archive/date=2024-05-01/part-20240501T100000-1a2b3c4d.parquet
+
+Наблюдения копятся в памяти и сбрасываются файлом при смене часа, по
+объёму или по времени; строки в файле отсортированы по времени, поэтому
+статистика групп строк отсекает лишнее при чтении по периоду.
+
+Запросы идут через pyarrow.dataset с отбором секций по дате, фильтрами по
+времени, модели и охватывающему прямоугольнику зоны на уровне групп строк
+и чтением файлов через mmap; точная проверка многоугольника зоны
+выполняется уже над прочитанными строками:
+
+    python -m scraper.archive query --since 2024-05-01 --until 2024-05-08 --zone black_sea
+
+Историю из Postgres в архив переносит команда export (серверный курсор,
+по файлу на сутки).
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+import uuid
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from pyarrow import fs
+
+from config import ARCHIVE_CONFIG, GEOFENCE_CELL_SIZE, GEOFENCE_ZONES
+from scraper.database import stream_columns
+from scraper.geofence import GeofenceEngine, Zone, zone_from_config
+from scraper.ingest import FlightRecord
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = pa.schema([
+    ('observed_at', pa.timestamp('us')),
+    ('flight_icao', pa.string()),
+    ('airline_icao', pa.string()),
+    ('airline_name', pa.string()),
+    ('aircraft_icao', pa.string()),
+    ('aircraft_model', pa.string()),
+    ('departure', pa.string()),
+    ('arrival', pa.string()),
+    ('latitude', pa.float64()),
+    ('longitude', pa.float64()),
+    ('altitude', pa.float64()),
+])
+PARTITION_SCHEMA = pa.schema([('date', pa.date32())])
+PARTITIONING = ds.partitioning(PARTITION_SCHEMA, flavor='hive')
+
+
+class ArchiveWriter:
+    """Буфер наблюдений и запись файлов Parquet; ошибки записи не прерывают приём"""
+
+    def __init__(
+        self,
+        path: str,
+        flush_rows: int = 200000,
+        flush_seconds: float = 900,
+        row_group_size: int = 65536,
+        compression: str = 'zstd'
+    ):
+        self.path = path
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self.row_group_size = row_group_size
+        self.compression = compression
+        self._buffer: List[FlightRecord] = []
+        self._hour: Optional[datetime] = None
+        self._started = time.monotonic()
+        self.stats = {'rows': 0, 'files': 0, 'errors': 0}
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> 'ArchiveWriter':
+        return cls(
+            config['path'],
+            flush_rows=config['flush_rows'],
+            flush_seconds=config['flush_seconds'],
+            row_group_size=config['row_group_size'],
+            compression=config['compression']
+        )
+
+    def append(self, records: List[FlightRecord]) -> None:
+        """Добавляет наблюдения цикла (observed_at обязателен)"""
+        for record in records:
+            hour = record.observed_at.replace(minute=0, second=0, microsecond=0)
+            if self._hour is not None and hour != self._hour and self._buffer:
+                self.flush()
+            self._hour = hour
+            self._buffer.append(record)
+        if (
+            len(self._buffer) >= self.flush_rows
+            or time.monotonic() - self._started >= self.flush_seconds
+        ):
+            self.flush()
+
+    def _table(self, records: List[FlightRecord]) -> pa.Table:
+        columns = list(zip(*records))
+        table = pa.Table.from_arrays(
+            [pa.array(columns[FlightRecord._fields.index(field.name)], type=field.type) for field in SCHEMA],
+            schema=SCHEMA
+        )
+        return table.sort_by('observed_at')
+
+    def flush(self) -> Optional[str]:
+        """Пишет буфер в новый файл; возвращает путь файла"""
+        records, self._buffer = self._buffer, []
+        self._started = time.monotonic()
+        if not records:
+            return None
+        first = min(r.observed_at for r in records)
+        directory = os.path.join(self.path, f"date={first.date().isoformat()}")
+        name = f"part-{first:%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}.parquet"
+        target = os.path.join(directory, name)
+        try:
+            os.makedirs(directory, exist_ok=True)
+            # Файл появляется под своим именем только целиком записанным
+            tmp = target + '.tmp'
+            pq.write_table(
+                self._table(records), tmp,
+                compression=self.compression, row_group_size=self.row_group_size
+            )
+            os.replace(tmp, target)
+        except Exception as e:
+            self.stats['errors'] += 1
+            logger.error(f"Ошибка записи архива {target}: {str(e)}")
+            return None
+        self.stats['rows'] += len(records)
+        self.stats['files'] += 1
+        logger.info(f"Архив: {len(records)} наблюдений записано в {target}")
+        return target
+
+    def close(self) -> None:
+        self.flush()
+
+
+# Позиции из Postgres в столбцах SCHEMA; порядок по времени даёт сутки подряд
+EXPORT_QUERY = """
+    SELECT
+        fp.timestamp AS observed_at,
+        f.flight_icao,
+        al.icao_code AS airline_icao,
+        al.name AS airline_name,
+        f.aircraft_icao,
+        a.model_name AS aircraft_model,
+        f.departure_airport AS departure,
+        f.arrival_airport AS arrival,
+        fp.latitude,
+        fp.longitude,
+        fp.altitude
+    FROM flight_positions fp
+    JOIN flights f ON f.id = fp.flight_id
+    JOIN airlines al ON al.id = f.airline_id
+    LEFT JOIN aircrafts a ON a.icao_code = f.aircraft_icao
+    WHERE fp.timestamp >= %(since)s AND fp.timestamp < %(until)s
+    ORDER BY fp.timestamp
+"""
+
+
+class _DayFile:
+    """Файл Parquet одних суток, дописываемый группами строк по мере выгрузки"""
+
+    def __init__(self, path: str, day: date, first: datetime, row_group_size: int, compression: str):
+        directory = os.path.join(path, f"date={day.isoformat()}")
+        os.makedirs(directory, exist_ok=True)
+        self.target = os.path.join(
+            directory, f"part-export-{first:%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}.parquet"
+        )
+        self.row_group_size = row_group_size
+        self._writer = pq.ParquetWriter(self.target + '.tmp', SCHEMA, compression=compression)
+        self._pending: List[pa.Table] = []
+        self._pending_rows = 0
+
+    def write(self, table: pa.Table) -> None:
+        # Блоки курсора мельче группы строк: копим до row_group_size
+        self._pending.append(table)
+        self._pending_rows += table.num_rows
+        if self._pending_rows >= self.row_group_size:
+            self._flush()
+
+    def _flush(self) -> None:
+        if self._pending:
+            self._writer.write_table(pa.concat_tables(self._pending), row_group_size=self.row_group_size)
+            self._pending, self._pending_rows = [], 0
+
+    def close(self) -> str:
+        self._flush()
+        self._writer.close()
+        os.replace(self.target + '.tmp', self.target)
+        return self.target
+
+    def abort(self) -> None:
+        self._writer.close()
+        os.remove(self.target + '.tmp')
+
+
+def export_from_db(
+    path: str,
+    since: datetime,
+    until: datetime,
+    fetch_size: Optional[int] = None,
+    row_group_size: int = ARCHIVE_CONFIG['row_group_size'],
+    compression: str = ARCHIVE_CONFIG['compression']
+) -> int:
+    """Выгружает позиции за период из Postgres в архив, по файлу на сутки.
+
+    Строки читаются серверным курсором блоками по столбцам, поэтому память
+    не зависит от длины периода. Возвращает число выгруженных строк.
+    """
+    rows = 0
+    current: Optional[_DayFile] = None
+    current_day = None
+    try:
+        for chunk in stream_columns(EXPORT_QUERY, {'since': since, 'until': until}, fetch_size):
+            table = pa.Table.from_arrays(
+                [pa.array(chunk[field.name], type=field.type, from_pandas=True) for field in SCHEMA],
+                schema=SCHEMA
+            )
+            days = chunk['observed_at'].astype('datetime64[D]')
+            starts = np.flatnonzero(np.r_[True, days[1:] != days[:-1]]).tolist()
+            for start, end in zip(starts, starts[1:] + [len(days)]):
+                day = days[start].item()
+                if day != current_day:
+                    if current is not None:
+                        logger.info(f"Выгружены сутки {current_day}: {current.close()}")
+                    current = _DayFile(
+                        path, day, chunk['observed_at'][start].item(), row_group_size, compression
+                    )
+                    current_day = day
+                current.write(table.slice(start, end - start))
+            rows += table.num_rows
+        if current is not None:
+            logger.info(f"Выгружены сутки {current_day}: {current.close()}")
+            current = None
+    finally:
+        if current is not None:
+            current.abort()
+    return rows
+
+
+def _zone(name: str) -> Zone:
+    for spec in GEOFENCE_ZONES:
+        if spec['name'] == name:
+            return zone_from_config(spec)
+    raise ValueError(f"Неизвестная зона: {name}")
+
+
+def _bbox(zone: Zone):
+    if zone.bbox is not None:
+        return zone.bbox
+    lats = [v[0] for v in zone.polygon]
+    lons = [v[1] for v in zone.polygon]
+    if max(lons) - min(lons) > 180:  # через антимеридиан
+        east = [lon for lon in lons if lon >= 0]
+        west = [lon for lon in lons if lon < 0]
+        return min(lats), min(east), max(lats), max(west)
+    return min(lats), min(lons), max(lats), max(lons)
+
+
+class ArchiveReader:
+    """Выборки из архива по периоду, зоне и модели"""
+
+    def __init__(self, path: str = ARCHIVE_CONFIG['path']):
+        self.path = path
+
+    def dataset(self) -> ds.Dataset:
+        return ds.dataset(
+            self.path,
+            schema=pa.unify_schemas([SCHEMA, PARTITION_SCHEMA]),
+            format='parquet',
+            partitioning=PARTITIONING,
+            filesystem=fs.LocalFileSystem(use_mmap=True),
+            exclude_invalid_files=True,
+            ignore_prefixes=['.', '_']
+        )
+
+    def scan(
+        self,
+        since: datetime,
+        until: datetime,
+        zone: Optional[str] = None,
+        models: Optional[Sequence[str]] = None,
+        columns: Optional[Sequence[str]] = None
+    ) -> pa.Table:
+        """Наблюдения за [since, until); models — коды ICAO или названия моделей"""
+        if not os.path.isdir(self.path):
+            return SCHEMA.empty_table()
+        observed = ds.field('observed_at')
+        expr = (
+            (ds.field('date') >= since.date())
+            & (ds.field('date') <= (until - timedelta(microseconds=1)).date())
+            & (observed >= pa.scalar(since, pa.timestamp('us')))
+            & (observed < pa.scalar(until, pa.timestamp('us')))
+        )
+        if models:
+            models = list(models)
+            expr &= ds.field('aircraft_icao').isin(models) | ds.field('aircraft_model').isin(models)
+
+        geofence = None
+        if zone is not None:
+            zone_def = _zone(zone)
+            min_lat, min_lon, max_lat, max_lon = _bbox(zone_def)
+            lon = ds.field('longitude')
+            expr &= (ds.field('latitude') >= min_lat) & (ds.field('latitude') <= max_lat)
+            if min_lon <= max_lon:
+                expr &= (lon >= min_lon) & (lon <= max_lon)
+            else:
+                expr &= (lon >= min_lon) | (lon <= max_lon)
+            if zone_def.polygon is not None:
+                geofence = GeofenceEngine([zone_def], cell_size=GEOFENCE_CELL_SIZE)
+
+        read_columns = list(columns) if columns else SCHEMA.names
+        if geofence is not None:
+            read_columns += [c for c in ('latitude', 'longitude') if c not in read_columns]
+        table = self.dataset().to_table(columns=read_columns, filter=expr)
+
+        if geofence is not None and table.num_rows:
+            inside = geofence.classify(
+                table['latitude'].to_numpy(), table['longitude'].to_numpy()
+            )[:, 0]
+            table = table.filter(pa.array(inside))
+            if columns:
+                table = table.select(list(columns))
+        return table
+
+    def partitions(self) -> List[date]:
+        if not os.path.isdir(self.path):
+            return []
+        return sorted(
+            date.fromisoformat(name.split('=', 1)[1])
+            for name in os.listdir(self.path) if name.startswith('date=')
+        )
+
+
+def _parse_time(value: str) -> datetime:
+    """Время ISO; со смещением переводится в UTC без зоны, как время в архиве"""
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Колоночный архив наблюдений")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    query = subparsers.add_parser('query', help="выборка за период")
+    query.add_argument('--since', type=_parse_time, required=True, help="начало периода (ISO, UTC)")
+    query.add_argument('--until', type=_parse_time, help="конец периода (ISO, UTC), по умолчанию — сейчас")
+    query.add_argument('--zone', help="имя зоны из GEOFENCE_ZONES")
+    query.add_argument('--model', action='append', help="код ICAO или модель самолёта (можно несколько)")
+    query.add_argument('--columns', help="столбцы через запятую")
+    query.add_argument('--output', help="файл .parquet или .csv для результата")
+    subparsers.add_parser('partitions', help="сутки, за которые есть данные")
+    export = subparsers.add_parser('export', help="выгрузить позиции за период из Postgres")
+    export.add_argument('--since', type=_parse_time, required=True, help="начало периода (ISO, UTC)")
+    export.add_argument('--until', type=_parse_time, help="конец периода (ISO, UTC), по умолчанию — сейчас")
+    export.add_argument('--fetch-size', type=int, help="строк за один FETCH")
+    parser.add_argument('--path', default=ARCHIVE_CONFIG['path'], help="каталог архива")
+    args = parser.parse_args(argv)
+
+    reader = ArchiveReader(args.path)
+    if args.command == 'partitions':
+        for day in reader.partitions():
+            print(day.isoformat())
+        return 0
+
+    started = time.perf_counter()
+    until = args.until or datetime.now(timezone.utc).replace(tzinfo=None)
+    if args.command == 'export':
+        rows = export_from_db(args.path, args.since, until, args.fetch_size)
+        logger.info(f"Выгружено строк: {rows} за {time.perf_counter() - started:.1f} с")
+        return 0
+
+    table = reader.scan(
+        args.since,
+        until,
+        zone=args.zone,
+        models=args.model,
+        columns=args.columns.split(',') if args.columns else None
+    )
+    elapsed = time.perf_counter() - started
+    if args.output and args.output.endswith('.parquet'):
+        pq.write_table(table, args.output, compression='zstd')
+    elif args.output:
+        table.to_pandas().to_csv(args.output, index=False)
+    else:
+        print(table.slice(0, 20).to_pandas().to_string())
+    logger.info(f"Строк: {table.num_rows}, время выборки {elapsed:.3f} с")
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s [%(levelname)s] %(module)s:%(lineno)d - %(message)s'
+    )
+    sys.exit(main())
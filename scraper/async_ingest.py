@@ -0,0 +1,213 @@
+"""Пакетная запись рейсов через asyncpg для режима asyncio (scraper.async_main).
+
+Запросы те же, что в scraper.ingest, но строки передаются массивами по
+столбцам через unnest(): asyncpg не раскрывает VALUES %s на клиенте, а один
+запрос с массивами даёт тот же set-based план. Подготовка строк, порядок
+ключей и работа с кэшем справочников общие с синхронной записью.
+"""
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List, Optional, Sequence, Tuple
+
+import asyncpg
+
+from config import DB_CONFIG, DB_POOL_CONFIG
+from metrics import stage
+from scraper.database import POOL_WAIT_SECONDS
+from scraper.dimensions import Dimensions
+from scraper.ingest import (
+    AIRCRAFTS_UPSERT, AIRLINES_UPSERT, FLIGHTS_UPSERT, POSITIONS_INSERT, ROWS_WRITTEN,
+    FlightRecord, changed_aircrafts, flight_rows, position_rows, rollup_rows, split_airlines
+)
+from scraper.rollups import ROLLUP_UPSERT, UNKNOWN_AIRCRAFT
+
+logger = logging.getLogger(__name__)
+
+# Ошибки соединения: транзакцию имеет смысл повторить целиком
+RETRYABLE_ERRORS = (
+    OSError,
+    asyncio.TimeoutError,
+    asyncpg.PostgresConnectionError,
+    asyncpg.InterfaceError,
+    asyncpg.exceptions.OperatorInterventionError,
+    asyncpg.exceptions.TooManyConnectionsError,
+)
+# Ошибки данных: пакет повторяется по одной записи, как в save_flight_records
+DATA_ERRORS = (asyncpg.DataError, asyncpg.IntegrityConstraintViolationError)
+
+
+def _unnest(query: str, source: str) -> str:
+    """Подставляет выборку из массивов вместо VALUES %s"""
+    if 'VALUES %s' not in query:
+        raise ValueError("Запрос без VALUES %s")
+    return query.replace('VALUES %s', source)
+
+
+AIRCRAFTS_UPSERT_ARRAYS = _unnest(
+    AIRCRAFTS_UPSERT, "SELECT * FROM unnest($1::varchar[], $2::varchar[])"
+)
+AIRLINES_UPSERT_ARRAYS = _unnest(
+    AIRLINES_UPSERT, "SELECT * FROM unnest($1::varchar[], $2::varchar[])"
+)
+FLIGHTS_UPSERT_ARRAYS = _unnest(
+    FLIGHTS_UPSERT,
+    "SELECT * FROM unnest($1::varchar[], $2::varchar[], $3::integer[], $4::varchar[], $5::varchar[])"
+)
+POSITIONS_INSERT_ARRAYS = _unnest(
+    POSITIONS_INSERT,
+    "SELECT f, lat, lon, alt, COALESCE(ts, LOCALTIMESTAMP) "
+    "FROM unnest($1::integer[], $2::float8[], $3::float8[], $4::float8[], $5::timestamp[]) "
+    "AS p (f, lat, lon, alt, ts)"
+)
+ROLLUP_UPSERT_ARRAYS = _unnest(
+    ROLLUP_UPSERT,
+    "SELECT f, a, l, date_trunc('hour', COALESCE(ts, LOCALTIMESTAMP)) "
+    "FROM unnest($1::integer[], $2::varchar[], $3::integer[], $4::timestamp[]) "
+    "AS r (f, a, l, ts)"
+)
+
+WARM_AIRLINES = "SELECT id, icao_code, name FROM airlines ORDER BY id DESC LIMIT $1"
+WARM_AIRCRAFTS = "SELECT icao_code, model_name FROM aircrafts LIMIT $1"
+
+
+def _columns(rows: Sequence[Tuple]) -> List[list]:
+    return [list(column) for column in zip(*rows)]
+
+
+async def create_pool() -> asyncpg.Pool:
+    """Пул asyncpg по DB_CONFIG/DB_POOL_CONFIG.
+
+    Соединения открываются по требованию (min_size=0), чтобы опрос API
+    запускался и при недоступной БД.
+    """
+    return await asyncpg.create_pool(
+        host=DB_CONFIG['host'],
+        port=int(DB_CONFIG['port']),
+        user=DB_CONFIG['user'],
+        password=DB_CONFIG['password'],
+        database=DB_CONFIG['dbname'],
+        min_size=0,
+        max_size=DB_POOL_CONFIG['max_size'],
+        max_inactive_connection_lifetime=DB_POOL_CONFIG['max_lifetime']
+    )
+
+
+@asynccontextmanager
+async def acquire(pool: asyncpg.Pool) -> AsyncIterator[asyncpg.Connection]:
+    started = time.perf_counter()
+    async with pool.acquire(timeout=DB_POOL_CONFIG['acquire_timeout']) as conn:
+        POOL_WAIT_SECONDS.observe(time.perf_counter() - started)
+        yield conn
+
+
+async def warm_dimensions(conn: asyncpg.Connection, dimensions: Dimensions) -> None:
+    airlines = await conn.fetch(WARM_AIRLINES, dimensions.max_size)
+    aircrafts = await conn.fetch(WARM_AIRCRAFTS, dimensions.max_size)
+    dimensions.load(airlines, aircrafts)
+
+
+async def write_flight_batch(
+    conn: asyncpg.Connection,
+    records: List[FlightRecord],
+    dimensions: Dimensions
+) -> int:
+    """Записывает пакет в текущей транзакции; см. scraper.ingest.write_flight_batch"""
+    if not records:
+        return 0
+
+    changed = changed_aircrafts(records, dimensions)
+    if changed:
+        with stage('db.aircrafts_upsert'):
+            rows = await conn.fetch(AIRCRAFTS_UPSERT_ARRAYS, *_columns(changed))
+        ROWS_WRITTEN.inc(len(changed), table='aircrafts')
+        for icao, model_name in rows:
+            dimensions.aircrafts.stage(icao, icao, model_name)
+
+    airline_ids, changed = split_airlines(records, dimensions)
+    if changed:
+        names = dict(changed)
+        with stage('db.airlines_upsert'):
+            rows = await conn.fetch(AIRLINES_UPSERT_ARRAYS, *_columns(changed))
+        ROWS_WRITTEN.inc(len(changed), table='airlines')
+        for airline_id, icao in rows:
+            airline_ids[icao] = airline_id
+            dimensions.airlines.stage(icao, airline_id, names[icao])
+
+    flights = flight_rows(records, airline_ids)
+    with stage('db.flights_upsert'):
+        rows = await conn.fetch(FLIGHTS_UPSERT_ARRAYS, *_columns(flights))
+    ROWS_WRITTEN.inc(len(flights), table='flights')
+    flight_ids = {(flight_icao, airline_id): flight_id for flight_id, flight_icao, airline_id in rows}
+
+    positions = position_rows(records, airline_ids, flight_ids)
+    with stage('db.positions_insert'):
+        inserted = await conn.fetch(POSITIONS_INSERT_ARRAYS, *_columns(positions))
+    ROWS_WRITTEN.inc(len(positions), table='flight_positions')
+
+    rollups = [
+        (flight_id, aircraft or UNKNOWN_AIRCRAFT, airline_id, observed_at)
+        for flight_id, aircraft, airline_id, observed_at
+        in rollup_rows(records, airline_ids, flight_ids, inserted)
+    ]
+    if rollups:
+        with stage('db.rollups_upsert'):
+            await conn.execute(ROLLUP_UPSERT_ARRAYS, *_columns(rollups))
+    return len(inserted)
+
+
+async def save_flight_records(
+    conn: asyncpg.Connection,
+    records: List[FlightRecord],
+    dimensions: Optional[Dimensions] = None
+) -> Tuple[int, int]:
+    """Сохраняет пакет одной транзакцией. Возвращает (успешно, ошибок).
+
+    Как и scraper.ingest.save_flight_records: при ошибке данных записи
+    повторяются по одной во вложенных транзакциях (SAVEPOINT), ошибки
+    соединения пробрасываются вызывающему.
+    """
+    if dimensions is None:
+        dimensions = Dimensions(max_size=0)
+
+    try:
+        if not dimensions.warmed:
+            await warm_dimensions(conn, dimensions)
+        transaction = conn.transaction()
+        await transaction.start()
+        try:
+            saved = await write_flight_batch(conn, records, dimensions)
+        except BaseException:
+            await transaction.rollback()
+            raise
+        with stage('db.commit'):
+            await transaction.commit()
+        dimensions.commit()
+        return saved, 0
+    except DATA_ERRORS as e:
+        # Нарушение ссылок может означать устаревшие id в кэше
+        dimensions.clear()
+        logger.warning(f"Пакет отклонён БД, сохраняем рейсы по одному: {str(e)}")
+    except BaseException:
+        dimensions.discard()
+        raise
+
+    success_count = 0
+    failure_count = 0
+    try:
+        async with conn.transaction():
+            for idx, record in enumerate(records):
+                mark = dimensions.savepoint()
+                try:
+                    async with conn.transaction():
+                        success_count += await write_flight_batch(conn, [record], dimensions)
+                except DATA_ERRORS as e:
+                    dimensions.rollback_to(mark)
+                    logger.error(f"Ошибка сохранения рейса #{idx} ({record.flight_icao}): {str(e)}")
+                    failure_count += 1
+        dimensions.commit()
+    except BaseException:
+        dimensions.discard()
+        raise
+    return success_count, failure_count
@@ -0,0 +1,380 @@
+"""Режим asyncio для scraper: один поток, без потока на запрос.
+
+Страницы API забираются параллельно через aiohttp в пределах
+FETCH_CONFIG['max_workers'] одновременных запросов и общего RateLimiter;
+повторы повторяют политику requests/urllib3 из RETRY_CONFIG['api']. Пакеты
+цикла, как и в основном режиме, сначала пишутся в журнал на диске, а
+записывает их отдельная задача через пул asyncpg, поэтому опрос следующего
+цикла идёт одновременно с записью предыдущего. Недоступная БД
+повторяется с растущей задержкой (INGEST_CONFIG), пакеты копятся в журнале.
+
+По SIGINT/SIGTERM опрос прекращается, писатель дописывает очередь и журнал
+в пределах INGEST_CONFIG['shutdown_timeout']; незаписанное остаётся в
+журнале до следующего запуска.
+
+    python -m scraper.async_main
+"""
+import asyncio
+import logging
+import signal
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import aiohttp
+
+from config import (
+    API_KEY, API_URL, FETCH_CONFIG, INGEST_CONFIG, LIVE_STATE_CONFIG, METRICS_CONFIG, RETRY_CONFIG
+)
+from metrics import REGISTRY, stage, start_http_server, start_profiler, trace
+from scraper import async_ingest
+from scraper.ingest import FlightRecord
+from scraper.livestate import start_server as start_live_server
+from scraper.main import (
+    API_REQUESTS, FRESHNESS_LAG, SCHEDULE_LAG, FlightTracker, count_rows, freshness_lag,
+    merge_flights, remaining_offsets
+)
+from scraper.ratelimit import RateLimiter, RequestBudgetExceeded
+from scraper.spool import Spool
+from scraper.writer import IngestWriter
+
+logger = logging.getLogger(__name__)
+
+# Как status_forcelist в FlightTracker._configure_session
+RETRY_STATUSES = {500, 502, 503, 504}
+
+
+class _RetryStatus(Exception):
+    """Ответ API с кодом из RETRY_STATUSES"""
+
+    def __init__(self, status: int, retry_after: Optional[str] = None):
+        super().__init__(f"HTTP {status}")
+        try:
+            self.retry_after = float(retry_after) if retry_after is not None else None
+        except ValueError:
+            self.retry_after = None
+
+
+class AsyncIngestWriter(IngestWriter):
+    """IngestWriter, выполняемый задачей asyncio с асинхронной функцией записи"""
+
+    def __init__(
+        self,
+        spool: Spool,
+        write: Callable[[List[FlightRecord]], Awaitable[Tuple[int, int]]],
+        **kwargs: Any
+    ):
+        super().__init__(spool, write, **kwargs)
+        self._wakeup: Optional[asyncio.Event] = None
+        self._stopping: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._draining = False
+
+    async def submit_async(self, records: List[FlightRecord]) -> int:
+        """Пишет пакет в журнал вне цикла событий (fsync) и будит писателя"""
+        seq = await asyncio.to_thread(self.submit, records)
+        self._wakeup.set()
+        return seq
+
+    async def _sleep(self, delay: float) -> None:
+        """Пауза перед повтором; при остановке короче, чтобы успеть дописать журнал"""
+        if self._draining:
+            await asyncio.sleep(min(delay, self.retry_base_delay))
+            return
+        try:
+            await asyncio.wait_for(self._stopping.wait(), timeout=delay)
+        except asyncio.TimeoutError:
+            pass
+
+    async def flush_once_async(self) -> bool:
+        """Записывает одну транзакцию; False, если писать нечего"""
+        records, last, oldest = await asyncio.to_thread(self._next_batch)
+        if last == self.spool.acked:
+            return False
+
+        attempt = 0
+        while True:
+            try:
+                with stage('writer.write'):
+                    saved, failed = await self.write(records) if records else (0, 0)
+                break
+            except async_ingest.RETRYABLE_ERRORS as e:
+                # При остановке повторы ограничены timeout в stop_async()
+                attempt += 1
+                await self._sleep(self._retry_delay(attempt, e))
+            except Exception as e:
+                await asyncio.to_thread(self._reject, last, records, e)
+                saved, failed = 0, len(records)
+                break
+
+        await asyncio.to_thread(self.spool.ack, last)
+        self._complete(records, oldest, saved, failed)
+        return True
+
+    async def _run_async(self) -> None:
+        while True:
+            try:
+                if await self.flush_once_async():
+                    continue
+            except Exception as e:
+                logger.error(f"Ошибка писателя: {str(e)}", exc_info=True)
+                await asyncio.sleep(self.retry_base_delay)
+                continue
+            if self._draining:
+                return
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=1.0)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self) -> 'AsyncIngestWriter':
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._stopping = asyncio.Event()
+            self._task = asyncio.create_task(self._run_async(), name='ingest-writer')
+        return self
+
+    async def stop_async(self, timeout: Optional[float] = None) -> None:
+        """Дописывает очередь и журнал; по истечении timeout прерывает запись"""
+        self._draining = True
+        if self._task is not None:
+            self._stopping.set()
+            self._wakeup.set()
+            try:
+                await asyncio.wait_for(asyncio.shield(self._task), timeout)
+            except asyncio.TimeoutError:
+                logger.warning(
+                    f"Писатель не успел за {timeout} с, в журнале остаётся "
+                    f"{self.spool.pending} пакетов"
+                )
+                self._task.cancel()
+                try:
+                    await self._task
+                except asyncio.CancelledError:
+                    pass
+            self._task = None
+        self.spool.close()
+
+
+class AsyncFlightTracker(FlightTracker):
+    """FlightTracker с асинхронными HTTP, записью в БД и ожиданием"""
+
+    def __init__(self, api_url: str = API_URL):
+        super().__init__(api_url)
+        self.http: Optional[aiohttp.ClientSession] = None
+        self.pool = None
+        self.writer: Optional[AsyncIngestWriter] = None
+        self._stop: Optional[asyncio.Event] = None
+
+    async def _get_json(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """GET с повторами по RETRY_CONFIG['api'], как Retry из urllib3"""
+        max_retries = RETRY_CONFIG['api']['max_retries']
+        backoff_factor = RETRY_CONFIG['api']['backoff_factor']
+        attempt = 0
+        while True:
+            try:
+                async with self.http.get(self.api_url, params=params) as response:
+                    if response.status in RETRY_STATUSES and attempt < max_retries:
+                        retry_after = response.headers.get('Retry-After')
+                        raise _RetryStatus(response.status, retry_after)
+                    response.raise_for_status()
+                    return await response.json(content_type=None)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError, _RetryStatus) as e:
+                if attempt >= max_retries:
+                    raise
+                attempt += 1
+                # Первый повтор сразу, дальше backoff_factor * 2^(n-1)
+                delay = backoff_factor * (2 ** (attempt - 1)) if attempt > 1 else 0.0
+                if isinstance(e, _RetryStatus) and e.retry_after is not None:
+                    delay = max(delay, e.retry_after)
+                logger.warning(f"Повтор запроса к API ({attempt}/{max_retries}) через {delay:.1f} с: {e!r}")
+                await asyncio.sleep(delay)
+
+    async def _fetch_page_async(self, offset: int, limiter: RateLimiter) -> Optional[Dict[str, Any]]:
+        delay = limiter.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        API_REQUESTS.inc()
+        with stage('fetch_page'):
+            params = {
+                "access_key": API_KEY,
+                "flight_status": "active",
+                "limit": FETCH_CONFIG['page_size'],
+                "offset": offset
+            }
+            # requests пропускает параметры со значением None, aiohttp — нет
+            data = await self._get_json({k: v for k, v in params.items() if v is not None})
+
+        if not isinstance(data.get('data'), list):
+            logger.error(f"Некорректный формат ответа API (offset={offset})")
+            return None
+        return data
+
+    async def _fetch_remaining_pages_async(
+        self, offsets: List[int], limiter: RateLimiter
+    ) -> List[List[Dict[str, Any]]]:
+        semaphore = asyncio.Semaphore(FETCH_CONFIG['max_workers'])
+
+        async def fetch(offset: int) -> Optional[Dict[str, Any]]:
+            async with semaphore:
+                try:
+                    return await self._fetch_page_async(offset, limiter)
+                except RequestBudgetExceeded:
+                    return None
+                except Exception as e:
+                    logger.error(f"Ошибка при получении страницы offset={offset}: {str(e)}")
+                    return None
+
+        results = await asyncio.gather(*(fetch(offset) for offset in offsets))
+        return [page['data'] for page in results if page is not None]
+
+    async def fetch_flights_async(self, paginated: Optional[bool] = None) -> List[Dict[str, Any]]:
+        """Асинхронный вариант FlightTracker.fetch_flights"""
+        if paginated is None:
+            paginated = FETCH_CONFIG['paginated']
+        limiter = RateLimiter(
+            rate=FETCH_CONFIG['requests_per_second'],
+            burst=FETCH_CONFIG['burst'],
+            budget=FETCH_CONFIG['max_requests_per_cycle'] if paginated else 1
+        )
+
+        try:
+            first = await self._fetch_page_async(0, limiter)
+            if first is None:
+                return []
+            if not paginated:
+                return first['data']
+
+            offsets = remaining_offsets(first.get('pagination') or {}, len(first['data']))
+            if limiter.remaining is not None and len(offsets) > limiter.remaining:
+                logger.warning(
+                    f"Бюджет запросов позволяет получить {limiter.remaining} "
+                    f"из {len(offsets)} оставшихся страниц"
+                )
+                offsets = offsets[:limiter.remaining]
+
+            pages = [first['data']]
+            if offsets:
+                pages.extend(await self._fetch_remaining_pages_async(offsets, limiter))
+            flights = merge_flights(pages)
+            logger.info(f"Получено {len(flights)} рейсов за {limiter.used} запросов")
+            return flights
+
+        except Exception as e:
+            logger.error(f"Ошибка при получении данных: {str(e)}")
+            return []
+
+        finally:
+            self.last_request_count = limiter.used
+
+    async def write_records_async(self, records: List[FlightRecord]) -> Tuple[int, int]:
+        """Пишет записи одной транзакцией; ошибки соединения пробрасываются писателю"""
+        async with async_ingest.acquire(self.pool) as conn:
+            saved, failed = await async_ingest.save_flight_records(conn, records, self.dimensions)
+        count_rows('saved', saved)
+        count_rows('failed', failed)
+        logger.info(f"Записано в БД: Успешно {saved}, Ошибок {failed}")
+        return saved, failed
+
+    async def _wait(self, delay: float) -> bool:
+        """Ждёт delay секунд; True, если за это время пришла остановка"""
+        try:
+            await asyncio.wait_for(self._stop.wait(), timeout=delay)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def run_cycle(self) -> None:
+        with trace('scraper', METRICS_CONFIG['slow_cycle_seconds']):
+            with stage('fetch'):
+                flights = await self.fetch_flights_async()
+            self.scheduler.record_requests(self.last_request_count)
+            count_rows('fetched', len(flights))
+            if not flights:
+                logger.warning("Нет данных о рейсах")
+                self.scheduler.failure()
+                return
+            lag = freshness_lag(flights)
+            if lag is not None:
+                FRESHNESS_LAG.set(lag)
+
+            filtered = self.filter_flights(flights)
+            count_rows('filtered', len(filtered))
+            if not filtered:
+                logger.info("Нет рейсов в зоне интереса")
+                records = self.finish_tracks()
+            else:
+                records, _ = self.prepare_records(filtered)
+            if records:
+                with stage('enqueue'):
+                    await self.writer.submit_async(records)
+            self.scheduler.success(filtered)
+
+    async def run_async(self) -> None:
+        logger.info("Сервис мониторинга запущен (asyncio)")
+        REGISTRY.add_collector(self._collect_metrics)
+        loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, self._stop.set)
+
+        self.session.close()  # синхронная сессия requests в этом режиме не нужна
+        self.http = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=max(10, FETCH_CONFIG['max_workers'])),
+            timeout=aiohttp.ClientTimeout(total=FETCH_CONFIG['timeout'])
+        )
+        self.pool = await async_ingest.create_pool()
+        self.writer = AsyncIngestWriter(
+            Spool(
+                INGEST_CONFIG['spool_path'],
+                segment_bytes=INGEST_CONFIG['segment_bytes'],
+                fsync=INGEST_CONFIG['fsync']
+            ),
+            self.write_records_async,
+            max_queue=INGEST_CONFIG['queue_max_batches'],
+            max_batch_records=INGEST_CONFIG['max_batch_records'],
+            retry_base_delay=INGEST_CONFIG['retry_base_delay'],
+            retry_max_delay=INGEST_CONFIG['retry_max_delay']
+        ).start()
+
+        try:
+            while not self._stop.is_set():
+                try:
+                    # Обслуживание секций идёт через синхронный пул в отдельном потоке
+                    with stage('maintenance'):
+                        await asyncio.to_thread(self.maintenance.run_if_due)
+                    if self.live is not None:
+                        self.live.expire()
+                    if await self._wait(self.scheduler.delay()):
+                        break
+                    self.scheduler.mark_started()
+                    SCHEDULE_LAG.set(self.scheduler.last_lag)
+                    await self.run_cycle()
+                except Exception as e:
+                    logger.error(f"Критическая ошибка: {str(e)}", exc_info=True)
+                    self.scheduler.failure()
+        finally:
+            logger.info("Остановка: дописываем накопленные пакеты")
+            records = self.finish_tracks(flush=True)
+            if records:
+                await self.writer.submit_async(records)
+            await self.writer.stop_async(timeout=INGEST_CONFIG['shutdown_timeout'])
+            if self.archive is not None:
+                self.archive.close()
+            await self.http.close()
+            await self.pool.close()
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                loop.remove_signal_handler(sig)
+
+
+def main() -> None:
+    if METRICS_CONFIG['enabled']:
+        start_http_server(METRICS_CONFIG['host'], METRICS_CONFIG['port'])
+        start_profiler(METRICS_CONFIG['profiler_interval'])
+    tracker = AsyncFlightTracker()
+    if tracker.live is not None:
+        start_live_server(tracker.live, LIVE_STATE_CONFIG['host'], LIVE_STATE_CONFIG['port'])
+    asyncio.run(tracker.run_async())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,33 +1,275 @@
 import psycopg2 # type: ignore
-from psycopg2.extras import RealDictCursor # type: ignore
+from psycopg2 import sql  # type: ignore
+from psycopg2.extras import RealDictCursor, execute_values # type: ignore
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE  # type: ignore
 from contextlib import contextmanager
-from config import DB_CONFIG, RETRY_CONFIG, LOGGING_CONFIG
-from typing import Optional, Union, List, Dict
+from config import DB_CONFIG, DB_POOL_CONFIG, DB_STREAM_CONFIG, RETRY_CONFIG
+from metrics import REGISTRY, stage
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
 from psycopg2.extensions import cursor as Cursor, connection as Connection  # type: ignore
+from datetime import date, datetime
+from itertools import islice
+import numpy as np
 import logging
+import threading
 import time
-import logging.config
+import uuid
 
-logging.config.dictConfig(LOGGING_CONFIG)
 logger = logging.getLogger(__name__)
 
-@contextmanager
-def get_db_connection():
-    """Контекстный менеджер для подключения к БД с повторными попытками"""
-    for attempt in range(RETRY_CONFIG['db']['max_retries']):
+POOL_WAIT_SECONDS = REGISTRY.histogram(
+    'aviation_db_pool_wait_seconds', 'Ожидание соединения из пула'
+)
+POOL_CONNECTIONS = REGISTRY.gauge(
+    'aviation_db_pool_connections', 'Соединения пула по состоянию', ('state',)
+)
+ROWS_STREAMED = REGISTRY.counter(
+    'aviation_db_rows_streamed_total', 'Строк прочитано серверными курсорами'
+)
+ROWS_BULK_WRITTEN = REGISTRY.counter(
+    'aviation_db_rows_bulk_written_total', 'Строк записано пакетной записью', ('method',)
+)
+
+# Ошибки соединения: пакетную запись имеет смысл повторить целиком
+RETRYABLE_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError)
+
+
+class PoolTimeout(RuntimeError):
+    """Свободное соединение не появилось за acquire_timeout"""
+
+
+class ConnectionFailed(RuntimeError):
+    """Не удалось открыть соединение с БД за RETRY_CONFIG['db']['max_retries'] попыток"""
+
+
+class ConnectionPool:
+    """Потокобезопасный пул соединений psycopg2.
+
+    Соединение, простаивавшее дольше health_check_interval, перед выдачей
+    проверяется запросом SELECT 1; сломанные и слишком старые соединения
+    пересоздаются. Новые соединения открываются с повторными попытками
+    и экспоненциальной задержкой по RETRY_CONFIG['db'].
+    """
+
+    def __init__(
+        self,
+        dsn_params: Optional[Dict[str, Any]] = None,
+        min_size: int = DB_POOL_CONFIG['min_size'],
+        max_size: int = DB_POOL_CONFIG['max_size'],
+        acquire_timeout: float = DB_POOL_CONFIG['acquire_timeout'],
+        health_check_interval: float = DB_POOL_CONFIG['health_check_interval'],
+        max_lifetime: Optional[float] = DB_POOL_CONFIG['max_lifetime']
+    ):
+        if not 0 <= min_size <= max_size or max_size < 1:
+            raise ValueError("Требуется 0 <= min_size <= max_size и max_size >= 1")
+        self.dsn_params = dict(dsn_params or DB_CONFIG)
+        self.min_size = min_size
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.health_check_interval = health_check_interval
+        self.max_lifetime = max_lifetime
+
+        self._cond = threading.Condition()
+        self._idle: List[Tuple[Connection, float]] = []  # (соединение, время возврата)
+        self._created_at: Dict[int, float] = {}
+        self._size = 0
+        self._closed = False
+        self.stats = {
+            'acquired': 0,
+            'created': 0,
+            'discarded': 0,
+            'wait_seconds_total': 0.0,
+            'wait_seconds_max': 0.0
+        }
+
+    def _connect(self) -> Connection:
+        max_retries = RETRY_CONFIG['db']['max_retries']
+        for attempt in range(max_retries):
+            try:
+                conn = psycopg2.connect(**self.dsn_params)
+                conn.autocommit = False
+                self._created_at[id(conn)] = time.monotonic()
+                self.stats['created'] += 1
+                logger.debug("Успешное подключение к БД")
+                return conn
+            except psycopg2.OperationalError as e:
+                logger.warning(f"Ошибка подключения (попытка {attempt+1}): {str(e)}")
+                if attempt < max_retries - 1:
+                    time.sleep(RETRY_CONFIG['db']['initial_delay'] * (2 ** attempt))
+        raise ConnectionFailed("Не удалось подключиться к БД после нескольких попыток")
+
+    def _discard(self, conn: Connection) -> None:
+        self._created_at.pop(id(conn), None)
+        self.stats['discarded'] += 1
         try:
-            conn = psycopg2.connect(**DB_CONFIG)
-            logger.info("Успешное подключение к БД")
-            yield conn
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def _is_healthy(self, conn: Connection, returned_at: float) -> bool:
+        if conn.closed:
+            return False
+        now = time.monotonic()
+        created_at = self._created_at.get(id(conn), now)
+        if self.max_lifetime and now - created_at > self.max_lifetime:
+            return False
+        if now - returned_at < self.health_check_interval:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error as e:
+            logger.warning(f"Соединение из пула не прошло проверку: {str(e)}")
+            return False
+
+    def warm(self) -> None:
+        """Открывает min_size соединений заранее; ошибки только логируются"""
+        try:
+            conns = [self.getconn() for _ in range(self.min_size)]
+        except Exception as e:
+            logger.warning(f"Не удалось прогреть пул соединений: {str(e)}")
             return
-        except psycopg2.OperationalError as e:
-            logger.warning(f"Ошибка подключения (попытка {attempt+1}): {str(e)}")
-            if attempt < RETRY_CONFIG['db']['max_retries'] - 1:
-                time.sleep(RETRY_CONFIG['db']['initial_delay'] * (2 ** attempt))  # Используем time.sleep
+        for conn in conns:
+            self.putconn(conn)
+
+    def getconn(self) -> Connection:
+        """Выдаёт соединение, ожидая освобождения не дольше acquire_timeout"""
+        started = time.monotonic()
+        deadline = started + self.acquire_timeout
+        entry = None
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise RuntimeError("Пул соединений закрыт")
+                if self._idle:
+                    entry = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeout(
+                        f"Нет свободных соединений за {self.acquire_timeout} с "
+                        f"(max_size={self.max_size})"
+                    )
+                self._cond.wait(remaining)
+
+        # Проверка и открытие соединения идут вне блокировки; слот уже занят
+        conn = None
+        if entry is not None:
+            if self._is_healthy(*entry):
+                conn = entry[0]
+            else:
+                self._discard(entry[0])
+        if conn is None:
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+
+        waited = time.monotonic() - started
+        POOL_WAIT_SECONDS.observe(waited)
+        self.stats['acquired'] += 1
+        self.stats['wait_seconds_total'] += waited
+        self.stats['wait_seconds_max'] = max(self.stats['wait_seconds_max'], waited)
+        return conn
+
+    def putconn(self, conn: Connection, discard: bool = False) -> None:
+        """Возвращает соединение в пул, откатывая незавершённую транзакцию"""
+        if not discard and not conn.closed:
+            try:
+                if conn.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                discard = True
+
+        with self._cond:
+            if discard or conn.closed or self._closed:
+                self._discard(conn)
+                self._size -= 1
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """Контекстный менеджер: соединение возвращается в пул при выходе,
+        а при ошибке соединения закрывается"""
+        conn = self.getconn()
+        discard = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            discard = True
+            raise
         finally:
-            if 'conn' in locals():
-                conn.close()
-    raise RuntimeError("Не удалось подключиться к БД после нескольких попыток")
+            self.putconn(conn, discard=discard)
+
+    def closeall(self) -> None:
+        with self._cond:
+            self._closed = True
+            for conn, _ in self._idle:
+                self._discard(conn)
+                self._size -= 1
+            self._idle.clear()
+            self._cond.notify_all()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Текущее состояние пула для метрик"""
+        with self._cond:
+            return {
+                **self.stats,
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle)
+            }
+
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """Общий пул процесса; создаётся при первом обращении"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                pool = ConnectionPool()
+                pool.warm()
+                _pool = pool
+    return _pool
+
+
+def _collect_pool_metrics() -> None:
+    if _pool is not None:
+        snapshot = _pool.snapshot()
+        for state in ('idle', 'in_use'):
+            POOL_CONNECTIONS.set(snapshot[state], state=state)
+
+
+REGISTRY.add_collector(_collect_pool_metrics)
+
+
+def close_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+
+
+@contextmanager
+def get_db_connection():
+    """Контекстный менеджер для соединения из общего пула"""
+    with get_pool().connection() as conn:
+        yield conn
 
 @contextmanager
 def get_db_cursor():
@@ -80,16 +322,18 @@ def execute_query(
 
         # Работа с существующим курсором
         if cursor:
-            cursor.execute(query, params)
+            with stage('db.query'):
+                cursor.execute(query, params)
             if return_result and cursor.description:
                 columns = [desc[0] for desc in cursor.description]
                 result = [dict(zip(columns, row)) for row in cursor.fetchall()]
             return result
 
-        # Создание нового соединения
-        conn = psycopg2.connect(**DB_CONFIG)
+        # Соединение из общего пула
+        conn = get_pool().getconn()
         with conn.cursor(cursor_factory=RealDictCursor) as new_cursor:
-            new_cursor.execute(query, params)
+            with stage('db.query'):
+                new_cursor.execute(query, params)
             
             # Обработка результатов
             if return_result:
@@ -98,24 +342,25 @@ def execute_query(
                 else:
                     result = new_cursor.rowcount
             
-            conn.commit()
+            with stage('db.commit'):
+                conn.commit()
             return result
 
     except psycopg2.Error as e:
         logger.error(f"Database error: {str(e)}")
-        if conn:
+        if conn and not conn.closed:
             conn.rollback()
         raise  # Пробрасываем исключение для обработки на верхнем уровне
         
     except Exception as e:
         logger.error(f"Unexpected error: {str(e)}")
-        if conn:
+        if conn and not conn.closed:
             conn.rollback()
         raise
         
     finally:
-        if conn and not cursor:  # Закрываем только собственные соединения
-            conn.close()
+        if conn and not cursor:  # Возвращаем в пул только собственные соединения
+            get_pool().putconn(conn)
 
 def log_to_db(message: str, level: str = 'INFO'):
     with get_db_cursor() as cursor:
@@ -123,4 +368,249 @@ def log_to_db(message: str, level: str = 'INFO'):
             """INSERT INTO logs (message, level, timestamp)
             VALUES (%s, %s, NOW())""",
             (message, level)
-        )
\ No newline at end of file
+        )
+
+
+def _fetch_chunks(
+    query: str,
+    params: Optional[Union[dict, tuple, list]],
+    fetch_size: Optional[int],
+    cursor_factory: Any = None
+) -> Iterator[Tuple[Cursor, list]]:
+    """Читает результат именованным (серверным) курсором по fetch_size строк.
+
+    Соединение из пула занято, пока генератор не исчерпан или не закрыт;
+    транзакция только читающая и в конце откатывается.
+    """
+    fetch_size = fetch_size or DB_STREAM_CONFIG['fetch_size']
+    with get_db_connection() as conn:
+        try:
+            name = f"stream_{uuid.uuid4().hex}"
+            with conn.cursor(name=name, cursor_factory=cursor_factory) as cursor:
+                cursor.itersize = fetch_size
+                with stage('db.query'):
+                    cursor.execute(query, params)
+                while True:
+                    with stage('db.fetch'):
+                        rows = cursor.fetchmany(fetch_size)
+                    if not rows:
+                        break
+                    ROWS_STREAMED.inc(len(rows))
+                    yield cursor, rows
+        finally:
+            if not conn.closed:
+                conn.rollback()
+
+
+def stream_query(
+    query: str,
+    params: Optional[Union[dict, tuple, list]] = None,
+    fetch_size: Optional[int] = None,
+    row_type: str = 'dict'
+) -> Iterator[Union[Dict[str, Any], Tuple]]:
+    """
+    Построчное чтение большого результата без загрузки его в память целиком
+
+    Параметры:
+        query: SQL-запрос (SELECT)
+        params: Параметры запроса
+        fetch_size: Строк за один FETCH, по умолчанию DB_STREAM_CONFIG['fetch_size']
+        row_type: 'dict' — строки RealDictCursor, 'tuple' — кортежи
+
+    Возвращает генератор строк. Если перебор прерван досрочно, генератор
+    нужно закрыть (close() или contextlib.closing), чтобы вернуть соединение в пул.
+    """
+    if row_type not in ('dict', 'tuple'):
+        raise ValueError(f"Неизвестный формат строк: {row_type}")
+    cursor_factory = RealDictCursor if row_type == 'dict' else None
+    for _, rows in _fetch_chunks(query, params, fetch_size, cursor_factory):
+        yield from rows
+
+
+def _column_array(values: Sequence[Any]) -> np.ndarray:
+    """Столбец как массив numpy: время — datetime64[us], числа с NULL — float с NaN"""
+    sample = next((v for v in values if v is not None), None)
+    if isinstance(sample, datetime):
+        return np.array(values, dtype='datetime64[us]')
+    if isinstance(sample, (int, float)) and not isinstance(sample, bool):
+        if isinstance(sample, float) or any(v is None for v in values):
+            return np.array(values, dtype=np.float64)
+        return np.array(values, dtype=np.int64)
+    column = np.empty(len(values), dtype=object)
+    column[:] = values
+    return column
+
+
+def stream_columns(
+    query: str,
+    params: Optional[Union[dict, tuple, list]] = None,
+    fetch_size: Optional[int] = None
+) -> Iterator[Dict[str, np.ndarray]]:
+    """
+    Чтение большого результата блоками по столбцам
+
+    Каждый блок — словарь {столбец: массив numpy} длиной до fetch_size строк;
+    типы массивов см. _column_array. Соединение освобождается так же, как в stream_query.
+    """
+    for cursor, rows in _fetch_chunks(query, params, fetch_size):
+        columns = [desc[0] for desc in cursor.description]
+        yield {name: _column_array(values) for name, values in zip(columns, zip(*rows))}
+
+
+def _copy_value(value: Any) -> str:
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return (
+        str(value)
+        .replace('\\', '\\\\')
+        .replace('\t', '\\t')
+        .replace('\n', '\\n')
+        .replace('\r', '\\r')
+    )
+
+
+class _CopySource:
+    """Файлоподобный источник для COPY FROM STDIN в текстовом формате.
+
+    Строки формируются по мере чтения, поэтому в памяти не больше
+    одного блока copy_expert.
+    """
+
+    def __init__(self, rows: Iterable[Sequence[Any]]):
+        self._rows = iter(rows)
+        self._buffer = b''
+        self.count = 0
+
+    def read(self, size: int = -1) -> bytes:
+        chunks = [self._buffer]
+        length = len(self._buffer)
+        for row in self._rows:
+            line = ('\t'.join(_copy_value(v) for v in row) + '\n').encode()
+            chunks.append(line)
+            length += len(line)
+            self.count += 1
+            if 0 <= size <= length:
+                break
+        data = b''.join(chunks)
+        if size < 0:
+            self._buffer = b''
+            return data
+        self._buffer = data[size:]
+        return data[:size]
+
+
+def _bulk(
+    work: Callable[[Cursor, Iterable], int],
+    rows: Iterable,
+    cursor: Optional[Cursor],
+    method: str
+) -> int:
+    """Выполняет пакетную запись в транзакции с повторами по RETRY_CONFIG['db'].
+
+    С переданным курсором запись идёт в транзакции вызывающего без фиксации
+    и повторов. Иначе — одна транзакция на всё; при ошибке соединения она
+    повторяется целиком, если rows можно перебрать заново (список, а не
+    итератор). Ошибки данных пробрасываются без повторов.
+    """
+    if cursor is not None:
+        count = work(cursor, rows)
+        ROWS_BULK_WRITTEN.inc(count, method=method)
+        return count
+
+    replayable = iter(rows) is not rows
+    max_retries = RETRY_CONFIG['db']['max_retries']
+    for attempt in range(max_retries):
+        try:
+            with get_db_connection() as conn:
+                try:
+                    with conn.cursor() as new_cursor:
+                        count = work(new_cursor, rows)
+                    with stage('db.commit'):
+                        conn.commit()
+                except Exception:
+                    if not conn.closed:
+                        conn.rollback()
+                    raise
+            ROWS_BULK_WRITTEN.inc(count, method=method)
+            return count
+        except RETRYABLE_ERRORS as e:
+            if not replayable or attempt == max_retries - 1:
+                logger.error(f"Пакетная запись не выполнена: {str(e)}")
+                raise
+            delay = RETRY_CONFIG['db']['initial_delay'] * (2 ** attempt)
+            logger.warning(
+                f"Ошибка соединения при пакетной записи (попытка {attempt+1}), "
+                f"повтор через {delay} с: {str(e)}"
+            )
+            time.sleep(delay)
+    raise AssertionError("unreachable")
+
+
+def bulk_insert(
+    query: str,
+    rows: Iterable[Sequence[Any]],
+    template: Optional[str] = None,
+    page_size: Optional[int] = None,
+    cursor: Optional[Cursor] = None
+) -> int:
+    """
+    Пакетная запись запросом с VALUES %s (многострочный VALUES через execute_values)
+
+    Параметры:
+        query: Запрос вида INSERT ... VALUES %s [ON CONFLICT ...]
+        rows: Строки-кортежи; итератор читается страницами, не целиком
+        template: Шаблон строки для execute_values
+        page_size: Строк в одном запросе, по умолчанию DB_STREAM_CONFIG['page_size']
+        cursor: Существующий курсор — запись в транзакции вызывающего
+
+    Возвращает число переданных строк.
+    """
+    page_size = page_size or DB_STREAM_CONFIG['page_size']
+
+    def work(cur: Cursor, source: Iterable) -> int:
+        count = 0
+        iterator = iter(source)
+        while True:
+            page = list(islice(iterator, page_size))
+            if not page:
+                return count
+            with stage('db.bulk_insert'):
+                execute_values(cur, query, page, template=template, page_size=page_size)
+            count += len(page)
+
+    return _bulk(work, rows, cursor, 'values')
+
+
+def copy_rows(
+    table: str,
+    columns: Sequence[str],
+    rows: Iterable[Sequence[Any]],
+    cursor: Optional[Cursor] = None
+) -> int:
+    """
+    Пакетная запись через COPY FROM STDIN — быстрее VALUES, но без ON CONFLICT
+
+    Параметры:
+        table: Таблица, при необходимости со схемой ('public.flight_positions')
+        columns: Столбцы в порядке значений строки
+        rows: Строки-кортежи; итератор читается по мере передачи
+        cursor: Существующий курсор — запись в транзакции вызывающего
+
+    Возвращает число записанных строк.
+    """
+    statement = sql.SQL("COPY {} ({}) FROM STDIN").format(
+        sql.Identifier(*table.split('.')),
+        sql.SQL(', ').join(sql.Identifier(column) for column in columns)
+    )
+
+    def work(cur: Cursor, source: Iterable) -> int:
+        copy_source = _CopySource(source)
+        with stage('db.copy'):
+            cur.copy_expert(statement, copy_source)
+        return copy_source.count
+
+    return _bulk(work, rows, cursor, 'copy')
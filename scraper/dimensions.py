@@ -0,0 +1,147 @@
+"""Кэш справочников (авиакомпании, самолёты) в памяти scraper'а.
+
+Коды ICAO нормализуются один раз при приёме данных, поэтому в БД хранятся
+в едином виде и соединяются простым равенством по индексу. Кэш отображает
+нормализованный код в id строки и отпечаток её содержимого; строки с
+неизменившимся содержимым не переписываются каждый цикл.
+
+Изменения кэша, сделанные во время записи, сначала накапливаются и
+применяются только после фиксации транзакции: id, полученный в
+откаченной транзакции, в кэш не попадает.
+"""
+import logging
+from collections import OrderedDict
+from typing import Any, Iterable, List, Optional, Tuple
+
+from psycopg2.extensions import cursor as Cursor
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_code(value: Any) -> Optional[str]:
+    """Приводит код ICAO к каноническому виду: без пробелов, в верхнем регистре"""
+    if value is None:
+        return None
+    value = str(value).strip().upper()
+    return value or None
+
+
+def fingerprint(*values: Any) -> int:
+    return hash(values)
+
+
+class DimensionCache:
+    """Ограниченный LRU-кэш: нормализованный код -> (id, отпечаток)"""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, Tuple[Any, int]]" = OrderedDict()
+        self._staged: List[Tuple[str, Any, int]] = []
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def lookup(self, code: str, *values: Any) -> Optional[Any]:
+        """id строки, если она в кэше и её содержимое совпадает с values"""
+        entry = self._entries.get(code)
+        if entry is not None and entry[1] == fingerprint(*values):
+            self._entries.move_to_end(code)
+            self.hits += 1
+            return entry[0]
+        self.misses += 1
+        return None
+
+    def contains(self, code: str) -> bool:
+        return code in self._entries
+
+    def put(self, code: str, row_id: Any, *values: Any) -> None:
+        if self.max_size <= 0:
+            return
+        self._entries[code] = (row_id, fingerprint(*values))
+        self._entries.move_to_end(code)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def stage(self, code: str, row_id: Any, *values: Any) -> None:
+        self._staged.append((code, row_id, fingerprint(*values)))
+
+    def savepoint(self) -> int:
+        return len(self._staged)
+
+    def rollback_to(self, mark: int) -> None:
+        del self._staged[mark:]
+
+    def commit(self) -> None:
+        if self.max_size > 0:
+            for code, row_id, fp in self._staged:
+                self._entries[code] = (row_id, fp)
+                self._entries.move_to_end(code)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        self._staged.clear()
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._staged.clear()
+
+
+class Dimensions:
+    """Кэши справочников, используемые пакетной записью"""
+
+    def __init__(self, max_size: int):
+        self.airlines = DimensionCache(max_size)
+        self.aircrafts = DimensionCache(max_size)
+        self.max_size = max_size
+        self.warmed = max_size <= 0
+
+    def warm(self, cursor: Cursor) -> None:
+        """Заполняет кэши из БД; строки с ненормализованными кодами пропускаются"""
+        cursor.execute(
+            "SELECT id, icao_code, name FROM airlines ORDER BY id DESC LIMIT %s",
+            (self.max_size,)
+        )
+        airlines = cursor.fetchall()
+        cursor.execute(
+            "SELECT icao_code, model_name FROM aircrafts LIMIT %s",
+            (self.max_size,)
+        )
+        self.load(airlines, cursor.fetchall())
+
+    def load(
+        self,
+        airlines: Iterable[Tuple[int, str, str]],
+        aircrafts: Iterable[Tuple[str, str]]
+    ) -> None:
+        """Заполняет кэши строками (id, icao, name) и (icao, model_name)"""
+        for airline_id, icao, name in airlines:
+            if icao == normalize_code(icao):
+                self.airlines.put(icao, airline_id, name)
+        for icao, model_name in aircrafts:
+            if icao == normalize_code(icao):
+                self.aircrafts.put(icao, icao, model_name)
+
+        self.warmed = True
+        logger.info(
+            f"Кэш справочников прогрет: авиакомпаний {len(self.airlines)}, "
+            f"самолётов {len(self.aircrafts)}"
+        )
+
+    def savepoint(self) -> Tuple[int, int]:
+        return self.airlines.savepoint(), self.aircrafts.savepoint()
+
+    def rollback_to(self, mark: Tuple[int, int]) -> None:
+        self.airlines.rollback_to(mark[0])
+        self.aircrafts.rollback_to(mark[1])
+
+    def commit(self) -> None:
+        self.airlines.commit()
+        self.aircrafts.commit()
+
+    def discard(self) -> None:
+        self.rollback_to((0, 0))
+
+    def clear(self) -> None:
+        self.airlines.clear()
+        self.aircrafts.clear()
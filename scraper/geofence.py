@@ -0,0 +1,186 @@
+"""Векторизованная классификация позиций по набору именованных зон.
+
+Зона задаётся прямоугольником (min_lat, min_lon, max_lat, max_lon) в порядке
+BLACK_SEA_BBOX или многоугольником из вершин (lat, lon). Прямоугольник с
+min_lon > max_lon пересекает антимеридиан. Координаты пакета разбираются в
+массивы NumPy один раз, прямоугольники проверяются сравнением массивов, а
+многоугольники — только для точек из ячеек грубой сетки, которые покрывает
+их охватывающий прямоугольник.
+"""
+import logging
+import math
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CELL_SIZE = 1.0  # градусов
+
+
+class Zone(NamedTuple):
+    name: str
+    bbox: Optional[Tuple[float, float, float, float]] = None
+    polygon: Optional[Tuple[Tuple[float, float], ...]] = None
+
+
+def zone_from_config(spec: Dict[str, Any]) -> Zone:
+    """Создаёт Zone из записи GEOFENCE_ZONES"""
+    name = spec['name']
+    if 'bbox' in spec:
+        min_lat, min_lon, max_lat, max_lon = (float(v) for v in spec['bbox'])
+        if min_lat > max_lat:
+            raise ValueError(f"Зона {name}: min_lat больше max_lat")
+        return Zone(name, bbox=(min_lat, min_lon, max_lat, max_lon))
+    if 'polygon' in spec:
+        vertices = tuple((float(lat), float(lon)) for lat, lon in spec['polygon'])
+        if len(vertices) < 3:
+            raise ValueError(f"Зона {name}: у многоугольника меньше трёх вершин")
+        return Zone(name, polygon=vertices)
+    raise ValueError(f"Зона {name}: нужен bbox или polygon")
+
+
+class _Polygon:
+    """Многоугольник, подготовленный к векторизованной проверке"""
+
+    def __init__(self, vertices: Sequence[Tuple[float, float]], cell_size: float):
+        lats = np.array([v[0] for v in vertices], dtype=np.float64)
+        lons = np.array([v[1] for v in vertices], dtype=np.float64)
+        # Многоугольник через антимеридиан разворачиваем в непрерывный
+        # диапазон долгот [0, 360), точки сдвигаем так же при проверке
+        self.wrapped = bool(lons.max() - lons.min() > 180)
+        if self.wrapped:
+            lons = np.where(lons < 0, lons + 360, lons)
+        self.lats = lats
+        self.lons = lons
+        self.cells = self._cell_mask(cell_size)
+
+    def _cell_mask(self, cell_size: float) -> np.ndarray:
+        n_rows = int(math.ceil(180 / cell_size))
+        n_cols = int(math.ceil(360 / cell_size))
+        mask = np.zeros(n_rows * n_cols, dtype=bool)
+        row_lo = _row(self.lats.min(), cell_size, n_rows)
+        row_hi = _row(self.lats.max(), cell_size, n_rows)
+        col_lo = int(math.floor((self.lons.min() + 180) / cell_size))
+        col_hi = int(math.floor((self.lons.max() + 180) / cell_size))
+        cols = np.arange(col_lo, col_hi + 1) % n_cols
+        for row in range(row_lo, row_hi + 1):
+            mask[row * n_cols + cols] = True
+        return mask
+
+    def contains(self, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+        """Чётно-нечётная проверка: цикл по рёбрам, векторно по точкам"""
+        if self.wrapped:
+            lons = np.where(lons < 0, lons + 360, lons)
+        inside = np.zeros(lats.shape, dtype=bool)
+        lat_j, lon_j = self.lats[-1], self.lons[-1]
+        for lat_i, lon_i in zip(self.lats, self.lons):
+            crosses = (lat_i > lats) != (lat_j > lats)
+            if lat_i != lat_j:
+                lon_cross = lon_i + (lats - lat_i) * (lon_j - lon_i) / (lat_j - lat_i)
+                inside ^= crosses & (lons < lon_cross)
+            lat_j, lon_j = lat_i, lon_i
+        return inside
+
+
+def _row(lat: float, cell_size: float, n_rows: int) -> int:
+    return min(n_rows - 1, max(0, int(math.floor((lat + 90) / cell_size))))
+
+
+class GeofenceEngine:
+    """Классификатор пакета позиций по множеству зон"""
+
+    def __init__(self, zones: Iterable[Zone], cell_size: float = DEFAULT_CELL_SIZE):
+        self.zones = list(zones)
+        if not self.zones:
+            raise ValueError("Не задано ни одной зоны")
+        names = [zone.name for zone in self.zones]
+        if len(set(names)) != len(names):
+            raise ValueError("Имена зон должны быть уникальными")
+        self.names = np.array(names, dtype=object)
+        self.cell_size = cell_size
+        self._n_rows = int(math.ceil(180 / cell_size))
+        self._n_cols = int(math.ceil(360 / cell_size))
+        self._polygons = {
+            idx: _Polygon(zone.polygon, cell_size)
+            for idx, zone in enumerate(self.zones) if zone.polygon is not None
+        }
+
+    @classmethod
+    def from_config(cls, specs: Iterable[Dict[str, Any]], cell_size: float = DEFAULT_CELL_SIZE):
+        return cls((zone_from_config(spec) for spec in specs), cell_size=cell_size)
+
+    def _cells(self, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+        rows = np.clip(np.floor((lats + 90) / self.cell_size), 0, self._n_rows - 1).astype(np.int64)
+        cols = np.clip(np.floor((lons + 180) / self.cell_size), 0, self._n_cols - 1).astype(np.int64)
+        return rows * self._n_cols + cols
+
+    def classify(self, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+        """Матрица принадлежности формы (число точек, число зон).
+
+        Точки с NaN или вне допустимого диапазона координат не попадают
+        ни в одну зону.
+        """
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        with np.errstate(invalid='ignore'):
+            valid = (lats >= -90) & (lats <= 90) & (lons >= -180) & (lons <= 180)
+        membership = np.zeros((lats.shape[0], len(self.zones)), dtype=bool)
+        if not valid.any():
+            return membership
+
+        idx_valid = np.flatnonzero(valid)
+        v_lats = lats[idx_valid]
+        v_lons = lons[idx_valid]
+        cells = self._cells(v_lats, v_lons) if self._polygons else None
+
+        for z, zone in enumerate(self.zones):
+            if zone.bbox is not None:
+                min_lat, min_lon, max_lat, max_lon = zone.bbox
+                in_lat = (v_lats >= min_lat) & (v_lats <= max_lat)
+                if min_lon <= max_lon:
+                    in_lon = (v_lons >= min_lon) & (v_lons <= max_lon)
+                else:
+                    in_lon = (v_lons >= min_lon) | (v_lons <= max_lon)
+                membership[idx_valid, z] = in_lat & in_lon
+            else:
+                polygon = self._polygons[z]
+                candidates = np.flatnonzero(polygon.cells[cells])
+                if candidates.size:
+                    hits = polygon.contains(v_lats[candidates], v_lons[candidates])
+                    membership[idx_valid[candidates[hits]], z] = True
+        return membership
+
+    def filter_flights(self, flights: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Оставляет рейсы, попавшие хотя бы в одну зону, и записывает
+        имена зон в flight['zones']"""
+        if not flights:
+            return []
+        lats, lons = extract_coordinates(flights)
+        membership = self.classify(lats, lons)
+        matched = np.flatnonzero(membership.any(axis=1))
+        filtered = []
+        for idx in matched:
+            flight = flights[idx]
+            flight['zones'] = list(self.names[membership[idx]])
+            filtered.append(flight)
+        return filtered
+
+
+def extract_coordinates(flights: Sequence[Dict[str, Any]]) -> Tuple[np.ndarray, np.ndarray]:
+    """Разбирает live.latitude/longitude пакета в массивы; некорректные — NaN"""
+    lats = np.full(len(flights), np.nan)
+    lons = np.full(len(flights), np.nan)
+    for idx, flight in enumerate(flights):
+        try:
+            live = flight.get('live') or {}
+            lat = live.get('latitude')
+            lon = live.get('longitude')
+            if lat is None or lon is None:
+                continue
+            lats[idx] = float(lat)
+            lons[idx] = float(lon)
+        except (AttributeError, TypeError, ValueError):
+            lats[idx] = np.nan
+            lons[idx] = np.nan
+    return lats, lons
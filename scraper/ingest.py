@@ -0,0 +1,350 @@
+"""Пакетное сохранение рейсов: весь цикл опроса пишется одним соединением
+несколькими set-based запросами вместо трёх запросов на каждый рейс."""
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import psycopg2
+from psycopg2.extensions import connection as Connection, cursor as Cursor
+from psycopg2.extras import execute_values
+
+from metrics import REGISTRY, stage
+from scraper.dimensions import Dimensions, normalize_code
+from scraper.rollups import update_hourly_rollups
+
+logger = logging.getLogger(__name__)
+
+# Ограничение длины кодов из init-db.sql (VARCHAR(10)): одна слишком длинная
+# строка иначе валит весь пакет
+MAX_CODE_LENGTH = 10
+PAGE_SIZE = 1000
+
+ROWS_WRITTEN = REGISTRY.counter(
+    'aviation_db_rows_written_total', 'Строк, переданных в запросы записи', ('table',)
+)
+
+AIRCRAFTS_UPSERT = """
+    INSERT INTO aircrafts (icao_code, model_name)
+    VALUES %s
+    ON CONFLICT (icao_code) DO UPDATE SET
+        model_name = CASE
+            WHEN EXCLUDED.model_name != EXCLUDED.icao_code
+            THEN EXCLUDED.model_name
+            ELSE aircrafts.model_name
+        END
+    RETURNING icao_code, model_name
+"""
+
+AIRLINES_UPSERT = """
+    INSERT INTO airlines (icao_code, name)
+    VALUES %s
+    ON CONFLICT (icao_code) DO UPDATE SET
+        name = EXCLUDED.name
+    RETURNING id, icao_code
+"""
+
+FLIGHTS_UPSERT = """
+    INSERT INTO flights (
+        flight_icao,
+        aircraft_icao,
+        airline_id,
+        departure_airport,
+        arrival_airport
+    ) VALUES %s
+    ON CONFLICT (flight_icao, airline_id) DO UPDATE SET
+        aircraft_icao = EXCLUDED.aircraft_icao,
+        departure_airport = EXCLUDED.departure_airport,
+        arrival_airport = EXCLUDED.arrival_airport,
+        updated_at = NOW()
+    RETURNING id, flight_icao, airline_id
+"""
+
+# Позиция рейса с тем же временем уже есть — повторная запись пропускается
+POSITIONS_INSERT = """
+    INSERT INTO flight_positions (flight_id, latitude, longitude, altitude, timestamp)
+    VALUES %s
+    ON CONFLICT (flight_id, timestamp) DO NOTHING
+    RETURNING flight_id, timestamp
+"""
+# Позиции без времени наблюдения получают время записи, как DEFAULT NOW()
+POSITIONS_TEMPLATE = "(%s, %s, %s, %s, COALESCE(%s::timestamp, LOCALTIMESTAMP))"
+
+
+class FlightRecord(NamedTuple):
+    """Провалидированный рейс, готовый к пакетной записи"""
+    airline_icao: str
+    airline_name: str
+    flight_icao: str
+    aircraft_icao: Optional[str]
+    aircraft_model: Optional[str]
+    departure: str
+    arrival: str
+    latitude: float
+    longitude: float
+    altitude: float
+    observed_at: Optional[datetime] = None  # UTC без зоны из live.updated; None — время получения
+
+
+def _code(value: Any, field: str) -> str:
+    value = normalize_code(value)
+    if not value:
+        raise ValueError(f"Отсутствует код {field}")
+    if len(value) > MAX_CODE_LENGTH:
+        raise ValueError(f"Код {field} длиннее {MAX_CODE_LENGTH} символов: {value}")
+    return value
+
+
+def observed_at(flight: Dict[str, Any]) -> Optional[datetime]:
+    """live.updated как UTC без зоны.
+
+    Время наблюдения берётся из ответа API одинаково при опросе и при
+    загрузке архивов, чтобы одна и та же позиция получала одно время и
+    повторно не вставлялась (уникальность по рейсу и времени).
+    """
+    value = (flight.get('live') or {}).get('updated')
+    if not value:
+        return None
+    try:
+        moment = datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+
+def parse_flight(flight: Dict[str, Any]) -> FlightRecord:
+    """Проверяет структуру рейса из API и приводит его к FlightRecord.
+
+    Бросает KeyError/TypeError/ValueError для некорректных записей.
+    """
+    if not all(key in flight for key in ('airline', 'flight', 'live')):
+        raise ValueError("Некорректная структура данных рейса")
+
+    airline_data = flight['airline']
+    flight_data = flight['flight']
+    aircraft_data = flight.get('aircraft') or {}
+    live_data = flight['live']
+
+    aircraft_icao = normalize_code(aircraft_data.get('icao'))
+    aircraft_model = None
+    if aircraft_icao:
+        aircraft_icao = _code(aircraft_icao, 'aircraft.icao')
+        aircraft_model = (aircraft_data.get('model') or '').strip() or aircraft_icao
+
+    return FlightRecord(
+        airline_icao=_code(airline_data['icao'], 'airline.icao'),
+        airline_name=airline_data.get('name') or 'Unknown Airline',
+        flight_icao=_code(flight_data['icao'], 'flight.icao'),
+        aircraft_icao=aircraft_icao,
+        aircraft_model=aircraft_model,
+        departure=(flight.get('departure') or {}).get('airport', 'N/A'),
+        arrival=(flight.get('arrival') or {}).get('airport', 'N/A'),
+        latitude=float(live_data['latitude']),
+        longitude=float(live_data['longitude']),
+        altitude=float(live_data.get('altitude', 0)),
+        observed_at=observed_at(flight)
+    )
+
+
+def prepare_flight_records(flights: Iterable[Dict[str, Any]]) -> Tuple[List[FlightRecord], int]:
+    """Валидирует рейсы по одному. Возвращает корректные записи и число отклонённых."""
+    records = []
+    failure_count = 0
+    for idx, flight in enumerate(flights):
+        try:
+            records.append(parse_flight(flight))
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
+            logger.error(f"Ошибка валидации данных рейса #{idx}: {str(e)}")
+            failure_count += 1
+    return records, failure_count
+
+
+def changed_aircrafts(records: List[FlightRecord], dimensions: Dimensions) -> List[Tuple[str, Optional[str]]]:
+    """Самолёты пакета, которые нужно записать, в порядке ключа"""
+    aircrafts = {r.aircraft_icao: r.aircraft_model for r in records if r.aircraft_icao}
+    # Модель, совпадающая с кодом, существующую строку не меняет (см. CASE
+    # в AIRCRAFTS_UPSERT), поэтому для известного самолёта запись не нужна
+    return [
+        (icao, model) for icao, model in sorted(aircrafts.items())
+        if not (
+            dimensions.aircrafts.contains(icao)
+            and (model == icao or dimensions.aircrafts.lookup(icao, model) is not None)
+        )
+    ]
+
+
+def split_airlines(
+    records: List[FlightRecord], dimensions: Dimensions
+) -> Tuple[Dict[str, int], List[Tuple[str, str]]]:
+    """id авиакомпаний из кэша и отсортированный список тех, что нужно записать"""
+    airlines = {r.airline_icao: r.airline_name for r in records}
+    airline_ids = {}
+    changed = []
+    for icao, name in sorted(airlines.items()):
+        airline_id = dimensions.airlines.lookup(icao, name)
+        if airline_id is None:
+            changed.append((icao, name))
+        else:
+            airline_ids[icao] = airline_id
+    return airline_ids, changed
+
+
+def flight_rows(records: List[FlightRecord], airline_ids: Dict[str, int]) -> List[Tuple]:
+    """Уникальные строки flights в порядке ключа (flight_icao, airline_id)"""
+    flights = {}
+    for r in records:
+        airline_id = airline_ids[r.airline_icao]
+        flights[(r.flight_icao, airline_id)] = (
+            r.flight_icao, r.aircraft_icao, airline_id, r.departure, r.arrival
+        )
+    return [flights[key] for key in sorted(flights)]
+
+
+def position_rows(
+    records: List[FlightRecord], airline_ids: Dict[str, int], flight_ids: Dict[Tuple[str, int], int]
+) -> List[Tuple]:
+    return [
+        (
+            flight_ids[(r.flight_icao, airline_ids[r.airline_icao])],
+            r.latitude,
+            r.longitude,
+            r.altitude,
+            r.observed_at
+        )
+        for r in records
+    ]
+
+
+def rollup_rows(
+    records: List[FlightRecord],
+    airline_ids: Dict[str, int],
+    flight_ids: Dict[Tuple[str, int], int],
+    inserted: Iterable[Tuple[int, datetime]]
+) -> List[Tuple]:
+    """Строки почасовой статистики только по действительно вставленным позициям"""
+    flight_dims = {
+        flight_ids[(r.flight_icao, airline_ids[r.airline_icao])]: (r.aircraft_icao, airline_ids[r.airline_icao])
+        for r in records
+    }
+    return [(flight_id, *flight_dims[flight_id], timestamp) for flight_id, timestamp in inserted]
+
+
+def _upsert_aircrafts(cursor: Cursor, records: List[FlightRecord], dimensions: Dimensions) -> None:
+    changed = changed_aircrafts(records, dimensions)
+    if not changed:
+        return
+    with stage('db.aircrafts_upsert'):
+        rows = execute_values(cursor, AIRCRAFTS_UPSERT, changed, page_size=PAGE_SIZE, fetch=True)
+    ROWS_WRITTEN.inc(len(changed), table='aircrafts')
+    for icao, model_name in rows:
+        dimensions.aircrafts.stage(icao, icao, model_name)
+
+
+def _upsert_airlines(cursor: Cursor, records: List[FlightRecord], dimensions: Dimensions) -> Dict[str, int]:
+    airline_ids, changed = split_airlines(records, dimensions)
+    if changed:
+        names = dict(changed)
+        with stage('db.airlines_upsert'):
+            rows = execute_values(cursor, AIRLINES_UPSERT, changed, page_size=PAGE_SIZE, fetch=True)
+        ROWS_WRITTEN.inc(len(changed), table='airlines')
+        for airline_id, icao in rows:
+            airline_ids[icao] = airline_id
+            dimensions.airlines.stage(icao, airline_id, names[icao])
+    return airline_ids
+
+
+def write_flight_batch(
+    cursor: Cursor,
+    records: List[FlightRecord],
+    dimensions: Optional[Dimensions] = None
+) -> int:
+    """Записывает пакет рейсов в текущей транзакции, не фиксируя её.
+
+    Строки справочников дедуплицируются и сортируются по ключу: ON CONFLICT
+    не может обновить одну строку дважды, а единый порядок блокировок
+    исключает взаимоблокировки между параллельными писателями. Авиакомпании
+    и самолёты, которые уже есть в кэше dimensions с тем же содержимым,
+    не переписываются. Почасовая статистика обновляется в той же транзакции.
+    Возвращает число вставленных позиций: уже записанные пропускаются.
+    """
+    if not records:
+        return 0
+    if dimensions is None:
+        dimensions = Dimensions(max_size=0)
+
+    _upsert_aircrafts(cursor, records, dimensions)
+    airline_ids = _upsert_airlines(cursor, records, dimensions)
+
+    flights = flight_rows(records, airline_ids)
+    with stage('db.flights_upsert'):
+        rows = execute_values(cursor, FLIGHTS_UPSERT, flights, page_size=PAGE_SIZE, fetch=True)
+    ROWS_WRITTEN.inc(len(flights), table='flights')
+    flight_ids = {(flight_icao, airline_id): flight_id for flight_id, flight_icao, airline_id in rows}
+
+    positions = position_rows(records, airline_ids, flight_ids)
+    with stage('db.positions_insert'):
+        inserted = execute_values(
+            cursor, POSITIONS_INSERT, positions, template=POSITIONS_TEMPLATE,
+            page_size=PAGE_SIZE, fetch=True
+        )
+    ROWS_WRITTEN.inc(len(positions), table='flight_positions')
+    with stage('db.rollups_upsert'):
+        update_hourly_rollups(cursor, rollup_rows(records, airline_ids, flight_ids, inserted))
+    return len(inserted)
+
+
+def save_flight_records(
+    conn: Connection,
+    records: List[FlightRecord],
+    dimensions: Optional[Dimensions] = None
+) -> Tuple[int, int]:
+    """Сохраняет пакет одной транзакцией. Возвращает (успешно, ошибок).
+
+    Если пакет отклонён из-за данных (DataError/IntegrityError), записи
+    повторяются по одной под SAVEPOINT на том же соединении, чтобы
+    одна плохая строка не теряла весь цикл. Ошибки соединения
+    пробрасываются вызывающему для повтора.
+    """
+    if dimensions is None:
+        dimensions = Dimensions(max_size=0)
+
+    with conn.cursor() as cursor:
+        try:
+            if not dimensions.warmed:
+                dimensions.warm(cursor)
+            saved = write_flight_batch(cursor, records, dimensions)
+            with stage('db.commit'):
+                conn.commit()
+            dimensions.commit()
+            return saved, 0
+        except (psycopg2.DataError, psycopg2.IntegrityError) as e:
+            conn.rollback()
+            # Нарушение ссылок может означать устаревшие id в кэше
+            dimensions.clear()
+            logger.warning(f"Пакет отклонён БД, сохраняем рейсы по одному: {str(e)}")
+        except Exception:
+            dimensions.discard()
+            raise
+
+        success_count = 0
+        failure_count = 0
+        try:
+            for idx, record in enumerate(records):
+                cursor.execute("SAVEPOINT flight_record")
+                mark = dimensions.savepoint()
+                try:
+                    success_count += write_flight_batch(cursor, [record], dimensions)
+                    cursor.execute("RELEASE SAVEPOINT flight_record")
+                except (psycopg2.DataError, psycopg2.IntegrityError) as e:
+                    cursor.execute("ROLLBACK TO SAVEPOINT flight_record")
+                    dimensions.rollback_to(mark)
+                    logger.error(f"Ошибка сохранения рейса #{idx} ({record.flight_icao}): {str(e)}")
+                    failure_count += 1
+            with stage('db.commit'):
+                conn.commit()
+            dimensions.commit()
+        except Exception:
+            dimensions.discard()
+            raise
+        return success_count, failure_count
@@ -0,0 +1,253 @@
+"""Текущее состояние рейсов в памяти scraper для dashboard.
+
+Таблица — массив numpy с записями фиксированной ширины (livefeed.RECORD),
+по одной на активный рейс; освободившиеся строки переиспользуются. Каждое
+обновление цикла увеличивает версию и публикует неизменяемый снимок:
+HTTP-обработчики читают только его, поэтому запись не блокирует чтение.
+Клиент, знающий версию, получает лишь изменившиеся записи и снятые рейсы;
+слишком старой версии или другому запуску scraper отдаётся полный снимок.
+
+Рейс снимается, если по нему нет новых позиций дольше ttl секунд. История
+снятий хранится для history_versions последних версий.
+"""
+import logging
+import random
+import threading
+import time
+from bisect import bisect_right
+from collections import deque
+from datetime import timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Deque, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+import livefeed
+from metrics import REGISTRY
+from scraper.ingest import FlightRecord
+
+logger = logging.getLogger(__name__)
+
+UNKNOWN_MODEL = 'Unknown Model'  # как в запросе позиций dashboard
+
+LIVE_FLIGHTS = REGISTRY.gauge('aviation_live_flights', 'Рейсов в текущем состоянии')
+LIVE_REQUESTS = REGISTRY.counter(
+    'aviation_live_requests_total', 'Запросов текущего состояния', ('kind',)
+)
+
+
+class _Dictionary:
+    """Справочник строк только на добавление с версией добавления каждой строки"""
+
+    def __init__(self):
+        self.values: List[str] = []
+        self.versions: List[int] = []
+        self._ids: Dict[str, int] = {}
+
+    def id(self, value: str, version: int) -> int:
+        idx = self._ids.get(value)
+        if idx is None:
+            idx = self._ids[value] = len(self.values)
+            self.values.append(value)
+            self.versions.append(version)
+        return idx
+
+
+class Snapshot:
+    """Неизменяемый снимок состояния одной версии"""
+
+    def __init__(
+        self,
+        epoch: int,
+        version: int,
+        floor: int,
+        records: np.ndarray,
+        removed: Sequence[Tuple[int, bytes]],
+        models: _Dictionary,
+        airlines: _Dictionary
+    ):
+        self.epoch = epoch
+        self.version = version
+        self.floor = floor
+        self.records = records
+        self.removed = tuple(removed)
+        # Справочники только растут: снимку достаточно длины префикса
+        self._models = (tuple(models.values), tuple(models.versions))
+        self._airlines = (tuple(airlines.values), tuple(airlines.versions))
+        self._full: Optional[bytes] = None
+
+    @staticmethod
+    def _since(dictionary: Tuple[tuple, tuple], version: int) -> Tuple[int, List[str]]:
+        values, versions = dictionary
+        start = bisect_right(versions, version)
+        return start, list(values[start:])
+
+    def payload(self, epoch: Optional[int] = None, since: int = 0) -> bytes:
+        """Изменения после версии since или полный снимок, если дельта невозможна"""
+        if epoch != self.epoch or since < self.floor or since > self.version:
+            since = 0
+        if since == 0:
+            LIVE_REQUESTS.inc(kind='full')
+            if self._full is None:
+                self._full = livefeed.encode(
+                    self.epoch, self.version, 0, self.records, [],
+                    (0, self._models[0]), (0, self._airlines[0])
+                )
+            return self._full
+        LIVE_REQUESTS.inc(kind='delta')
+        return livefeed.encode(
+            self.epoch, self.version, since,
+            self.records[self.records['version'] > since],
+            [icao for version, icao in self.removed if version > since],
+            self._since(self._models, since),
+            self._since(self._airlines, since)
+        )
+
+
+class LiveState:
+    """Таблица активных рейсов; update() и expire() вызываются из потока опроса"""
+
+    def __init__(self, ttl: float = 1800, history_versions: int = 120, capacity: int = 1024):
+        self.ttl = ttl
+        self.history_versions = history_versions
+        self.epoch = random.getrandbits(63)
+        self.version = 0
+        self._records = np.zeros(capacity, dtype=livefeed.RECORD)
+        self._active = np.zeros(capacity, dtype=bool)
+        self._free = list(range(capacity - 1, -1, -1))
+        self._slots: Dict[bytes, int] = {}
+        self._removed: Deque[Tuple[int, bytes]] = deque()
+        self._models = _Dictionary()
+        self._airlines = _Dictionary()
+        self._seq = 0
+        self._lock = threading.Lock()
+        self._snapshot = Snapshot(
+            self.epoch, 0, 0, self._records[:0].copy(), (), self._models, self._airlines
+        )
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> 'LiveState':
+        return cls(ttl=config['ttl'], history_versions=config['history_versions'])
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def _allocate(self, key: bytes) -> int:
+        if not self._free:
+            size = len(self._records)
+            self._records = np.concatenate([self._records, np.zeros(size, dtype=livefeed.RECORD)])
+            self._active = np.concatenate([self._active, np.zeros(size, dtype=bool)])
+            self._free = list(range(2 * size - 1, size - 1, -1))
+        slot = self._free.pop()
+        self._slots[key] = slot
+        self._active[slot] = True
+        return slot
+
+    def _expire(self, version: int, now: float) -> int:
+        stale = np.flatnonzero(self._active & (self._records['timestamp'] < now - self.ttl))
+        for slot in stale.tolist():
+            key = bytes(self._records['icao'][slot])
+            del self._slots[key]
+            self._active[slot] = False
+            self._free.append(slot)
+            self._removed.append((version, key))
+        return len(stale)
+
+    def _publish(self, version: int) -> Snapshot:
+        floor = version - self.history_versions
+        while self._removed and self._removed[0][0] <= floor:
+            self._removed.popleft()
+        self.version = version
+        self._snapshot = Snapshot(
+            self.epoch,
+            version,
+            max(0, version - self.history_versions),
+            self._records[self._active].copy(),
+            self._removed,
+            self._models,
+            self._airlines
+        )
+        LIVE_FLIGHTS.set(len(self._slots))
+        return self._snapshot
+
+    def update(self, records: List[FlightRecord], now: Optional[float] = None) -> Snapshot:
+        """Применяет наблюдения цикла и публикует новую версию"""
+        now = time.time() if now is None else now
+        with self._lock:
+            version = self.version + 1
+            for r in records:
+                key = r.flight_icao.encode()
+                timestamp = (
+                    r.observed_at.replace(tzinfo=timezone.utc).timestamp()
+                    if r.observed_at is not None else now
+                )
+                slot = self._slots.get(key)
+                if slot is None:
+                    slot = self._allocate(key)
+                elif self._records['timestamp'][slot] > timestamp:
+                    continue  # наблюдение старше уже известного
+                self._seq += 1
+                self._records[slot] = (
+                    key,
+                    r.latitude,
+                    r.longitude,
+                    r.altitude if r.altitude is not None else np.nan,
+                    timestamp,
+                    self._models.id(r.aircraft_model or r.aircraft_icao or UNKNOWN_MODEL, version),
+                    self._airlines.id(r.airline_icao, version),
+                    self._seq,
+                    version
+                )
+            self._expire(version, now)
+            return self._publish(version)
+
+    def expire(self, now: Optional[float] = None) -> Snapshot:
+        """Снимает рейсы старше ttl без новых наблюдений.
+
+        Вызывается каждый цикл, в том числе пустой или неудачный, когда
+        update() не выполняется; версия растёт, только если кто-то снят.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            version = self.version + 1
+            if self._expire(version, now):
+                return self._publish(version)
+            return self._snapshot
+
+    def snapshot(self) -> Snapshot:
+        return self._snapshot
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path != '/live':
+            self.send_error(404)
+            return
+        query = parse_qs(url.query)
+        try:
+            epoch = int(query['epoch'][0]) if 'epoch' in query else None
+            since = int(query.get('since', ['0'])[0])
+        except ValueError:
+            self.send_error(400)
+            return
+        payload = self.server.state.snapshot().payload(epoch, since)
+        self.send_response(200)
+        self.send_header('Content-Type', livefeed.CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+def start_server(state: LiveState, host: str, port: int) -> ThreadingHTTPServer:
+    """Отдаёт /live в фоновом потоке"""
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    server.state = state
+    threading.Thread(target=server.serve_forever, name='live-state-server', daemon=True).start()
+    logger.info(f"Текущее состояние рейсов доступно на http://{host}:{server.server_address[1]}/live")
+    return server
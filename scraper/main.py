@@ -1,9 +1,11 @@
 import json
 import logging
 import time
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
+from datetime import datetime, timezone
 from time import sleep
-from typing import Any, Dict, List, Optional, Union
+from typing import Any, Dict, List, Optional, Tuple, Union
 
 import psycopg2
 import requests
@@ -13,7 +15,24 @@ from psycopg2.extras import RealDictCursor
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
-from config import API_KEY, API_URL, BLACK_SEA_BBOX, RETRY_CONFIG, DB_CONFIG
+from config import (
+    API_KEY, API_URL, ARCHIVE_CONFIG, DB_CONFIG, DIMENSION_CACHE_CONFIG, FETCH_CONFIG,
+    GEOFENCE_CELL_SIZE, GEOFENCE_ZONES, INGEST_CONFIG, LIVE_STATE_CONFIG, METRICS_CONFIG,
+    RETRY_CONFIG, SCHEDULER_CONFIG, TRACK_COMPRESSION_CONFIG
+)
+from metrics import REGISTRY, stage, start_http_server, start_profiler, trace
+from scraper.archive import ArchiveWriter
+from scraper.database import get_db_connection
+from scraper.dimensions import Dimensions
+from scraper.geofence import GeofenceEngine
+from scraper.ingest import FlightRecord, prepare_flight_records, save_flight_records
+from scraper.livestate import LiveState, start_server as start_live_server
+from scraper.maintenance import PartitionMaintenance
+from scraper.ratelimit import RateLimiter, RequestBudgetExceeded
+from scraper.scheduler import PollScheduler
+from scraper.spool import Spool
+from scraper.trajectory import TrackCompressor
+from scraper.writer import IngestWriter
 
 logging.basicConfig(
     level=logging.INFO,
@@ -21,29 +40,96 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-@contextmanager
-def get_db_connection():
-    """Контекстный менеджер для подключения к БД с повторными попытками"""
-    for attempt in range(RETRY_CONFIG['db']['max_retries']):
-        conn = None
-        try:
-            conn = psycopg2.connect(**DB_CONFIG)
-            conn.autocommit = False
-            logger.debug("Успешное подключение к БД")
-            yield conn
-            return
-        except psycopg2.OperationalError as e:
-            logger.warning(f"Ошибка подключения (попытка {attempt+1}): {str(e)}")
-            if attempt < RETRY_CONFIG['db']['max_retries'] - 1:
-                sleep(RETRY_CONFIG['db']['initial_delay'] * (2 ** attempt))
-        finally:
-            if conn:
-                conn.close()
-    raise RuntimeError("Не удалось подключиться к БД после нескольких попыток")
+API_REQUESTS = REGISTRY.counter('aviation_api_requests_total', 'Запросы к API рейсов')
+API_QUOTA_REMAINING = REGISTRY.gauge('aviation_api_quota_remaining', 'Остаток месячной квоты API')
+CYCLE_ROWS = REGISTRY.gauge('aviation_cycle_rows', 'Рейсов на этапах последнего цикла', ('kind',))
+ROWS = REGISTRY.counter('aviation_rows_total', 'Рейсов на этапах за всё время', ('kind',))
+FRESHNESS_LAG = REGISTRY.gauge(
+    'aviation_data_freshness_seconds', 'Возраст самой свежей позиции в ответе API'
+)
+SCHEDULE_LAG = REGISTRY.gauge('aviation_schedule_lag_seconds', 'Опоздание цикла относительно плана')
+SCHEDULE_NEXT_RUN = REGISTRY.gauge('aviation_schedule_next_run_seconds', 'Секунд до запланированного опроса')
+SCHEDULE_INTERVAL = REGISTRY.gauge('aviation_schedule_interval_seconds', 'Последний выбранный интервал опроса')
+SCHEDULE_ACTIVITY = REGISTRY.gauge('aviation_schedule_activity', 'Оценка активности последнего цикла (0..1)')
+SCHEDULE_FAILURES = REGISTRY.gauge('aviation_schedule_consecutive_failures', 'Неудачных циклов подряд')
+API_QUOTA_USED = REGISTRY.gauge('aviation_api_quota_used', 'Запросов к API за текущий месяц')
+ACTIVE_TRACKS = REGISTRY.gauge('aviation_tracks_active', 'Рейсов в состоянии сжатия треков')
+
+
+def count_rows(kind: str, n: int) -> None:
+    CYCLE_ROWS.set(n, kind=kind)
+    ROWS.inc(n, kind=kind)
+
+
+def remaining_offsets(pagination: Dict[str, Any], received: int) -> List[int]:
+    """Смещения страниц, оставшихся после первой, по блоку pagination API"""
+    try:
+        total = int(pagination.get('total') or 0)
+        limit = int(pagination.get('limit') or FETCH_CONFIG['page_size'])
+        offset = int(pagination.get('offset') or 0)
+    except (TypeError, ValueError):
+        return []
+    if limit <= 0:
+        return []
+    return list(range(offset + max(received, limit), total, limit))
+
+
+def merge_flights(pages: List[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """Объединяет страницы, оставляя по ICAO рейса запись с самой свежей позицией.
+
+    Страницы при сдвиге выдачи API между запросами могут пересекаться.
+    Рейсы без ICAO не дедуплицируются и отсеиваются дальше валидацией.
+    """
+    merged: Dict[str, Dict[str, Any]] = {}
+    unkeyed = []
+    for page in pages:
+        for flight in page:
+            icao = ((flight.get('flight') or {}).get('icao')) if isinstance(flight, dict) else None
+            if not icao:
+                unkeyed.append(flight)
+                continue
+            current = merged.get(icao)
+            if current is None or _live_updated(flight) > _live_updated(current):
+                merged[icao] = flight
+    return list(merged.values()) + unkeyed
+
+
+def _live_updated(flight: Dict[str, Any]) -> str:
+    # ISO-8601 строки из одного источника сравниваются лексикографически
+    return str((flight.get('live') or {}).get('updated') or '')
+
+
+def freshness_lag(flights: List[Dict[str, Any]]) -> Optional[float]:
+    """Секунды с момента самого свежего live.updated в выдаче"""
+    newest = max((_live_updated(f) for f in flights if isinstance(f, dict)), default='')
+    try:
+        updated = datetime.fromisoformat(newest)
+    except ValueError:
+        return None
+    if updated.tzinfo is None:
+        updated = updated.replace(tzinfo=timezone.utc)
+    return (datetime.now(timezone.utc) - updated).total_seconds()
+
 
 class FlightTracker:
-    def __init__(self):
+    def __init__(self, api_url: str = API_URL):
+        self.api_url = api_url
         self.session = self._configure_session()
+        self.geofence = GeofenceEngine.from_config(GEOFENCE_ZONES, cell_size=GEOFENCE_CELL_SIZE)
+        self.scheduler = PollScheduler(
+            SCHEDULER_CONFIG,
+            zone_priorities={zone['name']: zone.get('priority', 1.0) for zone in GEOFENCE_ZONES}
+        )
+        self.last_request_count = 0
+        self.maintenance = PartitionMaintenance()
+        self.dimensions = Dimensions(DIMENSION_CACHE_CONFIG['max_size'])
+        self.compressor = (
+            TrackCompressor.from_config(TRACK_COMPRESSION_CONFIG)
+            if TRACK_COMPRESSION_CONFIG['enabled'] else None
+        )
+        self.archive = ArchiveWriter.from_config(ARCHIVE_CONFIG) if ARCHIVE_CONFIG['enabled'] else None
+        self.live = LiveState.from_config(LIVE_STATE_CONFIG) if LIVE_STATE_CONFIG['enabled'] else None
+        self.writer: Optional[IngestWriter] = None  # создаётся в run()
     
     def _configure_session(self) -> requests.Session:
         session = requests.Session()
@@ -53,219 +139,302 @@ class FlightTracker:
             status_forcelist=[500, 502, 503, 504],
             allowed_methods=["GET"]
         )
-        adapter = HTTPAdapter(max_retries=retry_strategy)
+        # Пул HTTP-соединений не меньше числа потоков, забирающих страницы
+        pool_size = max(10, FETCH_CONFIG['max_workers'])
+        adapter = HTTPAdapter(
+            max_retries=retry_strategy,
+            pool_connections=pool_size,
+            pool_maxsize=pool_size
+        )
         session.mount("https://", adapter)
         session.mount("http://", adapter)
         return session
 
-    def fetch_flights(self) -> List[Dict[str, Any]]:
-        try:
+    def _fetch_page(self, offset: int, limiter: RateLimiter) -> Optional[Dict[str, Any]]:
+        limiter.acquire()
+        API_REQUESTS.inc()
+        with stage('fetch_page'):
             response = self.session.get(
-                API_URL,
+                self.api_url,
                 params={
                     "access_key": API_KEY,
                     "flight_status": "active",
-                    "limit": 100
+                    "limit": FETCH_CONFIG['page_size'],
+                    "offset": offset
                 },
-                timeout=15
+                timeout=FETCH_CONFIG['timeout']
             )
             response.raise_for_status()
             data = response.json()
-            
-            if not isinstance(data.get('data'), list):
-                logger.error("Некорректный формат ответа API")
+
+        if not isinstance(data.get('data'), list):
+            logger.error(f"Некорректный формат ответа API (offset={offset})")
+            return None
+        return data
+
+    def _fetch_remaining_pages(
+        self, offsets: List[int], limiter: RateLimiter
+    ) -> List[List[Dict[str, Any]]]:
+        pages = []
+
+        def fetch(offset: int) -> Optional[Dict[str, Any]]:
+            try:
+                return self._fetch_page(offset, limiter)
+            except RequestBudgetExceeded:
+                return None
+            except Exception as e:
+                logger.error(f"Ошибка при получении страницы offset={offset}: {str(e)}")
+                return None
+
+        with ThreadPoolExecutor(max_workers=FETCH_CONFIG['max_workers']) as executor:
+            for page in executor.map(fetch, offsets):
+                if page is not None:
+                    pages.append(page['data'])
+        return pages
+
+    def fetch_flights(self, paginated: Optional[bool] = None) -> List[Dict[str, Any]]:
+        """Получает активные рейсы.
+
+        В постраничном режиме общее число рейсов берётся из блока pagination
+        первой страницы, остальные страницы забираются параллельно в пределах
+        FETCH_CONFIG, а результат дедуплицируется по ICAO рейса.
+        """
+        if paginated is None:
+            paginated = FETCH_CONFIG['paginated']
+        limiter = RateLimiter(
+            rate=FETCH_CONFIG['requests_per_second'],
+            burst=FETCH_CONFIG['burst'],
+            budget=FETCH_CONFIG['max_requests_per_cycle'] if paginated else 1
+        )
+
+        try:
+            first = self._fetch_page(0, limiter)
+            if first is None:
                 return []
-            
-            return data['data']
+            if not paginated:
+                return first['data']
+
+            offsets = remaining_offsets(first.get('pagination') or {}, len(first['data']))
+            if limiter.remaining is not None and len(offsets) > limiter.remaining:
+                logger.warning(
+                    f"Бюджет запросов позволяет получить {limiter.remaining} "
+                    f"из {len(offsets)} оставшихся страниц"
+                )
+                offsets = offsets[:limiter.remaining]
+
+            pages = [first['data']]
+            if offsets:
+                pages.extend(self._fetch_remaining_pages(offsets, limiter))
+            flights = merge_flights(pages)
+            logger.info(f"Получено {len(flights)} рейсов за {limiter.used} запросов")
+            return flights
         
         except Exception as e:
             logger.error(f"Ошибка при получении данных: {str(e)}")
             return []
 
+        finally:
+            self.last_request_count = limiter.used
+
     def filter_flights(self, flights: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        filtered = []
-        for flight in flights:
-            try:
-                live = flight.get('live') or {}
-                lat = live.get('latitude')
-                lon = live.get('longitude')
+        """Оставляет рейсы из зон GEOFENCE_ZONES; имена зон пишутся в flight['zones']"""
+        try:
+            with stage('filter'):
+                return self.geofence.filter_flights(flights)
+        except Exception as e:
+            logger.error(f"Ошибка фильтрации: {str(e)}", exc_info=True)
+            return []
 
-                if None in (lat, lon):
-                    continue
+    def prepare_records(self, flights: List[Dict[str, Any]]) -> Tuple[List[FlightRecord], int]:
+        """Валидация и сжатие треков. Возвращает записи к сохранению и число отклонённых.
 
-                try:
-                    lat_num = float(lat)
-                    lon_num = float(lon)
-                    if not (-90 <= lat_num <= 90) or not (-180 <= lon_num <= 180):
-                        continue
-                except (TypeError, ValueError):
-                    continue
+        Время наблюдения берётся из live.updated, как при загрузке архивов
+        (scraper.replay); записи без него получают время получения сразу,
+        чтобы при отложенной записи из журнала позиция не датировалась
+        временем вставки. В колоночный
+        архив и текущее состояние попадают все наблюдения, до сжатия треков.
+        """
+        with stage('parse'):
+            records, failure_count = prepare_flight_records(flights)
+        received_at = datetime.now(timezone.utc).replace(tzinfo=None)
+        records = [r if r.observed_at else r._replace(observed_at=received_at) for r in records]
+        if self.archive is not None:
+            with stage('archive'):
+                self.archive.append(records)
+        if self.live is not None:
+            with stage('live_update'):
+                self.live.update(records)
+        if self.compressor is not None:
+            received = len(records)
+            with stage('compress'):
+                records = self.compressor.process(records, received_at)
+            ACTIVE_TRACKS.set(len(self.compressor))
+            logger.info(f"После сжатия треков к записи {len(records)} из {received} позиций")
+        count_rows('to_write', len(records))
+        return records, failure_count
 
-                if (BLACK_SEA_BBOX[0] <= lat_num <= BLACK_SEA_BBOX[2] and 
-                    BLACK_SEA_BBOX[1] <= lon_num <= BLACK_SEA_BBOX[3]):
-                    filtered.append(flight)
-                    
-            except Exception as e:
-                logger.error(f"Ошибка фильтрации: {str(e)}", exc_info=True)
-        
-        return filtered
+    def finish_tracks(self, flush: bool = False) -> List[FlightRecord]:
+        """Отложенные точки треков для цикла без позиций в зоне и для остановки.
+
+        В пустом цикле завершаются рейсы, пропавшие из выдачи, как и в
+        обычном; при flush — все рейсы, чтобы при остановке конец трека не
+        остался только в памяти.
+        """
+        if self.compressor is None:
+            return []
+        with stage('compress'):
+            records = self.compressor.flush() if flush else self.compressor.process([])
+        ACTIVE_TRACKS.set(len(self.compressor))
+        if records:
+            logger.info(f"Сохраняются отложенные точки завершённых треков: {len(records)}")
+        count_rows('to_write', len(records))
+        return records
+
+    def write_records(self, records: List[FlightRecord]) -> Tuple[int, int]:
+        """Пишет записи одной транзакцией для фонового писателя.
+
+        Ошибки соединения пробрасываются: писатель повторяет транзакцию сам.
+        """
+        with get_db_connection() as conn:
+            saved, failed = save_flight_records(conn, records, self.dimensions)
+        count_rows('saved', saved)
+        count_rows('failed', failed)
+        logger.info(f"Записано в БД: Успешно {saved}, Ошибок {failed}")
+        return saved, failed
 
     def save_flights(self, flights: List[Dict[str, Any]]) -> None:
+        """Синхронное сохранение в потоке опроса (INGEST_CONFIG['async'] = False)"""
         logger.info(f"Начало сохранения {len(flights)} рейсов")
+        records, failure_count = self.prepare_records(flights)
+        self.save_records(records, failure_count)
+
+    def save_records(self, records: List[FlightRecord], failure_count: int = 0) -> None:
+        """Синхронная запись подготовленных записей с повторами"""
         success_count = 0
-        failure_count = 0
-
-        # Собираем уникальные aircrafts
-        aircrafts = {}
-        for flight in flights:
-            aircraft_data = flight.get('aircraft', {})
-            icao = aircraft_data.get('icao')
-            if icao:
-                model = aircraft_data.get('model', '').strip()
-                aircrafts[icao] = model or icao
-
-        if aircrafts:
+
+        # Весь цикл пишется одним соединением и одной транзакцией
+        max_retries = RETRY_CONFIG['db']['max_retries']
+        for attempt in range(max_retries if records else 0):
             try:
                 with get_db_connection() as conn:
-                    with conn.cursor() as cursor:
-                        insert_query = """
-                            INSERT INTO aircrafts (icao_code, model_name)
-                            VALUES (%s, %s)
-                            ON CONFLICT (icao_code) DO UPDATE SET
-                                model_name = CASE 
-                                    WHEN EXCLUDED.model_name != EXCLUDED.icao_code 
-                                    THEN EXCLUDED.model_name 
-                                    ELSE aircrafts.model_name 
-                                END
-                        """
-                        data = [(icao, model) for icao, model in aircrafts.items()]
-                        cursor.executemany(insert_query, data)
-                        conn.commit()
+                    try:
+                        saved, rejected = save_flight_records(conn, records, self.dimensions)
+                        success_count += saved
+                        failure_count += rejected
+                        break
+                    except psycopg2.Error as e:
+                        logger.error(f"Ошибка БД (попытка {attempt+1}): {str(e)}")
+                        if not conn.closed:
+                            conn.rollback()
+
+                if attempt == max_retries - 1:
+                    failure_count += len(records)
+                else:
+                    sleep(RETRY_CONFIG['db']['initial_delay'] * (2 ** attempt))
+
             except Exception as e:
-                logger.error(f"Ошибка сохранения aircrafts: {str(e)}")
-
-        # Сохраняем остальные данные
-        for idx, flight in enumerate(flights):
-            for attempt in range(RETRY_CONFIG['db']['max_retries']):
-                try:
-                    with get_db_connection() as conn:
-                        with conn.cursor(cursor_factory=RealDictCursor) as cursor:
-                            try:
-                                if not all(key in flight for key in ('airline', 'flight', 'live')):
-                                    raise ValueError("Некорректная структура данных рейса")
-
-                                airline_data = flight['airline']
-                                flight_data = flight['flight']
-                                aircraft_data = flight.get('aircraft', {})
-                                live_data = flight['live']
-
-                                # Сохранение авиакомпании
-                                cursor.execute(
-                                    """INSERT INTO airlines (name, icao_code)
-                                    VALUES (%(name)s, %(icao)s)
-                                    ON CONFLICT (icao_code) DO UPDATE SET
-                                        name = EXCLUDED.name
-                                    RETURNING id""",
-                                    {
-                                        'name': airline_data.get('name', 'Unknown Airline'),
-                                        'icao': airline_data['icao']
-                                    }
-                                )
-                                airline_id = cursor.fetchone()['id']
-
-                                # Сохранение рейса
-                                cursor.execute(
-                                    """INSERT INTO flights (
-                                        flight_icao,
-                                        aircraft_icao,
-                                        airline_id,
-                                        departure_airport,
-                                        arrival_airport
-                                    ) VALUES (
-                                        %(flight_icao)s,
-                                        %(aircraft_icao)s,
-                                        %(airline_id)s,
-                                        %(departure)s,
-                                        %(arrival)s
-                                    )
-                                    ON CONFLICT (flight_icao, airline_id) DO UPDATE SET
-                                        aircraft_icao = EXCLUDED.aircraft_icao,
-                                        departure_airport = EXCLUDED.departure_airport,
-                                        arrival_airport = EXCLUDED.arrival_airport,
-                                        updated_at = NOW()
-                                    RETURNING id""",
-                                    {
-                                        'flight_icao': flight_data['icao'],
-                                        'aircraft_icao': aircraft_data.get('icao'),
-                                        'airline_id': airline_id,
-                                        'departure': flight.get('departure', {}).get('airport', 'N/A'),
-                                        'arrival': flight.get('arrival', {}).get('airport', 'N/A')
-                                    }
-                                )
-                                flight_id = cursor.fetchone()['id']
-
-                                # Сохранение позиции
-                                cursor.execute(
-                                    """INSERT INTO flight_positions 
-                                    (flight_id, latitude, longitude, altitude)
-                                    VALUES (%s, %s, %s, %s)""",
-                                    (
-                                        flight_id,
-                                        float(live_data['latitude']),
-                                        float(live_data['longitude']),
-                                        float(live_data.get('altitude', 0))
-                                    )
-                                )
-
-                                conn.commit()
-                                success_count += 1
-                                break
-
-                            except (KeyError, TypeError, ValueError) as e:
-                                logger.error(f"Ошибка валидации данных рейса #{idx}: {str(e)}")
-                                conn.rollback()
-                                failure_count += 1
-                                break
-
-                            except psycopg2.Error as e:
-                                logger.error(f"Ошибка БД (попытка {attempt+1}): {str(e)}")
-                                conn.rollback()
-                                if attempt == RETRY_CONFIG['db']['max_retries'] - 1:
-                                    failure_count += 1
-                                sleep(RETRY_CONFIG['db']['initial_delay'] * (2 ** attempt))
-
-                except Exception as e:
-                    logger.error(f"Критическая ошибка: {str(e)}")
-                    failure_count += 1
+                logger.error(f"Критическая ошибка: {str(e)}")
+                failure_count += len(records)
+                break
 
+        count_rows('saved', success_count)
+        count_rows('failed', failure_count)
         logger.info(f"Итог сохранения: Успешно {success_count}, Ошибок {failure_count}")
 
+    def store_records(self, records: List[FlightRecord]) -> None:
+        """Передаёт записи фоновому писателю или пишет их сразу"""
+        if not records:
+            return
+        if self.writer is not None:
+            with stage('enqueue'):
+                self.writer.submit(records)
+        else:
+            with stage('save'):
+                self.save_records(records)
+
+    def _collect_metrics(self) -> None:
+        stats = self.scheduler.stats()
+        SCHEDULE_NEXT_RUN.set(stats['next_run_in'])
+        SCHEDULE_INTERVAL.set(stats['last_interval'])
+        SCHEDULE_ACTIVITY.set(stats['activity'])
+        SCHEDULE_FAILURES.set(stats['consecutive_failures'])
+        API_QUOTA_USED.set(stats['quota_used'])
+        if stats['quota_remaining'] is not None:
+            API_QUOTA_REMAINING.set(stats['quota_remaining'])
+
+    def _start_writer(self) -> IngestWriter:
+        spool = Spool(
+            INGEST_CONFIG['spool_path'],
+            segment_bytes=INGEST_CONFIG['segment_bytes'],
+            fsync=INGEST_CONFIG['fsync']
+        )
+        return IngestWriter(
+            spool,
+            self.write_records,
+            max_queue=INGEST_CONFIG['queue_max_batches'],
+            max_batch_records=INGEST_CONFIG['max_batch_records'],
+            retry_base_delay=INGEST_CONFIG['retry_base_delay'],
+            retry_max_delay=INGEST_CONFIG['retry_max_delay']
+        ).start()
+
     def run(self):
         logger.info("Сервис мониторинга запущен")
+        REGISTRY.add_collector(self._collect_metrics)
+        if INGEST_CONFIG['async'] and self.writer is None:
+            self.writer = self._start_writer()
         while True:
             try:
-                flights = self.fetch_flights()
-                if not flights:
-                    logger.warning("Нет данных о рейсах")
-                    sleep(60)
-                    continue
-
-                filtered = self.filter_flights(flights)
-                if not filtered:
-                    logger.info("Нет рейсов в зоне интереса")
-                    sleep(300)
-                    continue
+                with stage('maintenance'):
+                    self.maintenance.run_if_due()
+                if self.live is not None:
+                    self.live.expire()
+                self.scheduler.wait()
+                SCHEDULE_LAG.set(self.scheduler.last_lag)
+                with trace('scraper', METRICS_CONFIG['slow_cycle_seconds']):
+                    with stage('fetch'):
+                        flights = self.fetch_flights()
+                    self.scheduler.record_requests(self.last_request_count)
+                    count_rows('fetched', len(flights))
+                    if not flights:
+                        logger.warning("Нет данных о рейсах")
+                        self.scheduler.failure()
+                        continue
+                    lag = freshness_lag(flights)
+                    if lag is not None:
+                        FRESHNESS_LAG.set(lag)
 
-                self.save_flights(filtered)
-                sleep(3600)
+                    filtered = self.filter_flights(flights)
+                    count_rows('filtered', len(filtered))
+                    if not filtered:
+                        logger.info("Нет рейсов в зоне интереса")
+                        self.store_records(self.finish_tracks())
+                    elif self.writer is not None:
+                        records, _ = self.prepare_records(filtered)
+                        self.store_records(records)
+                    else:
+                        with stage('save'):
+                            self.save_flights(filtered)
+                    self.scheduler.success(filtered)
 
             except KeyboardInterrupt:
                 logger.info("Остановка по запросу пользователя")
                 break
             except Exception as e:
                 logger.error(f"Критическая ошибка: {str(e)}", exc_info=True)
-                sleep(60)
+                self.scheduler.failure()
+
+        self.store_records(self.finish_tracks(flush=True))
+        if self.writer is not None:
+            # Незаписанные пакеты остаются в журнале до следующего запуска
+            self.writer.stop(timeout=INGEST_CONFIG['shutdown_timeout'])
+        if self.archive is not None:
+            self.archive.close()
 
 if __name__ == "__main__":
+    if METRICS_CONFIG['enabled']:
+        start_http_server(METRICS_CONFIG['host'], METRICS_CONFIG['port'])
+        start_profiler(METRICS_CONFIG['profiler_interval'])
     tracker = FlightTracker()
-    tracker.run()
\ No newline at end of file
+    if tracker.live is not None:
+        start_live_server(tracker.live, LIVE_STATE_CONFIG['host'], LIVE_STATE_CONFIG['port'])
+    tracker.run()
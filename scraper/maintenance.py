@@ -0,0 +1,92 @@
+"""Обслуживание секций flight_positions: создание секций наперёд и удаление
+секций старше срока хранения (функции из init-db.sql). Почасовая
+статистика (flight_hours, flight_counts_hourly) не секционирована и
+чистится по тому же сроку удалением старых часов."""
+import logging
+import time
+from typing import Any, Dict, Optional
+
+from config import RETENTION_CONFIG
+from scraper.database import get_db_cursor
+
+logger = logging.getLogger(__name__)
+
+
+def ensure_partitions(start_date, end_date) -> int:
+    """Создаёт суточные секции на период; возвращает число созданных"""
+    with get_db_cursor() as cursor:
+        cursor.execute(
+            "SELECT ensure_flight_positions_partitions(%s, %s) AS created",
+            (start_date, end_date)
+        )
+        return cursor.fetchone()['created']
+
+
+def check_partitioned(cursor) -> None:
+    """Проверяет, что flight_positions секционирована.
+
+    База, созданная до секционирования, сохраняет обычную таблицу: функции
+    секций на ней падают, пока не выполнена миграция из init-db.sql.
+    """
+    cursor.execute(
+        "SELECT relkind FROM pg_class WHERE oid = to_regclass('flight_positions')"
+    )
+    row = cursor.fetchone()
+    if row is None or row['relkind'] != 'p':
+        raise RuntimeError(
+            "flight_positions не секционирована: выполните init-db.sql на существующей базе "
+            "(перенос в секции описан в README)"
+        )
+
+
+# Часы старше срока хранения позиций: пересчитать или сверить их уже не из чего
+ROLLUP_CUTOFF = "CURRENT_DATE - %(retain_days)s * INTERVAL '1 day'"
+
+
+def run_partition_maintenance() -> Dict[str, int]:
+    """Создаёт секции на partition_days_ahead суток вперёд и удаляет устаревшие
+    секции и часы статистики"""
+    params = {
+        'days_ahead': RETENTION_CONFIG['partition_days_ahead'],
+        'retain_days': RETENTION_CONFIG['retention_days']
+    }
+    with get_db_cursor() as cursor:
+        check_partitioned(cursor)
+        cursor.execute(
+            """SELECT ensure_flight_positions_partitions(
+                   CURRENT_DATE, CURRENT_DATE + %(days_ahead)s
+               ) AS created,
+               drop_old_flight_positions_partitions(%(retain_days)s) AS dropped""",
+            params
+        )
+        result = dict(cursor.fetchone())
+        cursor.execute(f"DELETE FROM flight_hours WHERE hour < {ROLLUP_CUTOFF}", params)
+        result['flight_hours_deleted'] = cursor.rowcount
+        cursor.execute(f"DELETE FROM flight_counts_hourly WHERE hour < {ROLLUP_CUTOFF}", params)
+        result['rollups_deleted'] = cursor.rowcount
+        return result
+
+
+class PartitionMaintenance:
+    """Запускает обслуживание секций не чаще maintenance_interval секунд"""
+
+    def __init__(self, interval: Optional[float] = None):
+        self.interval = RETENTION_CONFIG['maintenance_interval'] if interval is None else interval
+        self._last_run: Optional[float] = None
+
+    def run_if_due(self) -> Optional[Dict[str, Any]]:
+        now = time.monotonic()
+        if self._last_run is not None and now - self._last_run < self.interval:
+            return None
+        self._last_run = now
+        try:
+            result = run_partition_maintenance()
+            logger.info(
+                f"Обслуживание секций: создано {result['created']}, удалено {result['dropped']}; "
+                f"удалено часов статистики: рейсов {result['flight_hours_deleted']}, "
+                f"счётчиков {result['rollups_deleted']}"
+            )
+            return result
+        except Exception as e:
+            logger.error(f"Ошибка обслуживания секций flight_positions: {str(e)}")
+            return None
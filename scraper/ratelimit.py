@@ -0,0 +1,54 @@
+"""Ограничение частоты и общего бюджета запросов к API."""
+import threading
+import time
+from typing import Optional
+
+
+class RequestBudgetExceeded(RuntimeError):
+    """Бюджет запросов на текущий цикл исчерпан"""
+
+
+class RateLimiter:
+    """Token bucket на rate запросов в секунду с запасом burst и
+    необязательным общим бюджетом запросов.
+
+    reserve() не блокирует и возвращает задержку до разрешённого момента
+    запроса, поэтому лимитер подходит и для потоков (acquire), и для asyncio.
+    """
+
+    def __init__(self, rate: float, burst: int = 1, budget: Optional[int] = None):
+        if rate <= 0:
+            raise ValueError("rate должен быть положительным")
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.budget = budget
+        self.used = 0
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Резервирует один запрос и возвращает, сколько секунд нужно подождать"""
+        with self._lock:
+            if self.budget is not None and self.used >= self.budget:
+                raise RequestBudgetExceeded(f"Исчерпан бюджет из {self.budget} запросов")
+            self.used += 1
+
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def acquire(self) -> None:
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+    @property
+    def remaining(self) -> Optional[int]:
+        if self.budget is None:
+            return None
+        return max(0, self.budget - self.used)
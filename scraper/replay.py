@@ -0,0 +1,341 @@
+"""Загрузка архивов сырых ответов API через тот же конвейер, что и опрос.
+
+    python -m scraper.replay archive/2024-05 archive/2024-06 --workers 8
+    python -m scraper.replay archive/ --checkpoint replay.log --no-filter
+
+Принимаются каталоги (рекурсивно) и файлы .json, .jsonl и .ndjson, в том
+числе сжатые .gz, .bz2 и .xz. Документ — ответ /v1/flights (с полем data),
+список рейсов или один рейс; в JSONL каждая строка — такой документ.
+
+Разбор и фильтрация по GEOFENCE_ZONES идут в пуле процессов, а запись — в
+основном процессе пакетами save_flight_records по порядку файлов. Время
+позиции берётся из live.updated (иначе из времени изменения файла).
+Записанные файлы дописываются в журнал контрольных точек, и повторный
+запуск с тем же журналом пропускает их (со --compress — только когда все
+отложенные точки их треков записаны). Позиции с тем же рейсом и временем
+повторно не вставляются, поэтому загрузка идемпотентна и без журнала.
+
+Секции flight_positions за период архива создаются перед записью. Позиции
+старше RETENTION_CONFIG['retention_days'] будут удалены ближайшим
+обслуживанием секций, поэтому для загрузки длинной истории срок хранения
+нужно увеличить.
+"""
+import argparse
+import bz2
+import gzip
+import io
+import json
+import logging
+import lzma
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import date, datetime, timezone
+from typing import Any, Deque, Dict, Iterator, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+from config import (
+    DIMENSION_CACHE_CONFIG, GEOFENCE_CELL_SIZE, GEOFENCE_ZONES, RETENTION_CONFIG, RETRY_CONFIG,
+    TRACK_COMPRESSION_CONFIG
+)
+from scraper.database import get_db_connection
+from scraper.dimensions import Dimensions
+from scraper.geofence import GeofenceEngine
+from scraper.ingest import FlightRecord, parse_flight, save_flight_records
+from scraper.maintenance import ensure_partitions
+from scraper.trajectory import TrackCompressor
+from scraper.writer import RETRYABLE_ERRORS
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_SUFFIXES = ('.json', '.jsonl', '.ndjson')
+OPENERS = {'.gz': gzip.open, '.bz2': bz2.open, '.xz': lzma.open}
+
+
+class FileResult(NamedTuple):
+    key: str
+    records: List[FlightRecord]
+    flights: int
+    kept: int
+    invalid: int
+
+
+def archive_key(path: str) -> str:
+    """Ключ файла в журнале контрольных точек: путь и размер"""
+    return f"{os.path.abspath(path)}\t{os.path.getsize(path)}"
+
+
+def discover(paths: Sequence[str]) -> List[str]:
+    """Файлы архивов в путях; порядок — по имени файла (время съёмки в имени)"""
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                found.extend(os.path.join(root, name) for name in names)
+        else:
+            found.append(path)
+    return sorted(
+        (p for p in found if os.path.isfile(p) and _base_suffix(p) in ARCHIVE_SUFFIXES),
+        key=lambda p: (os.path.basename(p), p)
+    )
+
+
+def _split_compression(path: str) -> Tuple[str, Optional[str]]:
+    root, ext = os.path.splitext(path)
+    return (root, ext) if ext in OPENERS else (path, None)
+
+
+def _base_suffix(path: str) -> str:
+    return os.path.splitext(_split_compression(path)[0])[1].lower()
+
+
+def _flights_from_document(doc: Any) -> Iterator[Dict[str, Any]]:
+    if isinstance(doc, dict) and isinstance(doc.get('data'), list):
+        yield from doc['data']
+    elif isinstance(doc, list):
+        for item in doc:
+            yield from _flights_from_document(item)
+    elif isinstance(doc, dict):
+        yield doc
+
+
+def read_archive(path: str) -> Iterator[Dict[str, Any]]:
+    """Рейсы из файла архива"""
+    _, compression = _split_compression(path)
+    opener = OPENERS.get(compression, open)
+    with opener(path, 'rb') as raw:
+        stream = io.TextIOWrapper(raw, encoding='utf-8')
+        if _base_suffix(path) == '.json':
+            yield from _flights_from_document(json.load(stream))
+            return
+        for line_no, line in enumerate(stream, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                doc = json.loads(line)
+            except json.JSONDecodeError as e:
+                logger.warning(f"{path}:{line_no}: некорректный JSON: {str(e)}")
+                continue
+            yield from _flights_from_document(doc)
+
+
+_geofence: Optional[GeofenceEngine] = None
+
+
+def _init_worker(use_filter: bool) -> None:
+    global _geofence
+    _geofence = GeofenceEngine.from_config(GEOFENCE_ZONES, cell_size=GEOFENCE_CELL_SIZE) if use_filter else None
+
+
+def load_file(path: str) -> FileResult:
+    """Разбор и фильтрация одного файла (выполняется в процессе пула)"""
+    flights = list(read_archive(path))
+    kept = _geofence.filter_flights(flights) if _geofence is not None else flights
+    fallback = datetime.fromtimestamp(os.path.getmtime(path), timezone.utc).replace(tzinfo=None)
+    records = []
+    invalid = 0
+    for flight in kept:
+        try:
+            record = parse_flight(flight)
+        except (KeyError, TypeError, ValueError, AttributeError):
+            invalid += 1
+            continue
+        records.append(record if record.observed_at else record._replace(observed_at=fallback))
+    return FileResult(archive_key(path), records, len(flights), len(kept), invalid)
+
+
+class Checkpoint:
+    """Журнал записанных файлов: строка на файл, дописывается после коммита"""
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self.done: Set[str] = set()
+        if path and os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                self.done = {line.rstrip('\n') for line in f if line.strip()}
+
+    def add(self, keys: List[str]) -> None:
+        self.done.update(keys)
+        if not self.path or not keys:
+            return
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(''.join(f"{key}\n" for key in keys))
+            f.flush()
+            os.fsync(f.fileno())
+
+
+class Replayer:
+    def __init__(
+        self,
+        checkpoint: Checkpoint,
+        batch_records: int = 20000,
+        compress: bool = False,
+        dry_run: bool = False
+    ):
+        self.checkpoint = checkpoint
+        self.batch_records = batch_records
+        self.dry_run = dry_run
+        self.dimensions = Dimensions(DIMENSION_CACHE_CONFIG['max_size'])
+        self.compressor = TrackCompressor.from_config(TRACK_COMPRESSION_CONFIG) if compress else None
+        self._records: List[FlightRecord] = []
+        self._keys: List[str] = []
+        self._partitions: Set[date] = set()
+        self._retention_warned = False
+        self.stats = {
+            'files': 0, 'flights': 0, 'kept': 0, 'invalid': 0,
+            'records': 0, 'inserted': 0, 'failed': 0, 'batches': 0
+        }
+
+    def _ensure_partitions(self, records: List[FlightRecord]) -> None:
+        days = {r.observed_at.date() for r in records}
+        missing = sorted(days - self._partitions)
+        if not missing:
+            return
+        oldest = date.today().toordinal() - RETENTION_CONFIG['retention_days']
+        if missing[0].toordinal() < oldest and not self._retention_warned:
+            self._retention_warned = True
+            logger.warning(
+                f"Позиции за {missing[0]} старше срока хранения "
+                f"({RETENTION_CONFIG['retention_days']} сут.) и будут удалены обслуживанием секций"
+            )
+        ensure_partitions(missing[0], missing[-1])
+        self._partitions.update(
+            date.fromordinal(d) for d in range(missing[0].toordinal(), missing[-1].toordinal() + 1)
+        )
+
+    def _write(self, records: List[FlightRecord]) -> Tuple[int, int]:
+        max_retries = RETRY_CONFIG['db']['max_retries']
+        for attempt in range(max_retries):
+            try:
+                self._ensure_partitions(records)
+                with get_db_connection() as conn:
+                    return save_flight_records(conn, records, self.dimensions)
+            except RETRYABLE_ERRORS as e:
+                if attempt == max_retries - 1:
+                    raise
+                logger.warning(f"Ошибка БД (попытка {attempt+1}): {str(e)}")
+                time.sleep(RETRY_CONFIG['db']['initial_delay'] * (2 ** attempt))
+        return 0, 0
+
+    def flush(self) -> None:
+        """Записывает накопленные записи и отмечает их файлы в журнале.
+
+        При сжатии треков часть точек уже прочитанных файлов ещё отложена в
+        TrackCompressor; такие файлы отмечаются, только когда отложенных
+        точек не осталось (в худшем случае в finish()), иначе после
+        прерывания и продолжения эти точки не были бы записаны.
+        """
+        if self._records and not self.dry_run:
+            inserted, failed = self._write(self._records)
+            self.stats['inserted'] += inserted
+            self.stats['failed'] += failed
+            self.stats['batches'] += 1
+        self._records = []
+        if self.compressor is not None and self.compressor.held():
+            return
+        if not self.dry_run:
+            self.checkpoint.add(self._keys)
+        self._keys = []
+
+    def add(self, result: FileResult, received_at: datetime) -> None:
+        records = result.records
+        if self.compressor is not None:
+            records = self.compressor.process(records, received_at)
+        self._records.extend(records)
+        self._keys.append(result.key)
+        self.stats['files'] += 1
+        self.stats['flights'] += result.flights
+        self.stats['kept'] += result.kept
+        self.stats['invalid'] += result.invalid
+        self.stats['records'] += len(records)
+        if len(self._records) >= self.batch_records:
+            self.flush()
+
+    def finish(self) -> None:
+        if self.compressor is not None:
+            # Отложенные точки всех треков: рейсов больше не будет
+            pending = self.compressor.flush()
+            self._records.extend(pending)
+            self.stats['records'] += len(pending)
+        self.flush()
+
+    def run(self, files: List[str], workers: int, use_filter: bool) -> Dict[str, int]:
+        todo = [path for path in files if archive_key(path) not in self.checkpoint.done]
+        skipped = len(files) - len(todo)
+        if skipped:
+            logger.info(f"Пропущено уже загруженных файлов: {skipped}")
+        logger.info(f"К загрузке {len(todo)} файлов, процессов {workers}")
+
+        started = time.monotonic()
+        last_report = started
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker, initargs=(use_filter,)
+        ) as pool:
+            # Ограниченное окно задач: результаты идут в порядке файлов, а в
+            # памяти не копятся разобранные архивы целиком
+            window: Deque[Tuple[str, Future]] = deque()
+            paths = iter(todo)
+            for path in paths:
+                window.append((path, pool.submit(load_file, path)))
+                if len(window) >= workers * 2:
+                    break
+            while window:
+                path, future = window.popleft()
+                result = future.result()
+                mtime = datetime.fromtimestamp(os.path.getmtime(path), timezone.utc).replace(tzinfo=None)
+                self.add(result, mtime)
+                next_path = next(paths, None)
+                if next_path is not None:
+                    window.append((next_path, pool.submit(load_file, next_path)))
+
+                now = time.monotonic()
+                if now - last_report >= 10:
+                    last_report = now
+                    rate = self.stats['records'] / (now - started)
+                    logger.info(
+                        f"Файлов {self.stats['files']}/{len(todo)}, записей {self.stats['records']} "
+                        f"({rate:.0f}/с), вставлено {self.stats['inserted']}"
+                    )
+        self.finish()
+        self.stats['seconds'] = round(time.monotonic() - started, 1)
+        return self.stats
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Загрузка архивов ответов API в БД")
+    parser.add_argument('paths', nargs='+', help="файлы или каталоги с архивами")
+    parser.add_argument('--checkpoint', help="журнал загруженных файлов для продолжения после прерывания")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="процессов разбора")
+    parser.add_argument('--batch-records', type=int, default=20000, help="записей на транзакцию")
+    parser.add_argument('--no-filter', action='store_true', help="не фильтровать по GEOFENCE_ZONES")
+    parser.add_argument('--compress', action='store_true', help="сжимать треки, как при опросе")
+    parser.add_argument('--dry-run', action='store_true', help="только разобрать, без записи в БД")
+    args = parser.parse_args(argv)
+
+    files = discover(args.paths)
+    if not files:
+        logger.error("Файлы архивов не найдены")
+        return 1
+    replayer = Replayer(
+        Checkpoint(args.checkpoint),
+        batch_records=args.batch_records,
+        compress=args.compress,
+        dry_run=args.dry_run
+    )
+    try:
+        stats = replayer.run(files, max(1, args.workers), use_filter=not args.no_filter)
+    except KeyboardInterrupt:
+        logger.warning("Загрузка прервана; записанные файлы отмечены в журнале контрольных точек")
+        return 130
+    logger.info(f"Загрузка завершена: {json.dumps(stats, ensure_ascii=False)}")
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s [%(levelname)s] %(module)s:%(lineno)d - %(message)s'
+    )
+    sys.exit(main())
@@ -0,0 +1,238 @@
+"""Почасовая статистика парка (flight_counts_hourly).
+
+Счётчики обновляются инкрементально при каждой пакетной записи в той же
+транзакции; полный пересчёт таблицы не нужен. Для заполнения истории и
+проверки расхождений с базовыми таблицами модуль запускается как команда:
+
+    python -m scraper.rollups backfill --since 2024-05-01 --until 2024-06-01
+    python -m scraper.rollups check --since 2024-05-01
+
+Проверка и пересчёт возможны только за период, позиции которого ещё не
+удалены по сроку хранения; часы статистики старше этого срока удаляет
+обслуживание секций (scraper.maintenance).
+"""
+import argparse
+import logging
+import sys
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, Optional, Sequence, Tuple
+
+from psycopg2.extensions import cursor as Cursor
+from psycopg2.extras import execute_values
+
+from scraper.database import get_db_cursor, stream_query
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 1000
+UNKNOWN_AIRCRAFT = 'UNKNOWN'  # строка из init-db.sql для рейсов без самолёта
+
+# Строки (flight_id, aircraft_icao, airline_id, observed_at) по одной на
+# сохранённую позицию; new_hours возвращает только впервые увиденные в
+# часе рейсы, и только они увеличивают flight_count
+ROLLUP_UPSERT = """
+    WITH positions (flight_id, aircraft_icao, airline_id, hour) AS (
+        VALUES %s
+    ),
+    observed AS (
+        SELECT flight_id, aircraft_icao, airline_id, hour, COUNT(*) AS positions
+        FROM positions
+        GROUP BY flight_id, aircraft_icao, airline_id, hour
+    ),
+    new_hours AS (
+        INSERT INTO flight_hours (hour, flight_id)
+        SELECT DISTINCT hour, flight_id FROM observed
+        ON CONFLICT DO NOTHING
+        RETURNING hour, flight_id
+    )
+    INSERT INTO flight_counts_hourly (hour, aircraft_icao, airline_id, flight_count, position_count)
+    SELECT
+        o.hour,
+        o.aircraft_icao,
+        o.airline_id,
+        COUNT(n.flight_id),
+        SUM(o.positions)
+    FROM observed o
+    LEFT JOIN new_hours n ON n.hour = o.hour AND n.flight_id = o.flight_id
+    GROUP BY o.hour, o.aircraft_icao, o.airline_id
+    ORDER BY o.hour, o.aircraft_icao, o.airline_id
+    ON CONFLICT (hour, aircraft_icao, airline_id) DO UPDATE SET
+        flight_count = flight_counts_hourly.flight_count + EXCLUDED.flight_count,
+        position_count = flight_counts_hourly.position_count + EXCLUDED.position_count
+"""
+ROLLUP_TEMPLATE = (
+    "(%s::integer, %s::varchar, %s::integer, "
+    "date_trunc('hour', COALESCE(%s::timestamp, LOCALTIMESTAMP)))"
+)
+
+# Эталонная статистика из базовых таблиц за период [since, until)
+BASE_COUNTS = """
+    SELECT
+        date_trunc('hour', fp.timestamp) AS hour,
+        COALESCE(f.aircraft_icao, %(unknown)s) AS aircraft_icao,
+        f.airline_id,
+        COUNT(DISTINCT fp.flight_id) AS flight_count,
+        COUNT(*) AS position_count
+    FROM flight_positions fp
+    JOIN flights f ON fp.flight_id = f.id
+    WHERE fp.timestamp >= %(since)s AND fp.timestamp < %(until)s
+    GROUP BY 1, 2, 3
+"""
+
+
+def update_hourly_rollups(
+    cursor: Cursor,
+    rows: Sequence[Tuple[int, Optional[str], int, Optional[datetime]]]
+) -> None:
+    """Увеличивает счётчики по сохранённым позициям в текущей транзакции"""
+    if not rows:
+        return
+    execute_values(
+        cursor,
+        ROLLUP_UPSERT,
+        [(flight_id, aircraft or UNKNOWN_AIRCRAFT, airline_id, observed_at)
+         for flight_id, aircraft, airline_id, observed_at in rows],
+        template=ROLLUP_TEMPLATE,
+        page_size=PAGE_SIZE
+    )
+
+
+def _hours(since: datetime, until: datetime) -> Tuple[datetime, datetime]:
+    """Расширяет период до целых часов: статистика хранится по часам"""
+    start = since.replace(minute=0, second=0, microsecond=0)
+    end = until.replace(minute=0, second=0, microsecond=0)
+    if end < until:
+        end += timedelta(hours=1)
+    return start, end
+
+
+def backfill(since: datetime, until: datetime) -> Dict[str, int]:
+    """Пересчитывает статистику за период из flight_positions.
+
+    Период расширяется до целых часов, иначе час начала удалялся бы не
+    полностью, а вставлялся заново. Таблицы статистики блокируются от
+    записи на время пересчёта, чтобы параллельная запись пакетов не учла
+    позиции дважды.
+    """
+    since, until = _hours(since, until)
+    params = {'since': since, 'until': until, 'unknown': UNKNOWN_AIRCRAFT}
+    with get_db_cursor() as cursor:
+        cursor.execute(
+            "LOCK TABLE flight_hours, flight_counts_hourly IN SHARE ROW EXCLUSIVE MODE"
+        )
+        cursor.execute(
+            "DELETE FROM flight_counts_hourly WHERE hour >= %(since)s AND hour < %(until)s",
+            params
+        )
+        cursor.execute(
+            "DELETE FROM flight_hours WHERE hour >= %(since)s AND hour < %(until)s",
+            params
+        )
+        cursor.execute(
+            """INSERT INTO flight_hours (hour, flight_id)
+            SELECT DISTINCT date_trunc('hour', timestamp), flight_id
+            FROM flight_positions
+            WHERE timestamp >= %(since)s AND timestamp < %(until)s
+                AND flight_id IS NOT NULL""",
+            params
+        )
+        hours = cursor.rowcount
+        cursor.execute(
+            f"""INSERT INTO flight_counts_hourly
+                (hour, aircraft_icao, airline_id, flight_count, position_count)
+            {BASE_COUNTS}""",
+            params
+        )
+        buckets = cursor.rowcount
+    logger.info(f"Статистика пересчитана: часов рейсов {hours}, корзин {buckets}")
+    return {'flight_hours': hours, 'buckets': buckets}
+
+
+def check(since: datetime, until: datetime) -> Iterator[Dict[str, Any]]:
+    """Сравнивает статистику с базовыми таблицами; расхождения читаются потоком.
+
+    Сверка идёт по часу и авиакомпании. Счётчики относят позиции к самолёту,
+    который был у рейса в момент записи, а в flights хранится текущий:
+    после смены самолёта рейса сверка по самолётам давала бы ложные
+    расхождения. По той же причине backfill раскладывает пересчитанные
+    часы по текущему самолёту рейса. Период, как и в backfill, расширяется
+    до целых часов.
+    """
+    since, until = _hours(since, until)
+    params = {'since': since, 'until': until, 'unknown': UNKNOWN_AIRCRAFT}
+    return stream_query(
+        f"""WITH base AS (
+                SELECT hour, airline_id, SUM(flight_count) AS flight_count,
+                    SUM(position_count) AS position_count
+                FROM ({BASE_COUNTS}) counts
+                GROUP BY 1, 2
+            ),
+            rollup AS (
+                SELECT hour, airline_id, SUM(flight_count) AS flight_count,
+                    SUM(position_count) AS position_count
+                FROM flight_counts_hourly
+                WHERE hour >= %(since)s AND hour < %(until)s
+                GROUP BY 1, 2
+            )
+            SELECT
+                COALESCE(b.hour, r.hour) AS hour,
+                COALESCE(b.airline_id, r.airline_id) AS airline_id,
+                b.flight_count AS expected_flights,
+                r.flight_count AS actual_flights,
+                b.position_count AS expected_positions,
+                r.position_count AS actual_positions
+            FROM base b
+            FULL JOIN rollup r
+                ON r.hour = b.hour
+                AND r.airline_id = b.airline_id
+            WHERE b.flight_count IS DISTINCT FROM r.flight_count
+                OR b.position_count IS DISTINCT FROM r.position_count
+            ORDER BY 1, 2""",
+        params
+    )
+
+
+def _parse_time(value: str) -> datetime:
+    """Время ISO; со смещением переводится в UTC без зоны, как timestamp в БД"""
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Почасовая статистика парка")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    for name, help_text in (
+        ('backfill', "пересчитать статистику за период из flight_positions"),
+        ('check', "сверить статистику с базовыми таблицами")
+    ):
+        sub = subparsers.add_parser(name, help=help_text)
+        sub.add_argument('--since', type=_parse_time, required=True, help="начало периода (ISO, UTC)")
+        sub.add_argument('--until', type=_parse_time, help="конец периода (ISO, UTC), по умолчанию — следующий час")
+    args = parser.parse_args(argv)
+
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    until = args.until or now.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+    if args.command == 'backfill':
+        backfill(args.since, until)
+        return 0
+
+    mismatches = 0
+    for row in check(args.since, until):
+        mismatches += 1
+        logger.warning(
+            f"{row['hour']} airline={row['airline_id']}: "
+            f"рейсов {row['actual_flights']} (ожидалось {row['expected_flights']}), "
+            f"позиций {row['actual_positions']} (ожидалось {row['expected_positions']})"
+        )
+    logger.info(f"Расхождений: {mismatches}")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s [%(levelname)s] %(module)s:%(lineno)d - %(message)s'
+    )
+    sys.exit(main())
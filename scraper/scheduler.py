@@ -0,0 +1,231 @@
+"""Адаптивный планировщик опросов API.
+
+Интервал до следующего опроса сокращается при плотном трафике, заметных
+перемещениях бортов и попаданиях в приоритетные зоны и растягивается, когда
+в зонах пусто. Сверху интервал ограничен остатком квоты API на текущий
+месяц, при ошибках применяется экспоненциальная задержка со случайным
+разбросом. Расход квоты за месяц сохраняется в файл config['state_path'] и
+переживает перезапуск сервиса.
+"""
+import json
+import logging
+import math
+import os
+import random
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def _month_end(now: datetime) -> datetime:
+    if now.month == 12:
+        return now.replace(year=now.year + 1, month=1, day=1, hour=0, minute=0, second=0, microsecond=0)
+    return now.replace(month=now.month + 1, day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * 6371.0 * math.asin(min(1.0, math.sqrt(a)))
+
+
+class PollScheduler:
+    """Выбирает момент следующего опроса по наблюдаемой активности"""
+
+    def __init__(
+        self,
+        config: Dict[str, Any],
+        zone_priorities: Optional[Dict[str, float]] = None,
+        clock: Callable[[], float] = time.time,
+        sleep: Callable[[float], None] = time.sleep,
+        rng: Optional[random.Random] = None
+    ):
+        self.config = config
+        self.zone_priorities = zone_priorities or {}
+        self._clock = clock
+        self._sleep = sleep
+        self._rng = rng or random.Random()
+
+        self._positions: Dict[str, Tuple[float, float]] = {}
+        self._quota_month: Optional[Tuple[int, int]] = None
+        self.quota_used = 0
+        self._requests_per_cycle = 1
+        self.consecutive_failures = 0
+        self.next_run_at = clock()
+        self.last_interval = 0.0
+        self.last_lag = 0.0
+        self.last_activity = 0.0
+        self.state_path = config.get('state_path')
+        self._load_quota()
+
+    # --- квота API ---
+
+    def _load_quota(self) -> None:
+        """Восстанавливает расход квоты текущего месяца из файла состояния"""
+        if not self.state_path or not os.path.exists(self.state_path):
+            return
+        try:
+            with open(self.state_path, encoding='utf-8') as f:
+                state = json.load(f)
+            period = (int(state['year']), int(state['month']))
+            used = int(state['quota_used'])
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Не удалось прочитать состояние квоты {self.state_path}: {str(e)}")
+            return
+        now = datetime.fromtimestamp(self._clock(), timezone.utc)
+        if period == (now.year, now.month):
+            self._quota_month = period
+            self.quota_used = used
+            logger.info(f"Расход квоты API за месяц восстановлен: {used} запросов")
+
+    def _save_quota(self) -> None:
+        """Записывает расход квоты атомарно: временный файл и os.replace"""
+        if not self.state_path or self._quota_month is None:
+            return
+        year, month = self._quota_month
+        tmp_path = f"{self.state_path}.tmp"
+        try:
+            directory = os.path.dirname(self.state_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'year': year, 'month': month, 'quota_used': self.quota_used}, f)
+            os.replace(tmp_path, self.state_path)
+        except OSError as e:
+            logger.warning(f"Не удалось сохранить состояние квоты {self.state_path}: {str(e)}")
+
+    def _roll_quota_period(self, now: datetime) -> None:
+        period = (now.year, now.month)
+        if period != self._quota_month:
+            self._quota_month = period
+            self.quota_used = 0
+
+    def record_requests(self, count: int) -> None:
+        """Учитывает запросы к API, сделанные в этом цикле"""
+        self._roll_quota_period(datetime.fromtimestamp(self._clock(), timezone.utc))
+        self.quota_used += count
+        self._requests_per_cycle = max(1, count)
+        if count:
+            self._save_quota()
+
+    @property
+    def quota_remaining(self) -> Optional[int]:
+        quota = self.config.get('monthly_quota')
+        if quota is None:
+            return None
+        return max(0, quota - self.quota_used)
+
+    def _quota_interval(self) -> float:
+        """Минимальный интервал, при котором квоты хватит до конца месяца"""
+        remaining = self.quota_remaining
+        if remaining is None:
+            return 0.0
+        now = datetime.fromtimestamp(self._clock(), timezone.utc)
+        self._roll_quota_period(now)
+        seconds_left = (_month_end(now) - now).total_seconds()
+        cycles_left = remaining // self._requests_per_cycle
+        if cycles_left <= 0:
+            return seconds_left
+        return seconds_left / cycles_left
+
+    # --- оценка активности ---
+
+    def _change_ratio(self, flights: List[Dict[str, Any]]) -> float:
+        """Доля рейсов, которые появились или сместились дальше порога"""
+        threshold = self.config['change_threshold_km']
+        positions = {}
+        changed = 0
+        for flight in flights:
+            icao = (flight.get('flight') or {}).get('icao')
+            live = flight.get('live') or {}
+            try:
+                point = (float(live['latitude']), float(live['longitude']))
+            except (KeyError, TypeError, ValueError):
+                continue
+            if not icao:
+                continue
+            positions[icao] = point
+            previous = self._positions.get(icao)
+            if previous is None or haversine_km(*previous, *point) > threshold:
+                changed += 1
+        self._positions = positions
+        return changed / len(positions) if positions else 0.0
+
+    def _priority(self, flights: List[Dict[str, Any]]) -> float:
+        zones = {zone for flight in flights for zone in flight.get('zones', ())}
+        if not zones:
+            return 1.0
+        return max(self.zone_priorities.get(zone, 1.0) for zone in zones)
+
+    def _activity(self, flights: List[Dict[str, Any]]) -> float:
+        cfg = self.config
+        density = min(1.0, len(flights) / cfg['density_reference'])
+        change = self._change_ratio(flights)
+        activity = (cfg['density_weight'] * density + cfg['change_weight'] * change) * self._priority(flights)
+        return min(1.0, max(0.0, activity))
+
+    # --- планирование ---
+
+    def _schedule(self, interval: float) -> float:
+        self.last_interval = interval
+        self.next_run_at = self._clock() + interval
+        logger.info(f"Следующий опрос через {interval:.0f} с")
+        return interval
+
+    def success(self, flights: Iterable[Dict[str, Any]]) -> float:
+        """Планирует опрос после успешного цикла; flights — рейсы в зонах"""
+        cfg = self.config
+        flights = list(flights)
+        self.consecutive_failures = 0
+        self.last_activity = self._activity(flights)
+        interval = cfg['max_interval'] - (cfg['max_interval'] - cfg['min_interval']) * self.last_activity
+        quota_interval = self._quota_interval()
+        if quota_interval > interval:
+            logger.info(f"Интервал увеличен до {quota_interval:.0f} с для экономии квоты API")
+        return self._schedule(max(cfg['min_interval'], interval, quota_interval))
+
+    def failure(self) -> float:
+        """Планирует повтор после ошибки: экспонента с разбросом (equal jitter)"""
+        cfg = self.config
+        self.consecutive_failures += 1
+        ceiling = min(
+            cfg['failure_max_delay'],
+            cfg['failure_base_delay'] * (2 ** (self.consecutive_failures - 1))
+        )
+        interval = ceiling / 2 + self._rng.uniform(0, ceiling / 2)
+        remaining = self.quota_remaining
+        if remaining is not None and remaining < self._requests_per_cycle:
+            # Квота исчерпана: повтор имеет смысл только после её обновления
+            interval = max(interval, self._quota_interval())
+        return self._schedule(interval)
+
+    def delay(self) -> float:
+        """Секунд до запланированного опроса"""
+        return max(0.0, self.next_run_at - self._clock())
+
+    def mark_started(self) -> None:
+        """Запоминает опоздание старта цикла относительно плана"""
+        self.last_lag = max(0.0, self._clock() - self.next_run_at)
+
+    def wait(self) -> None:
+        """Спит до запланированного момента и запоминает опоздание старта"""
+        delay = self.delay()
+        if delay > 0:
+            self._sleep(delay)
+        self.mark_started()
+
+    def stats(self) -> Dict[str, Any]:
+        """Состояние планировщика для метрик (FlightTracker._collect_metrics)"""
+        return {
+            'next_run_at': datetime.fromtimestamp(self.next_run_at, timezone.utc).isoformat(),
+            'next_run_in': max(0.0, self.next_run_at - self._clock()),
+            'last_interval': self.last_interval,
+            'lag_seconds': self.last_lag,
+            'activity': self.last_activity,
+            'consecutive_failures': self.consecutive_failures,
+            'quota_used': self.quota_used,
+            'quota_remaining': self.quota_remaining
+        }
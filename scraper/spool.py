@@ -0,0 +1,196 @@
+"""Журнал пакетов на диске (spool) между опросом API и записью в БД.
+
+Каждый пакет цикла сначала дописывается в журнал и только потом уходит
+писателю, поэтому ни медленная или недоступная БД, ни перезапуск процесса
+не теряют данные. После фиксации в БД писатель подтверждает (ack) номер
+последнего записанного пакета; полностью подтверждённые сегменты удаляются.
+Гарантия — «хотя бы один раз»: пакет, записанный, но не подтверждённый до
+падения, после перезапуска будет записан повторно; уже сохранённые позиции
+при этом пропускаются по уникальному индексу (flight_id, timestamp).
+
+Журнал — каталог сегментов NNNNNNNNNNNN.seg. Запись в сегменте: заголовок
+(номер пакета, время создания, длина, CRC32) и JSON со строками
+FlightRecord. Запись с неверной длиной или контрольной суммой (обрыв при
+падении) завершает чтение сегмента; новые пакеты после запуска пишутся в
+новый сегмент.
+"""
+import json
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from scraper.ingest import FlightRecord
+
+logger = logging.getLogger(__name__)
+
+HEADER = struct.Struct('>QdII')  # номер, время создания, длина, crc32
+SEGMENT_SUFFIX = '.seg'
+ACK_FILE = 'ack'
+
+
+class SpoolEntry(NamedTuple):
+    seq: int
+    created_at: float
+    segment: int
+    offset: int
+    length: int
+
+
+def encode_records(records: List[FlightRecord]) -> bytes:
+    return json.dumps([
+        [*r[:-1], r.observed_at.isoformat() if r.observed_at else None] for r in records
+    ], separators=(',', ':')).encode()
+
+
+def decode_records(payload: bytes) -> List[FlightRecord]:
+    records = []
+    for row in json.loads(payload):
+        observed_at = datetime.fromisoformat(row[-1]) if row[-1] else None
+        records.append(FlightRecord(*row[:-1], observed_at=observed_at))
+    return records
+
+
+class Spool:
+    """Журнал пакетов; методы потокобезопасны"""
+
+    def __init__(self, path: str, segment_bytes: int = 16 * 1024 * 1024, fsync: bool = True):
+        self.path = path
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._index: Dict[int, SpoolEntry] = {}   # неподтверждённые пакеты
+        self._segments: Dict[int, int] = {}       # сегмент -> последний номер в нём
+        self.acked = 0
+        self.corrupted = 0
+        os.makedirs(path, exist_ok=True)
+        self._load()
+        self.next_seq = max([self.acked, *self._segments.values()]) + 1
+        self._segment = max(self._segments, default=0) + 1
+        self._file = None
+        self._size = 0
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.path, f"{segment:012d}{SEGMENT_SUFFIX}")
+
+    def _load(self) -> None:
+        ack_path = os.path.join(self.path, ACK_FILE)
+        if os.path.exists(ack_path):
+            with open(ack_path) as f:
+                self.acked = int(f.read().strip() or 0)
+
+        segments = sorted(
+            int(name[:-len(SEGMENT_SUFFIX)]) for name in os.listdir(self.path)
+            if name.endswith(SEGMENT_SUFFIX) and name[:-len(SEGMENT_SUFFIX)].isdigit()
+        )
+        for segment in segments:
+            last = 0
+            with open(self._segment_path(segment), 'rb') as f:
+                data = f.read()
+            offset = 0
+            while offset + HEADER.size <= len(data):
+                seq, created_at, length, crc = HEADER.unpack_from(data, offset)
+                payload = data[offset + HEADER.size:offset + HEADER.size + length]
+                if len(payload) != length or zlib.crc32(payload) != crc:
+                    self.corrupted += 1
+                    logger.warning(
+                        f"Сегмент {segment}: повреждённая запись на смещении {offset}, "
+                        f"остаток сегмента пропущен"
+                    )
+                    break
+                if seq > self.acked:
+                    self._index[seq] = SpoolEntry(seq, created_at, segment, offset, length)
+                last = max(last, seq)
+                offset += HEADER.size + length
+            if last <= self.acked:
+                os.remove(self._segment_path(segment))
+            else:
+                self._segments[segment] = last
+
+        if self._index:
+            logger.info(f"В журнале {len(self._index)} незаписанных пакетов, начиная с #{min(self._index)}")
+
+    def _open_segment(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._segment += 1
+        self._file = open(self._segment_path(self._segment), 'ab')
+        self._size = self._file.tell()
+
+    def append(self, records: List[FlightRecord]) -> int:
+        """Дописывает пакет и возвращает его номер после сброса на диск"""
+        payload = encode_records(records)
+        with self._lock:
+            if self._file is None or self._size >= self.segment_bytes:
+                self._open_segment()
+            seq = self.next_seq
+            created_at = time.time()
+            offset = self._size
+            self._file.write(HEADER.pack(seq, created_at, len(payload), zlib.crc32(payload)))
+            self._file.write(payload)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self._size += HEADER.size + len(payload)
+            self._index[seq] = SpoolEntry(seq, created_at, self._segment, offset, len(payload))
+            self._segments[self._segment] = seq
+            self.next_seq += 1
+            return seq
+
+    def next_pending(self, after: int) -> Optional[SpoolEntry]:
+        """Первый неподтверждённый пакет с номером больше after"""
+        with self._lock:
+            candidates = [seq for seq in self._index if seq > after]
+            return self._index[min(candidates)] if candidates else None
+
+    def read(self, entry: SpoolEntry) -> List[FlightRecord]:
+        with open(self._segment_path(entry.segment), 'rb') as f:
+            f.seek(entry.offset + HEADER.size)
+            payload = f.read(entry.length)
+        return decode_records(payload)
+
+    def ack(self, seq: int) -> None:
+        """Подтверждает запись всех пакетов до seq включительно"""
+        with self._lock:
+            if seq <= self.acked:
+                return
+            ack_path = os.path.join(self.path, ACK_FILE)
+            tmp_path = ack_path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                f.write(str(seq))
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+            os.replace(tmp_path, ack_path)
+            self.acked = seq
+            for done in [s for s in self._index if s <= seq]:
+                del self._index[done]
+            for segment, last in list(self._segments.items()):
+                if last <= seq and segment != self._segment:
+                    del self._segments[segment]
+                    os.remove(self._segment_path(segment))
+
+    @property
+    def pending(self) -> int:
+        return len(self._index)
+
+    def size_bytes(self) -> int:
+        with self._lock:
+            segments = list(self._segments)
+        total = 0
+        for segment in segments:
+            try:
+                total += os.path.getsize(self._segment_path(segment))
+            except OSError:
+                pass
+        return total
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
@@ -0,0 +1,204 @@
+"""Сжатие треков при приёме: отбрасывание дублей и онлайн-упрощение.
+
+Для каждого рейса в памяти хранятся последняя сохранённая точка (якорь) и
+точки, полученные после неё, но ещё не сохранённые. Новая точка продлевает
+отрезок от якоря; пока все отложенные точки восстанавливаются линейной
+интерполяцией по времени на этом отрезке с погрешностью не больше допусков
+по расстоянию, курсу и высоте, они не сохраняются. Как только допуск
+нарушен, сохраняется последняя отложенная точка и становится новым якорем
+(алгоритм «открывающегося окна» с синхронным евклидовым расстоянием).
+
+Поэтому трек, восстановленный интерполяцией между сохранёнными точками,
+отличается от исходного не больше чем на допуск. Чтобы последняя позиция
+не задерживалась бесконечно на прямом участке, точка сохраняется не реже
+max_gap_seconds, а отложенная точка рейса, пропавшего из выдачи,
+сохраняется при следующем цикле — в том числе пустом, когда в зоне нет ни
+одного рейса. При остановке сервиса flush() отдаёт отложенные точки всех
+рейсов, чтобы конец трека не терялся.
+"""
+import logging
+import math
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from scraper.ingest import FlightRecord
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_M = 6371000.0
+
+FlightKey = Tuple[str, str]
+
+
+def _local_xy(lat0: float, lon0: float, lat: float, lon: float) -> Tuple[float, float]:
+    """Равнопромежуточная проекция вокруг (lat0, lon0) в метрах"""
+    dlon = (lon - lon0 + 540) % 360 - 180  # через антимеридиан
+    x = math.radians(dlon) * EARTH_RADIUS_M * math.cos(math.radians((lat + lat0) / 2))
+    y = math.radians(lat - lat0) * EARTH_RADIUS_M
+    return x, y
+
+
+def _bearing(dx: float, dy: float) -> float:
+    return math.degrees(math.atan2(dx, dy)) % 360
+
+
+def _angle_diff(a: float, b: float) -> float:
+    return abs((a - b + 180) % 360 - 180)
+
+
+class _Track:
+    __slots__ = ('anchor', 'pending')
+
+    def __init__(self, anchor: FlightRecord):
+        self.anchor = anchor
+        self.pending: List[FlightRecord] = []
+
+
+class TrackCompressor:
+    """Онлайн-упрощение треков; process() возвращает точки для сохранения"""
+
+    def __init__(
+        self,
+        distance_tolerance_m: float,
+        altitude_tolerance: float,
+        heading_tolerance_deg: float,
+        max_gap_seconds: float,
+        max_buffer: int = 50
+    ):
+        self.distance_tolerance = distance_tolerance_m
+        self.altitude_tolerance = altitude_tolerance
+        self.heading_tolerance = heading_tolerance_deg
+        self.max_gap = max_gap_seconds
+        self.max_buffer = max_buffer
+        self._tracks: Dict[FlightKey, _Track] = {}
+        self.stats = {'received': 0, 'stored': 0, 'duplicates': 0, 'simplified': 0}
+
+    @classmethod
+    def from_config(cls, config: Dict) -> 'TrackCompressor':
+        return cls(
+            distance_tolerance_m=config['distance_tolerance_m'],
+            altitude_tolerance=config['altitude_tolerance'],
+            heading_tolerance_deg=config['heading_tolerance_deg'],
+            max_gap_seconds=config['max_gap_seconds'],
+            max_buffer=config['max_buffer']
+        )
+
+    def __len__(self) -> int:
+        return len(self._tracks)
+
+    def held(self) -> int:
+        """Число отложенных, ещё не отданных к сохранению точек"""
+        return sum(len(track.pending) for track in self._tracks.values())
+
+    def _is_duplicate(self, last: FlightRecord, point: FlightRecord) -> bool:
+        x, y = _local_xy(last.latitude, last.longitude, point.latitude, point.longitude)
+        return (
+            math.hypot(x, y) <= self.distance_tolerance
+            and abs(point.altitude - last.altitude) <= self.altitude_tolerance
+        )
+
+    def _fits(self, anchor: FlightRecord, pending: List[FlightRecord], point: FlightRecord) -> bool:
+        """Восстанавливаются ли отложенные точки на отрезке anchor -> point"""
+        t0 = anchor.observed_at
+        span = (point.observed_at - t0).total_seconds()
+        end_x, end_y = _local_xy(anchor.latitude, anchor.longitude, point.latitude, point.longitude)
+        segment_bearing = _bearing(end_x, end_y)
+
+        for mid in pending:
+            frac = (mid.observed_at - t0).total_seconds() / span if span > 0 else 1.0
+            x, y = _local_xy(anchor.latitude, anchor.longitude, mid.latitude, mid.longitude)
+            if math.hypot(x - frac * end_x, y - frac * end_y) > self.distance_tolerance:
+                return False
+            altitude = anchor.altitude + frac * (point.altitude - anchor.altitude)
+            if abs(mid.altitude - altitude) > self.altitude_tolerance:
+                return False
+            if (
+                math.hypot(x, y) > self.distance_tolerance
+                and _angle_diff(_bearing(x, y), segment_bearing) > self.heading_tolerance
+            ):
+                return False
+        return True
+
+    def _add(self, key: FlightKey, point: FlightRecord, out: List[FlightRecord]) -> None:
+        track = self._tracks.get(key)
+        if track is None:
+            self._tracks[key] = _Track(point)
+            out.append(point)
+            return
+
+        last = track.pending[-1] if track.pending else track.anchor
+        if point.observed_at <= last.observed_at:
+            # Точка не новее уже полученной (повтор той же выдачи API)
+            self.stats['duplicates'] += 1
+            return
+
+        if self._is_duplicate(last, point):
+            # Стоящий борт: серия совпадающих точек схлопывается до первой и
+            # последней, чтобы интерполяция не «сдвигала» его раньше начала
+            # движения
+            self.stats['duplicates'] += 1
+            previous = track.pending[-2] if len(track.pending) > 1 else track.anchor
+            if track.pending and self._is_duplicate(previous, last):
+                track.pending.pop()
+
+        if not self._fits(track.anchor, track.pending, point):
+            # Отрезок до новой точки уже не описывает отложенные: сохраняем
+            # последнюю отложенную и продолжаем трек от неё
+            anchor = track.pending.pop()
+            self.stats['simplified'] += len(track.pending)
+            track.anchor = anchor
+            track.pending = []
+            out.append(anchor)
+
+        too_old = (point.observed_at - track.anchor.observed_at).total_seconds() >= self.max_gap
+        if too_old or len(track.pending) >= self.max_buffer:
+            self._store(track, point, out)
+        else:
+            track.pending.append(point)
+
+    def _store(self, track: _Track, point: FlightRecord, out: List[FlightRecord]) -> None:
+        self.stats['simplified'] += len(track.pending)
+        track.anchor = point
+        track.pending = []
+        out.append(point)
+
+    def process(
+        self, records: List[FlightRecord], received_at: Optional[datetime] = None
+    ) -> List[FlightRecord]:
+        """Пропускает точки цикла через упрощение.
+
+        received_at — время получения (UTC, без зоны), подставляется в
+        записи без observed_at. Рейсы, которых нет в цикле, завершаются:
+        их отложенная точка сохраняется, состояние удаляется.
+        """
+        if received_at is None:
+            received_at = datetime.now(timezone.utc).replace(tzinfo=None)
+        out: List[FlightRecord] = []
+        seen = set()
+        for record in records:
+            if record.observed_at is None:
+                record = record._replace(observed_at=received_at)
+            key = (record.airline_icao, record.flight_icao)
+            seen.add(key)
+            self.stats['received'] += 1
+            self._add(key, record, out)
+
+        for key in [k for k in self._tracks if k not in seen]:
+            self._finish(self._tracks.pop(key), out)
+
+        self.stats['stored'] += len(out)
+        return out
+
+    def _finish(self, track: _Track, out: List[FlightRecord]) -> None:
+        if track.pending:
+            self.stats['simplified'] += len(track.pending) - 1
+            out.append(track.pending[-1])
+
+    def flush(self) -> List[FlightRecord]:
+        """Завершает все треки: отложенные точки к сохранению, состояние очищается"""
+        out: List[FlightRecord] = []
+        for track in self._tracks.values():
+            self._finish(track, out)
+        self._tracks.clear()
+        self.stats['stored'] += len(out)
+        return out
@@ -0,0 +1,216 @@
+"""Фоновая запись пакетов в БД, отвязанная от цикла опроса.
+
+Опрос (submit) только дописывает пакет в журнал на диске и кладёт его копию
+в ограниченную очередь в памяти; запись идёт в отдельном потоке. Писатель
+берёт пакеты строго по номерам журнала: из очереди, если пакет там есть,
+иначе читает с диска (очередь переполнилась, или процесс перезапускался).
+Несколько накопившихся пакетов объединяются в одну транзакцию.
+
+При недоступной БД писатель повторяет текущую транзакцию с растущей
+задержкой, а опрос продолжается в прежнем ритме: новые пакеты копятся в
+журнале. Пакет, который БД отклоняет не из-за соединения, сохраняется в
+rejected/ рядом с журналом и подтверждается, чтобы не блокировать запись.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, List, NamedTuple, Optional, Tuple
+
+import psycopg2
+
+from metrics import REGISTRY, stage
+from scraper.database import ConnectionFailed, PoolTimeout
+from scraper.ingest import FlightRecord
+from scraper.spool import Spool, encode_records
+
+logger = logging.getLogger(__name__)
+
+# Ошибки, после которых ту же транзакцию имеет смысл повторить
+RETRYABLE_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError, ConnectionFailed, PoolTimeout)
+
+QUEUE_DEPTH = REGISTRY.gauge('aviation_ingest_queue_depth', 'Пакетов в очереди записи в памяти')
+SPOOL_PENDING = REGISTRY.gauge('aviation_ingest_spool_pending', 'Незаписанных в БД пакетов в журнале')
+SPOOL_BYTES = REGISTRY.gauge('aviation_ingest_spool_bytes', 'Размер сегментов журнала')
+SPILLED = REGISTRY.counter(
+    'aviation_ingest_spilled_total', 'Пакетов, не поместившихся в очередь (будут прочитаны с диска)'
+)
+SPOOL_READS = REGISTRY.counter('aviation_ingest_spool_reads_total', 'Пакетов, прочитанных с диска')
+WRITE_RETRIES = REGISTRY.counter('aviation_ingest_write_retries_total', 'Повторов транзакции писателя')
+REJECTED = REGISTRY.counter('aviation_ingest_rejected_total', 'Пакетов, отложенных в rejected/')
+BATCH_RECORDS = REGISTRY.histogram(
+    'aviation_ingest_batch_records', 'Записей в транзакции писателя',
+    buckets=(10, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 25000)
+)
+INGEST_LAG = REGISTRY.histogram(
+    'aviation_ingest_lag_seconds', 'Время от попадания пакета в журнал до фиксации в БД',
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600, 21600)
+)
+
+
+class _Queued(NamedTuple):
+    seq: int
+    records: List[FlightRecord]
+
+
+class IngestWriter:
+    """Очередь пакетов и поток, записывающий их через write(records) -> (успешно, ошибок)"""
+
+    def __init__(
+        self,
+        spool: Spool,
+        write: Callable[[List[FlightRecord]], Tuple[int, int]],
+        max_queue: int = 8,
+        max_batch_records: int = 5000,
+        retry_base_delay: float = 1.0,
+        retry_max_delay: float = 60.0
+    ):
+        self.spool = spool
+        self.write = write
+        self.max_queue = max_queue
+        self.max_batch_records = max_batch_records
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self._queue: Deque[_Queued] = deque()
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.stats = {'batches': 0, 'saved': 0, 'failed': 0, 'rejected': 0}
+        REGISTRY.add_collector(self._collect_metrics)
+
+    def _collect_metrics(self) -> None:
+        QUEUE_DEPTH.set(len(self._queue))
+        SPOOL_PENDING.set(self.spool.pending)
+        SPOOL_BYTES.set(self.spool.size_bytes())
+
+    def submit(self, records: List[FlightRecord]) -> int:
+        """Сохраняет пакет в журнал и ставит в очередь; возвращает номер пакета"""
+        with stage('spool_append'):
+            seq = self.spool.append(records)
+        with self._cond:
+            if len(self._queue) < self.max_queue:
+                self._queue.append(_Queued(seq, records))
+            else:
+                SPILLED.inc()
+                logger.warning(
+                    f"Очередь записи заполнена ({self.max_queue}), пакет #{seq} "
+                    f"будет прочитан из журнала"
+                )
+            self._cond.notify()
+        return seq
+
+    def _take(self, seq: int) -> Optional[List[FlightRecord]]:
+        """Пакет seq из очереди; более старые пакеты из очереди выбрасываются"""
+        with self._cond:
+            while self._queue and self._queue[0].seq < seq:
+                self._queue.popleft()
+            if self._queue and self._queue[0].seq == seq:
+                return self._queue.popleft().records
+        return None
+
+    def _next_batch(self) -> Tuple[List[FlightRecord], int, float]:
+        """Записи подряд идущих неподтверждённых пакетов, номер последнего и
+        время создания самого старого"""
+        records: List[FlightRecord] = []
+        last = self.spool.acked
+        oldest = 0.0
+        while len(records) < self.max_batch_records:
+            entry = self.spool.next_pending(last)
+            if entry is None:
+                break
+            batch = self._take(entry.seq)
+            if batch is None:
+                batch = self.spool.read(entry)
+                SPOOL_READS.inc()
+            records.extend(batch)
+            oldest = oldest or entry.created_at
+            last = entry.seq
+        return records, last, oldest
+
+    def _reject(self, seq: int, records: List[FlightRecord], error: Exception) -> None:
+        rejected_dir = os.path.join(self.spool.path, 'rejected')
+        os.makedirs(rejected_dir, exist_ok=True)
+        with open(os.path.join(rejected_dir, f"{seq:012d}.json"), 'wb') as f:
+            f.write(encode_records(records))
+        REJECTED.inc()
+        self.stats['rejected'] += 1
+        logger.error(
+            f"Пакеты до #{seq} отклонены ({str(error)}), {len(records)} записей "
+            f"сохранены в {rejected_dir}"
+        )
+
+    def _retry_delay(self, attempt: int, error: Exception) -> float:
+        delay = min(self.retry_max_delay, self.retry_base_delay * (2 ** (attempt - 1)))
+        WRITE_RETRIES.inc()
+        logger.warning(
+            f"БД недоступна (попытка {attempt}), повтор через {delay:.0f} с; "
+            f"в журнале {self.spool.pending} пакетов: {str(error)}"
+        )
+        return delay
+
+    def _complete(self, records: List[FlightRecord], oldest: float, saved: int, failed: int) -> None:
+        BATCH_RECORDS.observe(len(records))
+        INGEST_LAG.observe(max(0.0, time.time() - oldest))
+        self.stats['batches'] += 1
+        self.stats['saved'] += saved
+        self.stats['failed'] += failed
+
+    def flush_once(self) -> bool:
+        """Записывает одну транзакцию; False, если писать нечего"""
+        records, last, oldest = self._next_batch()
+        if last == self.spool.acked:
+            return False
+
+        attempt = 0
+        while True:
+            try:
+                with stage('writer.write'):
+                    saved, failed = self.write(records) if records else (0, 0)
+                break
+            except RETRYABLE_ERRORS as e:
+                if self._stop.is_set():
+                    # Пакеты остаются в журнале и будут записаны после перезапуска
+                    raise
+                attempt += 1
+                self._stop.wait(self._retry_delay(attempt, e))
+            except Exception as e:
+                self._reject(last, records, e)
+                saved, failed = 0, len(records)
+                break
+
+        self.spool.ack(last)
+        self._complete(records, oldest, saved, failed)
+        return True
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                if self.flush_once():
+                    continue
+            except RETRYABLE_ERRORS:
+                break
+            except Exception as e:
+                logger.error(f"Ошибка писателя: {str(e)}", exc_info=True)
+                self._stop.wait(self.retry_base_delay)
+                continue
+            with self._cond:
+                if not self._queue and not self._stop.is_set():
+                    self._cond.wait(timeout=1.0)
+
+    def start(self) -> 'IngestWriter':
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='ingest-writer', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Останавливает писателя; незаписанные пакеты остаются в журнале"""
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self.spool.close()